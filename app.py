@@ -2,12 +2,23 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-import PyPDF2
-import tempfile
 import time
-from typing import List, Dict, Tuple
+from typing import Callable, List, Dict, Tuple
 from datetime import datetime
 
+from pdf_extraction import PdfExtractionEngine, assemble_text, open_page_provider
+from fingerprint import get_fingerprint_service
+from context_packer import pack_documents
+from response_cache import caching_enabled, get_response_cache, make_response_key
+from prompt_templates import get_prompt_registry
+from token_budget import ContextBudgeter
+from rate_limiter import get_rate_limiter
+from resilience import CircuitOpenError, DeadlineExceeded, ResilientExecutor
+from scheduler import PRIORITY_INTERACTIVE, PRIORITY_NORMAL
+from streaming import StreamInterrupted, stream_text, streaming_enabled
+from model_clients import HEALTH_INVALID, get_client_pool
+from key_pool import ApiKeyPool
+
 # Load environment variables
 load_dotenv()
 
@@ -19,8 +30,15 @@ class SmartDocAnalyzer:
         self.api_key = api_key or os.getenv("GEMINI_API_KEY") or st.session_state.get("api_key", "")
         self.is_configured = False
         self.model = None
-        self.last_request_time = 0
-        self.rate_limit_delay = 6  
+        self.rate_limiter = get_rate_limiter()
+        self.client_pool = get_client_pool()
+        self.key_pool = None
+        self.model_name = 'gemini-1.5-flash'
+        # Characters of document content per request: a 2,000-token request, from local token estimates
+        self.context_budget = ContextBudgeter(self.model_name).plan(max_input_tokens=2000)['document_chars']
+        self.response_cache = get_response_cache()
+        self.prompts = get_prompt_registry(basic=True)
+        self.extraction_engine = PdfExtractionEngine()
 
         if self.api_key:
             self.setup_api()
@@ -31,20 +49,17 @@ class SmartDocAnalyzer:
             # Configure API key
             genai.configure(api_key=self.api_key)
 
-            # Initialize model - CORRECT METHOD
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            # Shared model for this key; validated with a metadata call, not a generation
+            self.key_pool = ApiKeyPool([self.api_key], self.model_name, self.rate_limiter, self.client_pool)
+            self.model = self.key_pool.model(self.api_key)
+            health = self.client_pool.validate(self.api_key, self.model_name)
 
-            # Test connection
-            with st.spinner("🔧 Testing API connection..."):
-                test_response = self.model.generate_content("Hello, this is a test.")
+            if health['state'] == HEALTH_INVALID:
+                raise ValueError(f"Invalid API key: {health['last_error']}")
 
-                if test_response and test_response.text:
-                    self.is_configured = True
-                    st.success("✅ Gemini API configured successfully!")
-                    return True
-                else:
-                    st.error("❌ API test failed - no response received")
-                    return False
+            self.is_configured = True
+            st.success("✅ Gemini API configured successfully!")
+            return True
 
         except Exception as e:
             error_msg = str(e)
@@ -64,17 +79,10 @@ class SmartDocAnalyzer:
 
             return False
 
-    def rate_limit_protection(self):
-        """Implement rate limiting for free tier"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-
-        if time_since_last < self.rate_limit_delay:
-            wait_time = self.rate_limit_delay - time_since_last
-            with st.spinner(f"⏳ Rate limiting: waiting {wait_time:.1f}s..."):
-                time.sleep(wait_time)
-
-        self.last_request_time = time.time()
+    def rate_limit_protection(self, wait_time: float):
+        """Wait out a rate-limit delay for this model's slot in the shared quota"""
+        with st.spinner(f"⏳ Rate limiting: waiting {wait_time:.1f}s..."):
+            time.sleep(wait_time)
 
     def validate_pdf_file(self, uploaded_file) -> Tuple[bool, str]:
         """Validate uploaded PDF file"""
@@ -89,47 +97,31 @@ class SmartDocAnalyzer:
 
         return True, ""
 
-    def extract_text_from_pdf(self, uploaded_file) -> Tuple[str, dict]:
-        """Extract text from PDF with metadata"""
+    def extract_text_from_pdf(self, uploaded_file, page_window: Tuple[int, int] = (0, 5)) -> Tuple[str, dict]:
+        """Extract text from a zero-based [start, end) page window of a PDF, with metadata"""
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                uploaded_file.seek(0)
-                tmp_file.write(uploaded_file.read())
-                tmp_file_path = tmp_file.name
-
-            # Extract text and metadata
-            text = ""
+            # Pages are extracted on demand and memoized per document fingerprint
             metadata = {}
 
-            with open(tmp_file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-
-                # Get metadata
-                metadata['total_pages'] = len(pdf_reader.pages)
-                if pdf_reader.metadata:
-                    metadata['title'] = pdf_reader.metadata.get('/Title', 'Unknown')
-                    metadata['author'] = pdf_reader.metadata.get('/Author', 'Unknown')
+            file_sha256 = get_fingerprint_service().sha256(uploaded_file)
+            provider = open_page_provider(uploaded_file, file_sha256, self.extraction_engine)
+            pdf_reader = provider.reader
 
-                # Extract text (limit to first 5 pages for free tier)
-                max_pages = min(5, len(pdf_reader.pages))
-                metadata['processed_pages'] = max_pages
+            # Get metadata
+            metadata['total_pages'] = provider.total_pages
+            if pdf_reader.metadata:
+                metadata['title'] = pdf_reader.metadata.get('/Title', 'Unknown')
+                metadata['author'] = pdf_reader.metadata.get('/Author', 'Unknown')
 
-                for page_num in range(max_pages):
-                    page = pdf_reader.pages[page_num]
-                    page_text = page.extract_text()
+            # Extract text (only the selected window)
+            start, end = provider.clamp(*page_window)
+            metadata['page_window'] = [start + 1, end]
+            metadata['processed_pages'] = end - start
 
-                    if page_text.strip():
-                        text += f"\n\n--- Page {page_num + 1} ---\n"
-                        text += page_text.strip()
-
-            # Clean up temporary file
-            os.unlink(tmp_file_path)
-
-            # Limit text length for API efficiency
-            if len(text) > 8000:
-                text = text[:8000] + "\n\n[Content truncated for free tier optimization...]"
+            pages = provider.pages(start, end)
+            text, _ = assemble_text(pages, header="\n\n--- Page {} ---\n")
 
+            # Full window is kept; each request packs what fits self.context_budget
             metadata['text_length'] = len(text)
             metadata['extraction_time'] = datetime.now().isoformat()
 
@@ -139,86 +131,63 @@ class SmartDocAnalyzer:
             st.error(f"❌ Error extracting text from PDF: {str(e)}")
             return "", {}
 
-    def analyze_document(self, text: str, analysis_type: str = "summary", custom_query: str = "") -> str:
-        """Analyze document text using Gemini Pro"""
+    def analyze_document(self, text: str, analysis_type: str = "summary", custom_query: str = "",
+                         on_partial: Callable[[str], None] = None, priority: str = PRIORITY_NORMAL) -> str:
+        """Analyze document text using Gemini Pro
+
+        With `on_partial` (and streaming enabled) the response is streamed and
+        reported as it grows; the full text is returned. `priority` orders the
+        call against other queued requests.
+        """
         if not self.is_configured or not self.model:
             return "❌ API not configured. Please check your API key."
 
         if not text or len(text.strip()) < 10:
             return "❌ No valid text content found in the document."
 
-        # Apply rate limiting
-        self.rate_limit_protection()
-
         try:
-            # Define analysis prompts
-            prompts = {
-                "summary": f"""
-                Provide a concise summary of this document in 200 words or less:
-
-                {text}
-
-                Include:
-                - Main topic/purpose
-                - Key findings or points
-                - Important conclusions
-                """,
-
-                "comprehensive": f"""
-                Analyze this document thoroughly and provide:
-
-                1. **Executive Summary** (2-3 sentences)
-                2. **Key Topics & Themes**
-                3. **Important Facts & Figures**
-                4. **Main Arguments/Conclusions**
-                5. **Recommendations** (if applicable)
-
-                Document:
-                {text}
-                """,
-
-                "insights": f"""
-                Extract the key insights from this document:
-
-                • What are the 5 most important findings?
-                • What trends or patterns are identified?
-                • What are the implications?
-                • What recommendations are made?
-
-                Document:
-                {text}
-                """,
-
-                "custom": f"""
-                Based on this document, answer the following question:
-
-                **Question:** {custom_query}
-
-                **Document:**
-                {text}
-
-                **Instructions:** Provide a detailed answer with supporting evidence from the document.
-                """
-            }
-
-            # Select appropriate prompt
-            if analysis_type == "custom" and custom_query:
-                prompt = prompts["custom"]
+            # Only the selected mode's prompt is built; the document leads every prompt
+            prompt = self.prompts.render(analysis_type, text, custom_query)
+
+            # Reuse an earlier answer to the identical prompt
+            cache_key = make_response_key(self.model_name, analysis_type, prompt)
+            cached = self.response_cache.get(cache_key) if caching_enabled() else None
+            if cached is not None:
+                return cached
+
+            stream = on_partial is not None and streaming_enabled()
+
+            def call(timeout, api_key):
+                model = self.key_pool.model(api_key)
+                if stream:
+                    return stream_text(model, prompt, on_partial, timeout)
+                response = model.generate_content(prompt, request_options={'timeout': timeout})
+                return response.text if response else ""
+
+            # Rate-limited API call with retries on transient errors
+            executor = ResilientExecutor(self.model_name, self.key_pool, self.rate_limiter)
+            if stream:
+                result = executor.run(call, wait=self.rate_limit_protection, priority=priority)
             else:
-                prompt = prompts.get(analysis_type, prompts["summary"])
-
-            # Make API call
-            with st.spinner("🤖 Analyzing document with Gemini..."):
-                response = self.model.generate_content(prompt)
+                with st.spinner("🤖 Analyzing document with Gemini..."):
+                    result = executor.run(call, wait=self.rate_limit_protection, priority=priority)
 
-                if response and response.text:
-                    return response.text
-                else:
-                    return "❌ No response generated. Please try again."
+            if result:
+                if caching_enabled():
+                    self.response_cache.put(cache_key, result, self.model_name, analysis_type)
+                return result
+            else:
+                return "❌ No response generated. Please try again."
 
         except Exception as e:
             error_msg = str(e)
-            if "quota" in error_msg.lower() or "429" in error_msg:
+            if isinstance(e, StreamInterrupted):
+                return f"{e.partial_text}\n\n❌ Response interrupted: {type(e.error).__name__}"
+            elif isinstance(e, CircuitOpenError):
+                return f"🚫 Gemini is currently failing. Please try again in {e.retry_in:.0f}s."
+            elif isinstance(e, DeadlineExceeded):
+                return "❌ Analysis timed out. Please try again."
+            elif "quota" in error_msg.lower() or "429" in error_msg:
                 return "🚫 Free tier quota exceeded. Please try again tomorrow."
             elif "invalid" in error_msg.lower():
                 return "🔑 Invalid API key. Please check your configuration."
@@ -299,13 +268,19 @@ def main():
         st.session_state.analysis_type = analysis_type
         st.session_state.custom_query = custom_query
 
+        start_page = st.number_input(
+            "Start at page", min_value=1, value=1, step=1,
+            help="Analyze a 5-page window starting here"
+        )
+        st.session_state.page_window = (int(start_page) - 1, int(start_page) + 4)
+
         st.markdown("---")
         st.header("🆓 Free Tier Info")
         st.info("""
         **Daily Limits:**
         • 250 requests per day
-        • First 5 pages of PDF
-        • 8,000 character limit
+        • 5-page window per PDF
+        • 8,000 characters of best-matching content
         • 10 requests per minute
         """)
 
@@ -329,7 +304,7 @@ def main():
     uploaded_file = st.file_uploader(
         "Upload PDF Document",
         type=['pdf'],
-        help="Upload a PDF document for analysis (max 10MB, first 5 pages)"
+        help="Upload a PDF document for analysis (max 10MB, 5-page window)"
     )
 
     if uploaded_file:
@@ -352,7 +327,9 @@ def main():
 
             # Extract text
             with st.spinner("📖 Extracting text from PDF..."):
-                text, metadata = analyzer.extract_text_from_pdf(uploaded_file)
+                text, metadata = analyzer.extract_text_from_pdf(
+                    uploaded_file, st.session_state.get('page_window', (0, 5))
+                )
 
             if not text:
                 st.error("❌ Could not extract text from the PDF")
@@ -361,8 +338,9 @@ def main():
             # Show extraction info
             st.success(f"✅ Extracted text from {metadata.get('processed_pages', 'unknown')} pages")
 
-            if metadata.get('total_pages', 0) > 5:
-                st.warning(f"⚠️ PDF has {metadata['total_pages']} pages, analyzed first 5 (free tier limit)")
+            if metadata.get('total_pages', 0) > metadata.get('processed_pages', 0):
+                first_page, last_page = metadata['page_window']
+                st.warning(f"⚠️ PDF has {metadata['total_pages']} pages, analyzed pages {first_page}-{last_page}")
 
             # Show metadata
             with st.expander("📋 Document Information"):
@@ -374,11 +352,21 @@ def main():
             analysis_type = st.session_state.get('analysis_type', 'summary')
             custom_query = st.session_state.get('custom_query', '')
 
-            result = analyzer.analyze_document(text, analysis_type, custom_query)
-            st.write(result)
+            packed = pack_documents(
+                [("document", uploaded_file.name, text)],
+                question=custom_query if analysis_type == "custom" else None,
+                budget=analyzer.context_budget
+            )
+            result_area = st.empty()
+            result = analyzer.analyze_document(
+                packed['text'], analysis_type, custom_query,
+                on_partial=lambda partial: result_area.markdown(partial + " ▌")
+            )
+            result_area.markdown(result)
 
             # Store results for potential chat
             st.session_state.document_text = text
+            st.session_state.document_name = uploaded_file.name
             st.session_state.analysis_complete = True
 
     # Simple chat interface
@@ -392,13 +380,22 @@ def main():
         )
 
         if st.button("🔍 Ask") and follow_up_question:
+            # Send the passages that best match the question
+            packed = pack_documents(
+                [("document", st.session_state.get('document_name', 'document'), st.session_state.document_text)],
+                question=follow_up_question,
+                budget=analyzer.context_budget
+            )
+            st.write("**Answer:**")
+            answer_area = st.empty()
             answer = analyzer.analyze_document(
-                st.session_state.document_text, 
+                packed['text'], 
                 "custom", 
-                follow_up_question
+                follow_up_question,
+                on_partial=lambda partial: answer_area.markdown(partial + " ▌"),
+                priority=PRIORITY_INTERACTIVE
             )
-            st.write("**Answer:**")
-            st.write(answer)
+            answer_area.markdown(answer)
 
     # Footer
     st.markdown("---")
@@ -1,14 +1,35 @@
 import streamlit as st
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-import PyPDF2
-import tempfile
-import hashlib
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 import json
 import time
+import asyncio
+from functools import partial
+
+from config import Config
+from pdf_extraction import PdfExtractionEngine, assemble_text, open_page_provider
+from extraction_cache import get_extraction_cache, make_cache_key
+from ingestion import peak_rss_kb, current_rss_kb
+from fingerprint import get_fingerprint_service
+from embeddings import create_embedder
+from retrieval import DocumentRetriever
+from context_packer import context_budget, pack_context, pack_documents
+from response_cache import caching_enabled, get_response_cache, make_response_key
+from semantic_cache import SemanticCache, document_set_key
+from batch_engine import BatchAnalysisEngine
+from prompt_templates import get_prompt_registry
+from summarization import MapReduceSummarizer
+from summary_tree import SummaryTreeBuilder, get_summary_tree_store, make_tree_key, tree_context
+from rate_limiter import get_rate_limiter
+from resilience import CircuitOpenError, DeadlineExceeded, ResilientExecutor, error_status
+from scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL
+from streaming import StreamInterrupted, stream_text, streaming_enabled
+from context_cache import ContextCacheUnavailable, get_context_cache, is_missing_context_error, min_cache_tokens
+from token_budget import ContextBudgeter, calibrate_with_model, get_token_estimator
+from model_clients import HEALTH_DEGRADED, HEALTH_INVALID, get_client_pool
+from key_pool import ApiKeyPool, NoUsableApiKey, parse_api_keys
 
 # Load environment variables
 load_dotenv()
@@ -16,33 +37,56 @@ load_dotenv()
 class SmartDocAnalyzer:
     """SmartDoc AI Agent - Document Analyzer"""
 
-    def __init__(self, api_key: str = None):
-        """Initialize the analyzer"""
-        self.api_key = api_key or os.getenv("GEMINI_API_KEY") or st.session_state.get("api_key", "")
+    def __init__(self, api_key: str = None, api_keys: List[str] = None):
+        """Initialize the analyzer
+
+        `api_key` may hold several comma-separated keys; requests are spread
+        over all of them.
+        """
+        self.api_keys = api_keys or parse_api_keys(
+            api_key or Config.GEMINI_API_KEYS or os.getenv("GEMINI_API_KEY") or st.session_state.get("api_key", "")
+        )
+        self.api_key = self.api_keys[0] if self.api_keys else ""
         self.is_configured = False
         self.model = None
-        self.last_request_time = 0
-        self.rate_limit_delay = 6  # Free tier rate limiting
+        self.rate_limiter = get_rate_limiter()
+        self.client_pool = get_client_pool()
+        self.model_name = 'gemini-1.5-flash'
+        self.key_pool = ApiKeyPool(self.api_keys, self.model_name, self.rate_limiter, self.client_pool)
+        self.response_cache = get_response_cache()
+        self.summary_trees = get_summary_tree_store()
+        self.prompts = get_prompt_registry()
+        self.context_cache = get_context_cache()
+        self.token_estimator = get_token_estimator()
+        self.budgeter = ContextBudgeter(self.model_name, self.token_estimator)
+        self.extraction_engine = PdfExtractionEngine()
+        self.extraction_cache = get_extraction_cache()
+        self.fingerprints = get_fingerprint_service()
 
         if self.api_key:
             self.setup_api()
 
     def setup_api(self):
-        """Setup Gemini API with comprehensive error handling"""
+        """Attach the shared models for the API keys (no generation request is made)"""
         try:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            # Cheap metadata check per key, shared by every session using it
+            healths = [self.client_pool.validate(key, self.model_name) for key in self.api_keys]
+            usable = [key for key, health in zip(self.api_keys, healths) if health['state'] != HEALTH_INVALID]
+            if not usable:
+                self.handle_api_error(Exception(f"Invalid API key: {healths[0]['last_error']}"))
+                return False
 
-            # Test connection with detailed feedback
-            test_response = self.model.generate_content("Test connection")
+            self.model = self.key_pool.model(usable[0])
 
-            if test_response and test_response.text:
-                self.is_configured = True
-                st.success("✅ Gemini API configured successfully!")
-                return True
+            self.is_configured = True
+            degraded = [health for health in healths if health['state'] == HEALTH_DEGRADED]
+            if degraded:
+                st.warning(f"⚠️ Could not verify the API key ({degraded[0]['last_error']}); requests will still be tried.")
+            elif len(self.api_keys) > 1:
+                st.success(f"✅ Gemini API configured successfully! ({len(usable)}/{len(self.api_keys)} keys usable)")
             else:
-                st.error("❌ API test failed")
-                return False
+                st.success("✅ Gemini API configured successfully!")
+            return True
 
         except Exception as e:
             self.handle_api_error(e)
@@ -66,20 +110,10 @@ class SmartDocAnalyzer:
         else:
             st.error(f"❌ **API Error**: {error_msg}")
 
-    def rate_limit_protection(self):
-        """Smart rate limiting for free tier"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-
-        if time_since_last < self.rate_limit_delay:
-            wait_time = self.rate_limit_delay - time_since_last
-            progress_bar = st.progress(0)
-            for i in range(int(wait_time * 10)):
-                progress_bar.progress((i + 1) / (wait_time * 10))
-                time.sleep(0.1)
-            progress_bar.empty()
-
-        self.last_request_time = time.time()
+    def rate_limit_protection(self, wait_time: float):
+        """Wait out a rate-limit delay for this model's slot in the shared quota"""
+        with st.spinner(f"⏳ Rate limiting: waiting {wait_time:.1f}s..."):
+            time.sleep(wait_time)
 
     def validate_pdf_file(self, uploaded_file) -> Tuple[bool, str]:
         """PDF validation"""
@@ -106,236 +140,456 @@ class SmartDocAnalyzer:
         else:
             return f"{size_bytes / (1024 ** 2):.1f} MB"
 
-    def extract_text_from_pdf(self, uploaded_file) -> Tuple[str, dict]:
-        """PDF text extraction with detailed metadata"""
+    def extract_text_from_pdf(self, uploaded_file, page_window: Tuple[int, int] = None) -> Tuple[str, dict]:
+        """PDF text extraction with detailed metadata
+
+        `page_window` is a zero-based [start, end) page range; only those pages are extracted.
+        """
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                uploaded_file.seek(0)
-                tmp_file.write(uploaded_file.read())
-                tmp_file_path = tmp_file.name
+            rss_before = current_rss_kb()
+
+            if page_window is None:
+                page_window = (0, Config.FREE_TIER_LIMITS['max_pages_per_document'])
+            file_sha256 = self.fingerprints.sha256(uploaded_file)
+
+            # Identical bytes + settings were extracted before: skip PyPDF2 entirely
+            cache_key = make_cache_key(file_sha256, {
+                'page_window': list(page_window)
+            })
+            cached = self.extraction_cache.get(cache_key)
+            if cached:
+                text, metadata = cached
+                metadata.update({
+                    'file_name': uploaded_file.name,
+                    'cache_hit': True
+                })
+                return text, metadata
 
-            text = ""
             metadata = {
                 'file_name': uploaded_file.name,
                 'file_size': uploaded_file.size,
                 'extraction_time': datetime.now().isoformat(),
-                'file_hash': hashlib.md5(uploaded_file.getvalue()).hexdigest()[:8]
+                'file_hash': file_sha256[:8],
+                'sha256': file_sha256
             }
 
-            with open(tmp_file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-
-                # Extract metadata
-                metadata['total_pages'] = len(pdf_reader.pages)
-
-                if pdf_reader.metadata:
-                    metadata.update({
-                        'title': pdf_reader.metadata.get('/Title', 'Unknown'),
-                        'author': pdf_reader.metadata.get('/Author', 'Unknown'),
-                        'subject': pdf_reader.metadata.get('/Subject', 'Unknown'),
-                        'creator': pdf_reader.metadata.get('/Creator', 'Unknown'),
-                        'creation_date': str(pdf_reader.metadata.get('/CreationDate', 'Unknown'))
-                    })
-
-                # Extract text (enhanced with page tracking)
-                max_pages = min(5, len(pdf_reader.pages))  # Free tier limit
-                metadata['processed_pages'] = max_pages
-                pages_with_content = 0
-
-                for page_num in range(max_pages):
-                    try:
-                        page = pdf_reader.pages[page_num]
-                        page_text = page.extract_text()
-
-                        if page_text.strip():
-                            text += f"\n\n=== PAGE {page_num + 1} ===\n"
-                            text += page_text.strip()
-                            pages_with_content += 1
-                    except Exception as page_error:
-                        st.warning(f"⚠️ Could not extract text from page {page_num + 1}: {str(page_error)}")
-
-                metadata['pages_with_content'] = pages_with_content
-
-            # Clean up
-            os.unlink(tmp_file_path)
-
-            # Text processing
-            if len(text) > 12000:  
-                text = text[:12000] + "\n\n[Content truncated for API optimization...]"
-                metadata['content_truncated'] = True
-            else:
-                metadata['content_truncated'] = False
-
+            provider = open_page_provider(uploaded_file, file_sha256, self.extraction_engine)
+            pdf_reader = provider.reader
+
+            # Extract metadata
+            metadata['total_pages'] = provider.total_pages
+
+            if pdf_reader.metadata:
+                metadata.update({
+                    'title': pdf_reader.metadata.get('/Title', 'Unknown'),
+                    'author': pdf_reader.metadata.get('/Author', 'Unknown'),
+                    'subject': pdf_reader.metadata.get('/Subject', 'Unknown'),
+                    'creator': pdf_reader.metadata.get('/Creator', 'Unknown'),
+                    'creation_date': str(pdf_reader.metadata.get('/CreationDate', 'Unknown'))
+                })
+
+            # Page tracking
+            start, end = provider.clamp(*page_window)
+            if start >= end:
+                message = (f"Pages {page_window[0] + 1}-{page_window[1]} are past the end of "
+                           f"{uploaded_file.name} ({provider.total_pages} pages)")
+                st.error(f"❌ {message}")
+                return "", {'error': message, 'total_pages': provider.total_pages}
+            metadata['page_window'] = [start + 1, end]
+            metadata['processed_pages'] = end - start
+
+            # Extract only the window (page ranges run in parallel for long windows)
+            pages = provider.pages(start, end)
+
+            page_errors = [(page_num, page_error) for page_num, _, page_error in pages if page_error]
+            for page_num, page_error in page_errors:
+                st.warning(f"⚠️ Could not extract text from page {page_num + 1}: {page_error}")
+
+            text, pages_with_content = assemble_text(pages)
+            metadata['pages_with_content'] = pages_with_content
+
+            # The full window is kept; each request packs what fits its budget
+            metadata['exceeds_request_budget'] = len(text) > context_budget()
             metadata['final_text_length'] = len(text)
             metadata['word_count'] = len(text.split())
 
+            # Partial extractions are not cached so a retry gets another chance
+            if text and not page_errors:
+                self.extraction_cache.put(cache_key, text, metadata)
+            metadata['cache_hit'] = False
+
+            process_peak = peak_rss_kb()
+            if process_peak is not None:
+                metadata['process_peak_rss_kb'] = process_peak
+            rss_after = current_rss_kb()
+            if rss_before is not None and rss_after is not None:
+                metadata['rss_kb'] = rss_after
+                metadata['rss_growth_kb'] = rss_after - rss_before
+
             return text, metadata
 
         except Exception as e:
             st.error(f"❌ PDF extraction error: {str(e)}")
             return "", {'error': str(e)}
 
+    def build_prompt(self, text: str, analysis_type: str = "comprehensive", custom_query: str = "",
+                     history: str = "") -> str:
+        """Prompt for an analysis mode (unknown modes fall back to comprehensive)"""
+        return self.prompts.render(analysis_type, text, custom_query, history)
+
     def analyze_document(self, text: str, analysis_type: str = "comprehensive", 
-                        custom_query: str = "", include_metadata: bool = True) -> str:
-        """document analysis with multiple modes"""
+                        custom_query: str = "", include_metadata: bool = True,
+                        on_partial: Callable[[str], None] = None, priority: str = PRIORITY_NORMAL,
+                        history: str = "") -> str:
+        """document analysis with multiple modes
+
+        With `on_partial` (and streaming enabled) the response is streamed and
+        `on_partial(text_so_far)` is called as it grows; the full text is returned.
+        `priority` orders the call against other queued requests.
+        """
 
-        if not self.is_configured or not self.model:
+        if not self.is_configured or not self.model or not self.key_pool.has_usable_key():
             return "❌ API not configured properly. Please check your API key."
 
         if not text or len(text.strip()) < 20:
             return "❌ Insufficient text content for analysis."
 
-        # Rate limiting
-        self.rate_limit_protection()
-
         try:
-            # prompts for different analysis types
-            prompts = {
-                "summary": f"""
-                Create a comprehensive summary of this document:
-
-                **Requirements:**
-                - Executive summary (2-3 sentences)
-                - Main topics covered
-                - Key findings or conclusions
-                - Important details or statistics
-                - Overall assessment
-
-                **Document Content:**
-                {text}
-
-                **Format:** Use clear headers and bullet points for readability.
-                """,
-
-                "comprehensive": f"""
-                Perform a thorough analysis of this document:
-
-                **Analysis Framework:**
-                1. **Document Overview** - Purpose, scope, and context
-                2. **Key Themes & Topics** - Main subjects discussed
-                3. **Critical Findings** - Important discoveries or insights
-                4. **Data & Evidence** - Statistics, facts, and supporting information
-                5. **Arguments & Positions** - Main claims and reasoning
-                6. **Implications** - What this means and why it matters
-                7. **Recommendations** - Suggested actions or next steps
-                8. **Assessment** - Overall evaluation and significance
-
-                **Document Content:**
-                {text}
-
-                **Instructions:** Provide detailed analysis under each section with specific examples from the text.
-                """,
-
-                "insights": f"""
-                Extract and analyze key insights from this document:
-
-                **Focus Areas:**
-                • **Top 5 Most Important Findings** - What are the critical discoveries?
-                • **Trends & Patterns** - What patterns emerge from the data/content?
-                • **Implications & Impact** - What are the broader consequences?
-                • **Opportunities & Challenges** - What possibilities and obstacles are identified?
-                • **Strategic Recommendations** - What actions should be taken?
-
-                **Document Content:**
-                {text}
-
-                **Format:** Use clear categories with bullet points and explanations.
-                """,
-
-                "technical": f"""
-                Provide a technical analysis of this document:
-
-                **Technical Framework:**
-                - **Methodology** - Approaches, techniques, or processes used
-                - **Technical Details** - Specifications, parameters, or technical aspects
-                - **Data Analysis** - Statistical information and data interpretation
-                - **Technical Conclusions** - Engineering, scientific, or technical findings
-                - **Implementation Notes** - Practical application considerations
-
-                **Document Content:**
-                {text}
-                """,
-
-                "custom": f"""
-                Based on the document provided, answer this specific question with detailed analysis:
-
-                **Question:** {custom_query}
-
-                **Requirements:**
-                - Provide a direct answer to the question
-                - Include supporting evidence from the document
-                - Explain the context and background
-                - Discuss implications or significance
-                - Note any limitations or caveats
-
-                **Document Content:**
-                {text}
-
-                **Instructions:** Base your answer entirely on the document content and be specific about sources.
-                """
-            }
+            prompt = self.build_prompt(text, analysis_type, custom_query, history)
+
+            # Checked locally before any call: the prompt must fit a model's context window
+            model_name = self.budgeter.select_model(self.token_estimator.estimate(prompt))
+            if model_name is None:
+                return "❌ This text is too long for the context window of every available model."
+
+            # Identical prompt for the same model and mode was answered before
+            cache_key = make_response_key(model_name, analysis_type, prompt)
+            cached = self.response_cache.get(cache_key) if caching_enabled() else None
+            result = cached
+
+            if result is None and on_partial is not None and streaming_enabled():
+                # Rendered as it arrives; the assembled text is cached like any other
+                result = self.generate(prompt, wait=self.rate_limit_protection, on_partial=on_partial,
+                                       priority=priority, model_name=model_name)
+            elif result is None:
+                # Rate-limited, retried API call; interactive questions may be hedged
+                with st.spinner(f"🤖 Performing {analysis_type} analysis..."):
+                    result = self.generate(
+                        prompt,
+                        hedge=analysis_type in Config.REQUEST_HEDGING['modes'],
+                        wait=self.rate_limit_protection,
+                        priority=priority,
+                        model_name=model_name
+                    )
+
+            if cached is None and caching_enabled():
+                self.response_cache.put(cache_key, result, model_name, analysis_type)
+
+            # Add metadata footer if requested
+            if include_metadata:
+                result += f"\n\n---\n*Analysis completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*"
+
+            return result
 
-            # Select and execute prompt
-            if analysis_type == "custom" and custom_query:
-                prompt = prompts["custom"]
+        except Exception as e:
+            return describe_analysis_error(e)
+
+    def generate(self, prompt: str, hedge: bool = False, wait: Callable[[float], None] = time.sleep,
+                 on_partial: Callable[[str], None] = None, priority: str = PRIORITY_NORMAL,
+                 context: Dict = None, model_name: str = None) -> str:
+        """Model call through the resilient executor; raises on API errors and empty responses
+
+        Safe to call from worker threads as long as `wait` and `on_partial`
+        do not touch the UI. Streamed calls (`on_partial`) are never hedged.
+        With a cached `context` handle the prompt is appended to its documents.
+        `model_name` overrides the analyzer's model (the budgeter's choice).
+        """
+        model_name = context['model_name'] if context is not None else model_name or self.model_name
+        key_pool = self.key_pool
+        if context is not None:
+            # Cached content only exists for the key that created it
+            key_pool = ApiKeyPool([context['api_key']], model_name, self.rate_limiter, self.client_pool)
+        elif model_name != self.model_name:
+            key_pool = ApiKeyPool(self.key_pool.api_keys, model_name, self.rate_limiter, self.client_pool)
+
+        def call(timeout: float, api_key: str) -> str:
+            model = key_pool.model(api_key)
+            if context is not None:
+                model = self.context_cache.model(context, model)
+            if on_partial is not None:
+                text = stream_text(model, prompt, on_partial, timeout)
             else:
-                prompt = prompts.get(analysis_type, prompts["comprehensive"])
+                response = model.generate_content(prompt, request_options={'timeout': timeout})
+                text = response.text if response else ""
+            if not text:
+                raise EmptyResponseError("❌ No response generated. The API returned an empty response.")
+            return text
+
+        executor = ResilientExecutor(model_name, key_pool, self.rate_limiter)
+        return executor.run(call, hedge=hedge and on_partial is None, wait=wait, priority=priority)
+
+    def context_handle(self, documents: List[Tuple[str, str, str]]) -> Optional[Dict]:
+        """Cached-context handle holding these documents in full, or None to send passages instead
+
+        Only document sets of at least the model's CONTEXT_CACHE['min_tokens'] are
+        cached, with the budgeter's choice of a model whose context window holds
+        them. A key that already holds the set is preferred over re-uploading it.
+        """
+        if self.context_cache is None or not self.is_configured or not documents:
+            return None
+
+        content = self.prompts.document_prefix(
+            "\n\n---\n\n".join(f"[DOCUMENT: {name}]\n{text.strip()}" for _, name, text in documents)
+        )
+        tokens = self.token_estimator.estimate(content)
+        model_name = self.budgeter.select_model(tokens)
+        if model_name is None or tokens < min_cache_tokens(model_name):
+            return None
+
+        doc_set = document_set_key([doc_id for doc_id, _, _ in documents])
+        try:
+            api_key = (self.context_cache.preferred_key(doc_set, model_name, self.key_pool.usable_keys())
+                       or self.key_pool.select())
+            return self.context_cache.handle(doc_set, content, api_key, model_name)
+        except (ContextCacheUnavailable, NoUsableApiKey):
+            return None
+
+    def ask_with_context(self, context: Dict, question: str, on_partial: Callable[[str], None] = None,
+                         priority: str = PRIORITY_INTERACTIVE, history: str = "") -> Optional[str]:
+        """Answer a question against cached documents, sending only the question (and chat history)
+
+        Returns None when the cached context is gone, so the caller can fall
+        back to sending passages; other failures become an error message.
+        """
+        instructions = (self.prompts.history_block(history)
+                        + self.prompts.resolve("custom", question).render_instructions(question))
+        try:
+            if on_partial is not None and streaming_enabled():
+                return self.generate(instructions, wait=self.rate_limit_protection, on_partial=on_partial,
+                                     priority=priority, context=context)
+            with st.spinner("🤖 Answering from the cached documents..."):
+                return self.generate(instructions, wait=self.rate_limit_protection, priority=priority, context=context)
+        except Exception as e:
+            if isinstance(e, ContextCacheUnavailable) or is_missing_context_error(e):
+                self.context_cache.invalidate(context)
+                return None
+            return describe_analysis_error(e)
+
+    async def iter_batch_analysis(self, files_data: List[Dict], analysis_type: str = "summary",
+                                  custom_query: str = ""):
+        """Analyze documents concurrently, yielding (file_name, result) as each finishes
+
+        Cached answers and files without text are yielded first; the rest run
+        through the batch engine within the model's rate limits.
+        """
+        pending = []
+        budget = self.document_budget()
+        for file_data in files_data:
+            file_name = file_data['name']
+            if not file_data.get('text', ''):
+                yield file_name, "❌ No text content available"
+                continue
+
+            context = pack_documents([packing_entry(file_data)], budget=budget)['text']
+            if not self.is_configured or not self.model or len(context.strip()) < 20:
+                yield file_name, self.analyze_document(context, analysis_type, custom_query, include_metadata=False)
+                continue
+
+            pending.append({'name': file_name, 'prompt': self.build_prompt(context, analysis_type, custom_query)})
+
+        # Every prompt is sized in one vectorized pass, before any call is made
+        jobs = []
+        token_counts = self.token_estimator.estimate_many(job['prompt'] for job in pending)
+        for job, tokens in zip(pending, token_counts):
+            model_name = self.budgeter.select_model(tokens)
+            if model_name is None:
+                yield job['name'], "❌ This text is too long for the context window of every available model."
+                continue
+
+            cache_key = make_response_key(model_name, analysis_type, job['prompt'])
+            cached = self.response_cache.get(cache_key) if caching_enabled() else None
+            if cached is not None:
+                yield job['name'], cached
+                continue
+
+            jobs.append(dict(job, cache_key=cache_key, model_name=model_name, options={'model_name': model_name}))
+
+        # Batch work yields to chat questions and single-document analyses
+        engine = BatchAnalysisEngine(partial(self.generate, priority=PRIORITY_BACKGROUND),
+                                     max_concurrency=self.batch_concurrency())
+        async for job in engine.run(jobs):
+            if job['error'] is not None:
+                yield job['name'], describe_analysis_error(job['error'])
+                continue
+
+            if caching_enabled():
+                self.response_cache.put(job['cache_key'], job['result'], job['model_name'], analysis_type)
+            yield job['name'], job['result']
+
+    def document_budget(self) -> int:
+        """Characters of document text packed for an analysis, the same in every mode
+
+        Sized for the longest mode's instructions plus a custom question of
+        TOKEN_BUDGET['query_tokens'], so a document packs to the same prompt
+        prefix whichever mode analyzes it.
+        """
+        reserved = max(self.prompts.template_tokens().values()) + Config.TOKEN_BUDGET['query_tokens']
+        return self.budgeter.plan(instruction_tokens=reserved)['document_chars']
+
+    def passage_budget(self, question: str, history: str = "") -> int:
+        """Characters of retrieved passages that fit a chat request next to its question and history"""
+        instructions = self.prompts.resolve("custom", question).render_instructions(question)
+        return context_budget(self.model_name, instructions=instructions, history=history)
+
+    def chat_history_context(self, messages: List[Dict]) -> str:
+        """Most recent chat turns that fit the history share of a request"""
+        turns = [f"{'User' if message['role'] == 'user' else 'Assistant'}: {message['content']}"
+                 for message in messages]
+        return self.budgeter.fit_history(turns)
+
+    def calibrate_tokens(self, texts: List[str]) -> bool:
+        """Fit the local token estimator to the model's tokenizer once per process"""
+        if not Config.TOKEN_BUDGET['calibrate']:
+            return self.token_estimator.calibrated
+        try:
+            model = self.key_pool.model(self.key_pool.select())
+        except NoUsableApiKey:
+            # Every key is quarantined or out of quota; the heuristic estimates stay in use
+            return self.token_estimator.calibrated
+
+        # Samples the size of a chunk, so long documents cost no more than short ones
+        samples = [text[:Config.CHUNK_SIZE * 4] for text in texts]
+        return calibrate_with_model(self.token_estimator, lambda text: model.count_tokens(text).total_tokens, samples)
+
+    def batch_concurrency(self) -> int:
+        """Model calls a batch may keep in flight"""
+        # Each usable key brings its own quota, so it can carry its own share of calls
+        return Config.FREE_TIER_LIMITS['max_concurrent_requests'] * max(1, len(self.key_pool.usable_keys()))
+
+    def summarizer(self, priority: str = PRIORITY_NORMAL) -> MapReduceSummarizer:
+        """Map-reduce summarizer over this analyzer's keys and response cache"""
+        return MapReduceSummarizer(
+            partial(self.generate, priority=priority),
+            self.model_name,
+            max_concurrency=self.batch_concurrency(),
+            cache=self.response_cache
+        )
 
-            # API call with error handling
-            with st.spinner(f"🤖 Performing {analysis_type} analysis..."):
-                response = self.model.generate_content(prompt)
+    def summary_tree(self, file_data: Dict, build: bool = False,
+                     on_progress: Callable[[str, int, int], None] = None) -> Optional[Dict]:
+        """Stored summary tree of a processed file; built first when missing and `build` is set
+
+        Raises on API errors while building.
+        """
+        doc_id, name, text = packing_entry(file_data)
+        key = make_tree_key(doc_id, self.model_name)
+        tree = self.summary_trees.get(key)
+        if tree is None and build:
+            tree = SummaryTreeBuilder(self.summarizer()).build(doc_id, name, text, on_progress)
+            self.summary_trees.put(key, tree)
+        return tree
+
+    def summarize_documents(self, documents: List[Tuple[str, str, str]],
+                            priority: str = PRIORITY_INTERACTIVE) -> Tuple[str, List[str]]:
+        """Summary of (doc_id, name, text) documents covering all of their content
+
+        Documents that do not fit one request are summarized section by
+        section and merged first (map-reduce). Returns (summary, sources).
+        """
+        budget = context_budget()
+        trees = [self.summary_trees.get(make_tree_key(doc_id, self.model_name)) for doc_id, _, _ in documents]
+        whole_chars = sum(len(text) for _, _, text in documents)
+        if whole_chars > budget and documents and all(trees):
+            # Summary trees built at ingest replace the map step
+            share = budget // len(documents)
+            notes = "\n\n---\n\n".join(
+                f"[DOCUMENT: {name}]\n{tree_context(tree, share)}" for (_, name, _), tree in zip(documents, trees)
+            )
+            summary = self.analyze_document(notes, "summary", include_metadata=False, priority=priority)
+            return summary, [name for _, name, _ in documents]
 
-                if response and response.text:
-                    result = response.text
+        if not Config.MAP_REDUCE_SUMMARY['enabled'] or not self.is_configured or not self.model:
+            packed = pack_documents(documents, budget=self.document_budget())
+            summary = self.analyze_document(packed['text'], "summary", include_metadata=False, priority=priority)
+            return summary, packed['sources']
 
-                    # Add metadata footer if requested
-                    if include_metadata:
-                        result += f"\n\n---\n*Analysis completed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*"
+        summarizer = self.summarizer()
 
-                    return result
-                else:
-                    return "❌ No response generated. The API returned an empty response."
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+
+        def on_progress(stage: str, done: int, total: int):
+            progress_bar.progress(done / total if total else 1.0)
+            step = "Summarizing sections" if stage == 'summary-map' else "Merging section summaries"
+            status_text.text(f"📝 {step} ({done}/{total})")
 
+        try:
+            notes = summarizer.reduce(documents, on_progress)
         except Exception as e:
-            error_msg = str(e)
-            if "quota" in error_msg.lower() or "429" in error_msg:
-                return "🚫 **Quota Exceeded**: Free tier daily limit reached. Try again tomorrow or upgrade to paid tier."
-            elif "invalid" in error_msg.lower():
-                return "🔑 **Invalid Request**: Please check your API key and try again."
-            elif "RESOURCE_EXHAUSTED" in error_msg:
-                return "🚫 **Resource Exhausted**: Too many requests. Please wait and try again."
-            else:
-                return f"❌ **Analysis Error**: {error_msg}"
+            return describe_analysis_error(e), []
+        finally:
+            progress_bar.empty()
+            status_text.empty()
+
+        summary = self.analyze_document(notes['text'], "summary", include_metadata=False, priority=priority)
+        return summary, [name for _, name, _ in documents]
 
-    def batch_analyze(self, files_data: List[Dict], analysis_type: str = "summary") -> Dict[str, str]:
-        """Analyze multiple documents"""
+    def batch_analyze(self, files_data: List[Dict], analysis_type: str = "summary", custom_query: str = "",
+                      on_result: Callable[[str, str], None] = None) -> Dict[str, str]:
+        """Analyze multiple documents concurrently
+
+        `on_result(file_name, result)` is called as each document finishes.
+        Returns results in the original file order.
+        """
         results = {}
         total_files = len(files_data)
 
         progress_bar = st.progress(0)
         status_text = st.empty()
+        status_text.text(f"🔍 Analyzing {total_files} documents...")
 
-        for i, file_data in enumerate(files_data):
-            file_name = file_data['name']
-            text = file_data.get('text', '')
-
-            status_text.text(f"🔍 Analyzing {file_name} ({i+1}/{total_files})")
-            progress_bar.progress((i + 1) / total_files)
-
-            if text:
-                result = self.analyze_document(text, analysis_type, include_metadata=False)
+        async def collect():
+            async for file_name, result in self.iter_batch_analysis(files_data, analysis_type, custom_query):
                 results[file_name] = result
-            else:
-                results[file_name] = "❌ No text content available"
+                progress_bar.progress(len(results) / total_files)
+                status_text.text(f"🔍 Finished {file_name} ({len(results)}/{total_files})")
+                if on_result is not None:
+                    on_result(file_name, result)
 
-            # Add delay between analyses
-            if i < total_files - 1:
-                time.sleep(2)
+        asyncio.run(collect())
 
         progress_bar.empty()
         status_text.empty()
-        return results
+        return {f['name']: results[f['name']] for f in files_data if f['name'] in results}
+
+class EmptyResponseError(Exception):
+    """The model returned no text"""
+
+def describe_analysis_error(error: Exception) -> str:
+    """User-facing message for a failed analysis call"""
+    error_msg = str(error)
+    if isinstance(error, EmptyResponseError):
+        return error_msg
+    elif isinstance(error, NoUsableApiKey):
+        return "🔑 **No Usable API Key**: Every key is invalid, rate limited or out of daily quota. Please try again later."
+    elif isinstance(error, StreamInterrupted):
+        return f"{error.partial_text}\n\n❌ **Response interrupted**: {describe_analysis_error(error.error)}"
+    elif isinstance(error, CircuitOpenError):
+        return f"🚫 **Service Unavailable**: Gemini keeps failing, so requests are paused. Try again in {error.retry_in:.0f}s."
+    elif isinstance(error, DeadlineExceeded) or error_status(error) == 'DEADLINE_EXCEEDED':
+        return "❌ **Timed Out**: No response within the request deadline. Please try again."
+    elif "quota" in error_msg.lower() or "429" in error_msg:
+        return "🚫 **Quota Exceeded**: Free tier daily limit reached. Try again tomorrow or upgrade to paid tier."
+    elif "invalid" in error_msg.lower():
+        return "🔑 **Invalid Request**: Please check your API key and try again."
+    elif "RESOURCE_EXHAUSTED" in error_msg:
+        return "🚫 **Resource Exhausted**: Too many requests. Please wait and try again."
+    else:
+        return f"❌ **Analysis Error**: {error_msg}"
+
+def packing_entry(file_data: Dict) -> Tuple[str, str, str]:
+    """(doc_id, name, text) of a processed file for the context packer"""
+    return file_data.get('doc_id', file_data['name']), file_data['name'], file_data['text']
 
 def create_sidebar():
     """sidebar with more options"""
@@ -348,7 +602,7 @@ def create_sidebar():
             type="password",
             value=st.session_state.get("api_key", ""),
             placeholder="Enter your API key...",
-            help="Get your free API key from Google AI Studio"
+            help="Get your free API key from Google AI Studio. Separate several keys with commas to pool their quota."
         )
 
         if api_key != st.session_state.get("api_key", ""):
@@ -356,7 +610,7 @@ def create_sidebar():
 
         # API Key validation
         if api_key:
-            if len(api_key) < 20:
+            if any(len(key) < 20 for key in parse_api_keys(api_key)):
                 st.warning("⚠️ API key appears too short")
             else:
                 st.success("✅ API key format looks correct")
@@ -409,6 +663,7 @@ def create_sidebar():
 
         st.session_state.analysis_mode = analysis_mode
         st.session_state.custom_query = custom_query
+        st.caption(f"Prompt: ~{get_prompt_registry().template_tokens()[analysis_mode]} tokens of instructions + the document")
 
         # Processing Options
         st.markdown("---")
@@ -417,8 +672,23 @@ def create_sidebar():
         include_metadata = st.checkbox("Include analysis metadata", value=True)
         st.session_state.include_metadata = include_metadata
 
-        max_pages = st.slider("Max pages to process", 1, 5, 5, help="Free tier limit: 5 pages")
-        st.session_state.max_pages = max_pages
+        st.session_state.build_summary_trees = st.checkbox(
+            "Build summary trees when processing",
+            value=Config.SUMMARY_TREE['enabled'],
+            help="Summarizes each document once at ingest; later analyses of long documents send the summaries instead of the full text"
+        )
+
+        # Page window - any page range of any length document can be selected
+        window_start = st.number_input(
+            "Start at page", min_value=1, value=1, step=1,
+            help="Only the selected window of each document is extracted"
+        )
+        window_size = st.slider(
+            "Pages per window", 1, Config.PAGE_WINDOW['max_size'],
+            Config.FREE_TIER_LIMITS['max_pages_per_document'],
+            help="Larger windows send more text per analysis"
+        )
+        st.session_state.page_window = (int(window_start) - 1, int(window_start) - 1 + window_size)
 
         st.markdown("---")
 
@@ -440,16 +710,36 @@ def create_sidebar():
                 if 'analysis_count' in st.session_state:
                     st.metric("Analyses", st.session_state.analysis_count)
 
+            cache_stats = get_extraction_cache().stats()
+            st.caption(
+                f"Extraction cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+                f"{cache_stats['entries']} documents"
+            )
+
+            if st.session_state.get('semantic_cache') is not None:
+                chat_stats = st.session_state.semantic_cache.stats()
+                st.caption(
+                    f"Chat cache: {chat_stats['hits']} hits / {chat_stats['misses']} misses "
+                    f"({chat_stats['hit_rate']:.0%})"
+                )
+
+            if get_context_cache() is not None:
+                context_stats = get_context_cache().stats()
+                st.caption(
+                    f"Cached document contexts: {context_stats['entries']} live, "
+                    f"{context_stats['reused']} reused, {context_stats['refreshed']} refreshed"
+                )
+
         st.markdown("---")
 
         # Usage Info
         st.header("🆓 Free Tier Limits")
-        st.info("""
+        st.info(f"""
         **Daily Limits:**
         • 250 API requests
         • 10 requests per minute
-        • First 5 pages per PDF
-        • 12,000 characters per analysis
+        • 5-page window per PDF (adjustable)
+        • {Config.TOKEN_BUDGET['max_input_tokens']:,}-token requests: best-matching content, chat history and instructions
 
         **Features Included:**
         • All analysis modes
@@ -503,6 +793,9 @@ def main():
         with st.spinner("🔧 Initializing SmartDoc AI Agent..."):
             st.session_state.analyzer = SmartDocAnalyzer(api_key)
             st.session_state.current_key = api_key
+            # Gemini embedders are bound to the previous keys; rebuild them on next use
+            st.session_state.retriever = None
+            st.session_state.semantic_cache = None
 
     analyzer = st.session_state.analyzer
 
@@ -510,6 +803,14 @@ def main():
         st.error("❌ Failed to configure Gemini API. Please check your API key and try again.")
         return
 
+    with st.sidebar:
+        for key_status in analyzer.key_pool.status():
+            note = f" (quarantined: {key_status['quarantined']})" if key_status['quarantined'] else ""
+            st.caption(
+                f"🔑 {key_status['key']}: {key_status['state']}{note} - "
+                f"{key_status['requests_today']}/{key_status['daily_limit']} requests today"
+            )
+
     # Main interface
     st.header("📄 Document Processing")
 
@@ -536,7 +837,7 @@ def main():
                 with col2:
                     st.write(f"Size: {analyzer.format_file_size(file.size)}")
                 with col3:
-                    st.write(f"Hash: {hashlib.md5(file.getvalue()).hexdigest()[:8]}")
+                    st.write(f"Hash: {analyzer.fingerprints.short(file)}")
                 with col4:
                     if is_valid:
                         st.success("✅")
@@ -565,6 +866,8 @@ def main():
                         st.session_state.processed_files = []
                         st.session_state.chat_history = []
                         st.session_state.analysis_count = 0
+                        st.session_state.retriever = None
+                        st.session_state.semantic_cache = None
                         st.rerun()
 
             # Process documents
@@ -599,11 +902,13 @@ def process_documents(analyzer, uploaded_files):
 
         # Extract text
         with st.spinner(f"📖 Extracting text from {file.name}..."):
-            text, metadata = analyzer.extract_text_from_pdf(file)
+            text, metadata = analyzer.extract_text_from_pdf(file, st.session_state.get('page_window'))
 
         if text:
+            page_window = metadata.get('page_window', [1, metadata.get('processed_pages', 0)])
             processed_files.append({
                 'name': file.name,
+                'doc_id': f"{metadata.get('sha256', file.name)[:16]}:{page_window[0]}-{page_window[1]}",
                 'text': text,
                 'metadata': metadata,
                 'processed_at': datetime.now().isoformat()
@@ -620,6 +925,70 @@ def process_documents(analyzer, uploaded_files):
         st.session_state.processed_files.extend(processed_files)
         st.success(f"🎉 Successfully processed {len(processed_files)} documents!")
 
+        with st.spinner("🔎 Indexing documents for chat..."):
+            index_processed_files(get_retriever())
+
+        # Token budgets follow the model's own tokenizer from here on
+        analyzer.calibrate_tokens([f['text'] for f in processed_files])
+
+        if st.session_state.get('build_summary_trees'):
+            build_summary_trees(analyzer, processed_files)
+
+def build_summary_trees(analyzer, files: List[Dict]):
+    """Summarize each document into a stored chunk -> section -> document tree"""
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+
+    for file_data in files:
+        def on_progress(stage, done, total, name=file_data['name']):
+            progress_bar.progress(done / total if total else 1.0)
+            level = "sections" if stage == 'tree-leaf' else "summaries"
+            status_text.text(f"🌳 Summarizing {name}: {level} {done}/{total}")
+
+        try:
+            analyzer.summary_tree(file_data, build=True, on_progress=on_progress)
+        except Exception as e:
+            st.warning(f"⚠️ No summary tree for {file_data['name']}: {describe_analysis_error(e)}")
+
+    progress_bar.empty()
+    status_text.empty()
+
+def get_retriever() -> DocumentRetriever:
+    """Session retriever over every processed document"""
+    if st.session_state.get('retriever') is None:
+        st.session_state.retriever = DocumentRetriever(create_embedder(api_keys=st.session_state.analyzer.api_keys))
+    return st.session_state.retriever
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Session chat cache, bound to the current set of processed documents"""
+    if not Config.SEMANTIC_CACHE['enabled']:
+        return None
+
+    if st.session_state.get('semantic_cache') is None:
+        st.session_state.semantic_cache = SemanticCache(
+            create_embedder(Config.SEMANTIC_CACHE['embedder'], api_keys=st.session_state.analyzer.api_keys)
+        )
+
+    cache = st.session_state.semantic_cache
+    cache.bind(document_set_key([f.get('doc_id', f['name']) for f in st.session_state.processed_files]))
+    return cache
+
+def is_error_answer(answer: str) -> bool:
+    """analyze_document reports failures as status-emoji messages (or a partial answer plus one)"""
+    return answer.startswith(("❌", "🚫", "🔑")) or "❌ **Response interrupted**" in answer
+
+def index_processed_files(retriever: DocumentRetriever) -> bool:
+    """Make sure every processed document is in the retrieval index"""
+    try:
+        for file_data in st.session_state.processed_files:
+            doc_id = file_data.get('doc_id', file_data['name'])
+            if not retriever.has_document(doc_id):
+                retriever.index_document(doc_id, file_data['name'], file_data['text'])
+        return True
+    except Exception as e:
+        st.warning(f"⚠️ Retrieval index unavailable: {str(e)}")
+        return False
+
 def show_processed_documents(analyzer):
     """Display processed documents with analysis options"""
     st.header(f"📚 Processed Documents ({len(st.session_state.processed_files)})")
@@ -643,17 +1012,36 @@ def show_processed_documents(analyzer):
                 analysis_mode = st.session_state.get('analysis_mode', 'comprehensive')
                 custom_query = st.session_state.get('custom_query', '')
 
+                # Documents too long for one request are analyzed from their summary tree when one was built
+                budget = analyzer.document_budget()
+                header = f"[DOCUMENT: {file_data['name']}]\n"
+                tree_text = None
+                if analysis_mode in Config.SUMMARY_TREE['modes'] and len(file_data['text']) > budget:
+                    tree_text = tree_context(analyzer.summary_tree(file_data), budget - len(header))
+
+                if tree_text is not None:
+                    context = header + tree_text
+                else:
+                    context = pack_documents(
+                        [packing_entry(file_data)],
+                        question=custom_query if analysis_mode == 'custom' else None,
+                        budget=budget
+                    )['text']
+
+                st.subheader(f"Analysis Results - {file_data['name']}")
+                if tree_text is not None:
+                    st.caption(f"🌳 From the document's summary tree ({len(context):,} of {len(file_data['text']):,} characters)")
+                result_area = st.empty()
                 result = analyzer.analyze_document(
-                    file_data['text'],
+                    context,
                     analysis_mode,
                     custom_query,
-                    st.session_state.get('include_metadata', True)
+                    st.session_state.get('include_metadata', True),
+                    on_partial=lambda partial: result_area.markdown(partial + " ▌")
                 )
 
                 st.session_state.analysis_count += 1
-
-                st.subheader(f"Analysis Results - {file_data['name']}")
-                st.write(result)
+                result_area.markdown(result)
 
 def perform_batch_analysis(analyzer):
     """Perform batch analysis on all processed documents"""
@@ -661,20 +1049,24 @@ def perform_batch_analysis(analyzer):
 
     analysis_mode = st.session_state.get('analysis_mode', 'summary')
 
+    custom_query = ''
     if analysis_mode == 'custom':
         custom_query = st.session_state.get('custom_query', '')
         if not custom_query:
             st.warning("⚠️ Please enter a custom question in the sidebar for batch analysis.")
             return
 
-    results = analyzer.batch_analyze(st.session_state.processed_files, analysis_mode)
-    st.session_state.analysis_count += len(results)
-
-    for filename, result in results.items():
+    def show_result(filename, result):
+        # Rendered as soon as each document finishes
         st.subheader(f"📄 {filename}")
         st.write(result)
         st.markdown("---")
 
+    results = analyzer.batch_analyze(
+        st.session_state.processed_files, analysis_mode, custom_query, on_result=show_result
+    )
+    st.session_state.analysis_count += len(results)
+
 def show_chat_interface(analyzer):
     """Interactive chat interface for processed documents"""
     st.header("💬 Interactive Document Chat")
@@ -697,21 +1089,15 @@ def show_chat_interface(analyzer):
                 st.rerun()
     with col3:
         if st.session_state.processed_files and st.button("📋 Document Summary"):
-            # Generate summary of all documents
-            combined_text = "\n\n---DOCUMENT SEPARATOR---\n\n".join([
-                f"DOCUMENT: {f['name']}\n{f['text']}" 
-                for f in st.session_state.processed_files
-            ])
-
-            summary = analyzer.analyze_document(
-                combined_text[:8000],  # Limit for API
-                "summary",
-                include_metadata=False
+            # Summary of all documents in full; long ones are summarized in sections first
+            summary, sources = analyzer.summarize_documents(
+                [packing_entry(f) for f in st.session_state.processed_files]
             )
 
             st.session_state.chat_history.append({
                 "role": "assistant",
                 "content": f"**📋 Multi-Document Summary:**\n\n{summary}",
+                "sources": sources,
                 "timestamp": datetime.now().isoformat()
             })
             st.rerun()
@@ -725,25 +1111,87 @@ def show_chat_interface(analyzer):
             "timestamp": datetime.now().isoformat()
         })
 
-        # Get answer from first document (can be enhanced for multi-doc search)
+        # Answer from the most relevant chunks across all documents
         if st.session_state.processed_files:
-            first_doc = st.session_state.processed_files[0]
+            # Earlier turns, newest first, within the request's history share
+            history = analyzer.chat_history_context(st.session_state.chat_history[:-1])
+            # A cached answer ignores the conversation, so only questions asked without one use the cache
+            semantic_cache = get_semantic_cache() if not history else None
+            cached = None
+            if semantic_cache is not None:
+                try:
+                    cached = semantic_cache.lookup(user_question)
+                except Exception as e:
+                    st.warning(f"⚠️ Chat cache unavailable: {str(e)}")
+                    semantic_cache = None
+
+            if cached is not None:
+                # A near-identical question was already answered for these documents
+                st.session_state.chat_history.append({
+                    "role": "assistant",
+                    "content": cached['answer'],
+                    "sources": cached['sources'],
+                    "cached_from": cached['question'],
+                    "timestamp": datetime.now().isoformat()
+                })
+            else:
+                documents = [packing_entry(f) for f in st.session_state.processed_files]
+                context = analyzer.context_handle(documents)
 
-            answer = analyzer.analyze_document(
-                first_doc['text'],
-                "custom",
-                user_question,
-                include_metadata=False
-            )
+                with st.chat_message("user"):
+                    st.write(user_question)
+                with st.chat_message("assistant"):
+                    answer_area = st.empty()
+                    answer = None
+                    if context is not None:
+                        # The documents are held by the model API; only the question is sent
+                        sources = [name for _, name, _ in documents]
+                        answer = analyzer.ask_with_context(
+                            context,
+                            user_question,
+                            on_partial=lambda partial: answer_area.markdown(partial + " ▌"),
+                            history=history
+                        )
+
+                    if answer is None:
+                        retriever = get_retriever()
+                        relevant_chunks = []
+                        if index_processed_files(retriever):
+                            with st.spinner("🔎 Finding relevant passages..."):
+                                relevant_chunks = retriever.search(
+                                    user_question, k=Config.CONTEXT_PACKING['chat_candidates']
+                                )
+
+                        budget = analyzer.passage_budget(user_question, history)
+                        if relevant_chunks:
+                            packed = pack_context(relevant_chunks, budget=budget)
+                        else:
+                            # No index available - rank chunks of every document lexically
+                            packed = pack_documents(documents, question=user_question, budget=budget)
+
+                        sources = packed['sources']
+                        answer = analyzer.analyze_document(
+                            packed['text'],
+                            "custom",
+                            user_question,
+                            include_metadata=False,
+                            on_partial=lambda partial: answer_area.markdown(partial + " ▌"),
+                            priority=PRIORITY_INTERACTIVE,
+                            history=history
+                        )
 
-            st.session_state.analysis_count += 1
+                st.session_state.analysis_count += 1
 
-            # Add answer to chat
-            st.session_state.chat_history.append({
-                "role": "assistant", 
-                "content": answer,
-                "timestamp": datetime.now().isoformat()
-            })
+                if semantic_cache is not None and not is_error_answer(answer):
+                    semantic_cache.store(user_question, answer, sources=sources)
+
+                # Add answer to chat
+                st.session_state.chat_history.append({
+                    "role": "assistant", 
+                    "content": answer,
+                    "sources": sources,
+                    "timestamp": datetime.now().isoformat()
+                })
 
         st.rerun()
 
@@ -760,6 +1208,10 @@ def show_chat_interface(analyzer):
                 with st.chat_message("assistant"):
                     st.write(message["content"])
                     st.caption(f"Answered at {message['timestamp'][:19]}")
+                    if message.get("sources"):
+                        st.caption(f"Sources: {', '.join(message['sources'])}")
+                    if message.get("cached_from"):
+                        st.caption(f"♻️ Reused answer to a similar question: \"{message['cached_from']}\"")
 
 if __name__ == "__main__":
     main()
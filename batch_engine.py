@@ -0,0 +1,47 @@
+"""
+Concurrent batch analysis for SmartDoc AI Agent
+Runs independent model calls side by side, paced to the model's request quota
+"""
+import time
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from config import Config
+
+
+class BatchAnalysisEngine:
+    """Issue generate calls concurrently and yield results as they complete
+
+    At most `max_concurrency` calls are in flight. `generate(prompt) -> str`
+    is a blocking call that runs in worker threads and must take its own
+    slot from the shared rate limiter (the analyzer's resilient executor
+    does), so the batch never exceeds the model's quota. Total time is
+    therefore bounded by quota, not by the sum of call latencies. A job's
+    optional 'options' dict is passed to `generate` as keyword arguments.
+    """
+
+    def __init__(self, generate: Callable[[str], str], max_concurrency: int = None):
+        self.generate = generate
+        self.max_concurrency = max(1, max_concurrency or Config.FREE_TIER_LIMITS['max_concurrent_requests'])
+
+    async def _run_job(self, job: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                result = await asyncio.to_thread(self.generate, job['prompt'], **job.get('options', {}))
+                error = None
+            except Exception as e:
+                # One failed document must not stop the batch
+                result, error = None, e
+            return dict(job, result=result, error=error, elapsed=time.monotonic() - started)
+
+    async def run(self, jobs: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield each job dict, with 'result', 'error' and 'elapsed' added, in completion order"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [asyncio.create_task(self._run_job(job, semaphore)) for job in jobs]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,150 @@
+"""
+Streaming document chunker for SmartDoc AI Agent
+Implements Config.CHUNK_SIZE / CHUNK_OVERLAP with sentence- and page-boundary awareness
+"""
+import re
+import hashlib
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+from config import Config
+
+# Sentence ends: terminal punctuation (plus closing quotes/brackets) followed by whitespace, or a blank line
+_SENTENCE_END = re.compile(r'(?<=[.!?])["\')\]]*\s+|\n\s*\n')
+_PAGE_HEADER = re.compile(r'\n*(?:=== PAGE (\d+) ===|--- Page (\d+) ---)\n')
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used when no calibrated estimator is supplied"""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def iter_pages_from_text(text: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, page_text) from text assembled with page headers
+
+    Page numbers are one-based, as in the headers. Text before the first
+    header (or text without headers) is reported as page 1.
+    """
+    position = 0
+    page_num = 1
+    for match in _PAGE_HEADER.finditer(text):
+        if match.start() > position and text[position:match.start()].strip():
+            yield page_num, text[position:match.start()]
+        page_num = int(match.group(1) or match.group(2))
+        position = match.end()
+
+    if text[position:].strip():
+        yield page_num, text[position:]
+
+
+def _sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    position = 0
+    for match in _SENTENCE_END.finditer(text):
+        if text[position:match.end()].strip():
+            yield position, match.end()
+        position = match.end()
+
+    if text[position:].strip():
+        yield position, len(text)
+
+
+def _bounded_spans(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> Iterator[Tuple[int, int]]:
+    """Sentence spans, with sentences longer than a chunk split at word boundaries"""
+    for start, end in _sentence_spans(text):
+        if count_tokens(text[start:end]) <= max_tokens:
+            yield start, end
+            continue
+
+        piece_start = start
+        for word in re.finditer(r'\S+\s*', text[start:end]):
+            word_end = start + word.end()
+            if count_tokens(text[piece_start:word_end]) > max_tokens and word.start() > 0:
+                yield piece_start, start + word.start()
+                piece_start = start + word.start()
+        if piece_start < end:
+            yield piece_start, end
+
+
+def make_chunk_id(doc_id: str, index: int, text: str) -> str:
+    """Stable chunk id: same document, position and text always give the same id"""
+    digest = hashlib.sha256(f"{doc_id}\x00{text}".encode('utf-8')).hexdigest()[:10]
+    return f"{doc_id[:12]}-{index:05d}-{digest}"
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]], doc_id: str, chunk_size: int = None,
+                chunk_overlap: int = None, count_tokens: Callable[[str], int] = None,
+                page_break_fill: float = 0.5) -> Iterator[Dict[str, Any]]:
+    """Stream chunks over (page_number, page_text) pairs
+
+    Chunks hold whole sentences up to `chunk_size` tokens and start with the
+    last `chunk_overlap` tokens of the previous chunk. A chunk that is at
+    least `page_break_fill` full is closed at a page boundary rather than
+    spanning into the next page. Only the current chunk is held in memory.
+
+    Each chunk is a dict with chunk_id, doc_id, index, text, token_count,
+    page_start, page_end (one-based) and char_start / char_end (offsets
+    into the first and last page's text).
+    """
+    chunk_size = chunk_size or Config.CHUNK_SIZE
+    chunk_overlap = Config.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    chunk_overlap = min(chunk_overlap, chunk_size // 2)
+    count_tokens = count_tokens or estimate_tokens
+
+    buffer = deque()  # (page_num, char_start, char_end, text, tokens)
+    buffered_tokens = 0
+    carried_tokens = 0  # tokens in the buffer that overlap the previous chunk
+    index = 0
+
+    def emit():
+        nonlocal buffered_tokens, carried_tokens, index
+        parts = []
+        for position, piece in enumerate(buffer):
+            if position and piece[0] != buffer[position - 1][0]:
+                parts.append("\n\n")
+            parts.append(piece[3])
+        text = "".join(parts).strip()
+        first, last = buffer[0], buffer[-1]
+        chunk = {
+            'chunk_id': make_chunk_id(doc_id, index, text),
+            'doc_id': doc_id,
+            'index': index,
+            'text': text,
+            'token_count': buffered_tokens,
+            'page_start': first[0],
+            'page_end': last[0],
+            'char_start': first[1],
+            'char_end': last[2]
+        }
+        index += 1
+
+        # Carry the tail of this chunk into the next one as overlap
+        carried = 0
+        kept = deque()
+        while buffer and carried + buffer[-1][4] <= chunk_overlap:
+            piece = buffer.pop()
+            carried += piece[4]
+            kept.appendleft(piece)
+        buffer.clear()
+        buffer.extend(kept)
+        buffered_tokens = carried_tokens = carried
+        return chunk
+
+    for page_num, page_text in pages:
+        for start, end in _bounded_spans(page_text, chunk_size - chunk_overlap, count_tokens):
+            sentence = page_text[start:end]
+            tokens = count_tokens(sentence)
+
+            if buffered_tokens + tokens > chunk_size and buffered_tokens > carried_tokens:
+                yield emit()
+
+            buffer.append((page_num, start, end, sentence, tokens))
+            buffered_tokens += tokens
+
+        # Prefer closing a reasonably full chunk at the page boundary
+        if buffered_tokens > carried_tokens and buffered_tokens >= chunk_size * page_break_fill:
+            yield emit()
+
+    if buffered_tokens > carried_tokens:
+        yield emit()
@@ -3,13 +3,14 @@ Configuration settings for SmartDoc AI Agent (REVISED VERSION)
 All API configurations updated for proper Gemini API usage
 """
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 
 class Config:
     """Application configuration class - REVISED for correct Gemini API"""
 
     # API Configuration - UPDATED FOR CORRECT GEMINI API
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    GEMINI_API_KEYS = os.getenv("GEMINI_API_KEYS", "")  # optional pool: "key1,key2,..."
 
     # Available models with their specifications
     AVAILABLE_MODELS = {
@@ -33,9 +34,18 @@ class Config:
         }
     }
 
+    # Embedding models, rate limited like the generation models (not offered for analysis)
+    EMBEDDING_MODELS = {
+        'models/text-embedding-004': {
+            'rate_limit_rpm': 1500,
+            'rate_limit_rpd': 100000
+        }
+    }
+
     # Default model selection
     DEFAULT_MODEL = 'gemini-1.5-flash'  # Fast and reliable for most use cases
     GEMINI_MODEL = os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+    STREAM_RESPONSES = os.getenv("SMARTDOC_STREAM_RESPONSES", "1") != "0"  # render answers as they generate
 
     # Document Processing Configuration
     MAX_FILE_SIZE_MB = 10
@@ -43,11 +53,151 @@ class Config:
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
 
+    # Extraction Engine Configuration
+    EXTRACTION_WORKERS = int(os.getenv("SMARTDOC_EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+    EXTRACTION_MIN_PAGES_PER_WORKER = 8  # below this, a worker costs more than it saves
+    EXTRACTION_TIMEOUT_SECONDS = 120     # parallel extraction falls back to serial after this
+    INGEST_SPOOL_THRESHOLD_BYTES = 8 * 1024 * 1024  # larger uploads are spooled and memory-mapped
+    PAGE_WINDOW = {
+        'max_size': 50,
+        'max_open_documents': 16   # documents kept open for on-demand page access
+    }
+
+    # Fingerprint Configuration
+    FINGERPRINT_CONFIG = {
+        'sample_threshold_bytes': 8 * 1024 * 1024,  # larger uploads get a sample hash for display
+        'sample_block_bytes': 64 * 1024,
+        'max_entries': 512
+    }
+
+    # Cache Configuration
+    CACHE_DIR = os.getenv("SMARTDOC_CACHE_DIR", ".smartdoc_cache")
+    EXTRACTION_CACHE = {
+        'path': os.path.join(CACHE_DIR, 'extraction.sqlite3'),
+        'max_bytes': 256 * 1024 * 1024  # LRU eviction above this size
+    }
+    RESPONSE_CACHE = {
+        'path': os.path.join(CACHE_DIR, 'responses.sqlite3'),
+        'ttl_seconds': 7 * 24 * 3600,
+        'memory_entries': 256,
+        'disk_entries': 5000
+    }
+
+    # Retrieval Configuration
+    RETRIEVAL_CONFIG = {
+        'embedder': os.getenv("SMARTDOC_EMBEDDER", "gemini"),  # 'gemini' or 'local' (offline)
+        'gemini_embedding_model': 'models/text-embedding-004',
+        'gemini_embedding_dimension': 768,
+        'embedding_batch_size': 100,
+        'local_embedding_dimension': 512,  # offline hashing embedder
+        'local_ngram_range': (3, 5),        # character n-grams
+        'embedding_cache_size': 50000,      # vectors cached by chunk hash
+        'top_k': 6,            # chunks sent to the model per chat question
+        'candidate_pool': 30,  # candidates per ranking before fusion
+        'bm25_k1': 1.5,
+        'bm25_b': 0.75,
+        'rrf_k': 60            # reciprocal rank fusion constant
+    }
+
+    # Context Packing Configuration
+    CONTEXT_PACKING = {
+        'redundancy_threshold': 0.6,  # 5-word shingle Jaccard above which a chunk is a near-duplicate
+        'chat_candidates': 30         # retrieved chunks offered to the packer per question
+    }
+
+    # Semantic cache for chat questions (per session, per document set)
+    SEMANTIC_CACHE = {
+        'enabled': True,
+        'embedder': 'local',          # question embeddings: 'local' (offline) or 'gemini'
+        'threshold': 0.85,            # cosine similarity of normalized questions to reuse an answer
+        'max_entries': 200
+    }
+
+    # Shared Gemini clients (one per API key, reused by every session)
+    MODEL_CLIENT_POOL = {
+        'validation': os.getenv("SMARTDOC_KEY_VALIDATION", "metadata"),  # 'metadata' (models.get) or 'lazy'
+        'validation_ttl_seconds': 3600,
+        'invalid_recheck_seconds': 900     # keys rejected as invalid are tried again after this
+    }
+
+    # Key pool routing: requests go to the key with the most headroom
+    API_KEY_POOL = {
+        'auth_quarantine_seconds': 3600,  # key rejected (invalid / permission denied)
+        'rate_quarantine_seconds': 60     # key throttled (429 per-minute quota)
+    }
+
+    # Quota ledger shared by every server process on this host (per API key and model)
+    QUOTA_LEDGER = {
+        'enabled': os.getenv("SMARTDOC_SHARED_QUOTA", "1") != "0",
+        'path': os.getenv("SMARTDOC_QUOTA_LEDGER", os.path.join(CACHE_DIR, 'quota.sqlite3'))
+    }
+
+    # Shared request limiter (per model, from AVAILABLE_MODELS rpm/rpd)
+    RATE_LIMITER = {
+        'burst': 1,                     # requests that may go out back to back
+        'additive_increase_rpm': 0.5,   # RPM regained per successful call
+        'multiplicative_decrease': 0.5, # RPM factor applied on 429 / RESOURCE_EXHAUSTED
+        'min_rpm': 1.0
+    }
+
+    # Map-reduce summaries of documents that do not fit one request
+    MAP_REDUCE_SUMMARY = {
+        'enabled': True,
+        'section_summary_words': 250,  # length asked of each section summary
+        'fan_in': 6,                   # partial summaries merged per reduce request
+        'max_levels': 3                # merge rounds before falling back to truncation
+    }
+
+    # Summary trees built at ingest (chunk -> section -> document), kept per document fingerprint
+    SUMMARY_TREE = {
+        'enabled': os.getenv("SMARTDOC_SUMMARY_TREE", "0") == "1",   # default for the sidebar option
+        'path': os.path.join(CACHE_DIR, 'summary_trees.sqlite3'),
+        'max_bytes': 64 * 1024 * 1024,
+        'leaf_chars': 6000,        # document text summarized by each leaf
+        'fan_in': 4,               # summaries merged into each node of the next level
+        'summary_words': 200,
+        'modes': ['summary', 'comprehensive', 'insights', 'technical']
+    }
+
+    # Provider-side caching of the document set for chat ('gemini', 'local' fake, or 'off')
+    CONTEXT_CACHE = {
+        'backend': os.getenv("SMARTDOC_CONTEXT_CACHE", "off"),
+        'ttl_seconds': 1800,
+        'refresh_margin_seconds': 300,   # extend a handle's TTL when less than this remains
+        'min_tokens': {                  # provider minimum per cache model; smaller sets are sent as passages
+            'gemini-1.5-flash-002': 32768,
+            'gemini-1.5-pro-002': 32768
+        },
+        'default_min_tokens': 32768,
+        'max_entries': 20,
+        'failure_backoff_seconds': 300,  # after a failed upload, send passages for this long
+        'cache_models': {                # caching needs explicit model versions
+            'gemini-1.5-flash': 'gemini-1.5-flash-002',
+            'gemini-1.5-pro': 'gemini-1.5-pro-002'
+        }
+    }
+
+    # Priority queue in front of model calls (FREE_TIER_OPTIMIZATIONS['priority_queue'])
+    SCHEDULER = {
+        'aging_seconds': 30,   # waiting this long raises a request by one priority class
+        'poll_seconds': 1.0    # how often queued requests re-check aging and quota
+    }
+
+    # Token budget of each request, from local estimates (see token_budget.py)
+    TOKEN_BUDGET = {
+        'max_input_tokens': 3200,   # free-tier request size: document, history and instructions
+        'output_tokens': 2048,      # reserved in the context window for the answer
+        'history_share': 0.25,      # most of the input that conversation history may take
+        'query_tokens': 256,        # custom question reserved next to the document in every analysis mode
+        'calibrate': True,          # fit the estimator to the model's count_tokens on the first documents
+        'calibration_samples': 4
+    }
+
     # Free Tier Optimizations
     FREE_TIER_LIMITS = {
         'max_pages_per_document': 5,
-        'max_text_length': 12000,  # characters per analysis
-        'max_concurrent_requests': 1,
+        # Calls in flight during batch analysis; request starts are still paced by the model's RPM
+        'max_concurrent_requests': int(os.getenv("SMARTDOC_MAX_CONCURRENT_REQUESTS", "3")),
         'rate_limit_delay': 6,     # seconds between requests
         'daily_request_limit': 250,
         'monthly_request_limit': 7500
@@ -145,7 +295,9 @@ class Config:
     ERROR_RETRY_CONFIG = {
         'max_retries': 3,
         'retry_delay': 2,  # seconds
+        'max_delay': 30,   # cap on one backoff delay (seconds, before jitter)
         'exponential_backoff': True,
+        'deadline_seconds': 120,  # total time per request, retries and quota waits included
         'retry_on_errors': [
             'RESOURCE_EXHAUSTED',
             'DEADLINE_EXCEEDED',
@@ -153,6 +305,18 @@ class Config:
         ]
     }
 
+    CIRCUIT_BREAKER = {
+        'failure_threshold': 5,  # consecutive transient failures before calls fail fast
+        'reset_seconds': 30      # time before a trial call is let through
+    }
+
+    # Backup requests for slow interactive calls
+    REQUEST_HEDGING = {
+        'modes': ['custom'],   # analysis modes that may be hedged (chat questions)
+        'percentile': 95,      # send a backup after this latency percentile
+        'min_samples': 20      # latencies needed before hedging starts
+    }
+
     # Logging Configuration
     LOGGING_CONFIG = {
         'level': 'INFO',
@@ -166,6 +330,8 @@ class Config:
     def get_model_config(cls, model_name: str = None) -> Dict[str, Any]:
         """Get configuration for a specific model"""
         model_name = model_name or cls.GEMINI_MODEL
+        if model_name in cls.EMBEDDING_MODELS:
+            return cls.EMBEDDING_MODELS[model_name]
         return cls.AVAILABLE_MODELS.get(model_name, cls.AVAILABLE_MODELS[cls.DEFAULT_MODEL])
 
     @classmethod
@@ -188,7 +354,7 @@ class Config:
         """Validate configuration settings"""
         errors = []
 
-        if not cls.GEMINI_API_KEY:
+        if not cls.GEMINI_API_KEY and not cls.GEMINI_API_KEYS:
             errors.append("GEMINI_API_KEY not set")
 
         if cls.GEMINI_MODEL not in cls.AVAILABLE_MODELS:
@@ -221,6 +387,12 @@ PRODUCTION_CONFIG = {
     'show_performance_metrics': False
 }
 
+def get_environment_config() -> Dict[str, Any]:
+    """Settings for the environment named by SMARTDOC_ENV (default: production)"""
+    if os.getenv("SMARTDOC_ENV", "production").lower() == "development":
+        return DEVELOPMENT_CONFIG
+    return PRODUCTION_CONFIG
+
 # Free tier specific optimizations
 FREE_TIER_OPTIMIZATIONS = {
     'enable_caching': True,
@@ -0,0 +1,288 @@
+"""
+Provider-side context caching for SmartDoc AI Agent
+Uploads a document set to the model API once as cached content, so chat
+questions about it only send the question
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import google.ai.generativelanguage as glm
+from google.protobuf import duration_pb2, field_mask_pb2
+
+from config import Config
+from quota_ledger import api_key_id
+from model_clients import KeyBoundModel
+from resilience import error_status
+
+
+class ContextCacheUnavailable(Exception):
+    """A cached context could not be created or has expired on the provider side"""
+
+
+def min_cache_tokens(model_name: str) -> int:
+    """Smallest content the provider will cache for a model (CONTEXT_CACHE['min_tokens'])"""
+    settings = Config.CONTEXT_CACHE
+    cache_model = settings['cache_models'].get(model_name, model_name)
+    return settings['min_tokens'].get(cache_model, settings['default_min_tokens'])
+
+
+def is_missing_context_error(error: Exception) -> bool:
+    """True when the provider no longer knows a cached context"""
+    return error_status(error) == 'NOT_FOUND' or "CachedContent not found" in str(error)
+
+
+class GeminiContextBackend:
+    """Cached contents of the Gemini API, created under the key that will use them"""
+
+    def __init__(self):
+        self._clients = {}      # key_id -> CacheServiceClient
+        self._lock = threading.Lock()
+
+    def _client(self, api_key: str) -> glm.CacheServiceClient:
+        key_id = api_key_id(api_key)
+        with self._lock:
+            client = self._clients.get(key_id)
+            if client is None:
+                client = self._clients[key_id] = glm.CacheServiceClient(client_options={'api_key': api_key})
+            return client
+
+    def create(self, api_key: str, model_name: str, content: str, ttl_seconds: int) -> Dict[str, Any]:
+        model_name = Config.CONTEXT_CACHE['cache_models'].get(model_name, model_name)
+        cached = self._client(api_key).create_cached_content(cached_content=glm.CachedContent(
+            model=model_name if model_name.startswith('models/') else f"models/{model_name}",
+            display_name="smartdoc-documents",
+            contents=[glm.Content(role='user', parts=[glm.Part(text=content)])],
+            ttl=duration_pb2.Duration(seconds=int(ttl_seconds))
+        ))
+        return {'name': cached.name, 'model': cached.model, 'tokens': cached.usage_metadata.total_token_count}
+
+    def extend(self, api_key: str, name: str, ttl_seconds: int):
+        self._client(api_key).update_cached_content(
+            cached_content=glm.CachedContent(name=name, ttl=duration_pb2.Duration(seconds=int(ttl_seconds))),
+            update_mask=field_mask_pb2.FieldMask(paths=['ttl'])
+        )
+
+    def delete(self, api_key: str, name: str):
+        self._client(api_key).delete_cached_content(name=name)
+
+    def model(self, handle: Dict[str, Any], base_model: KeyBoundModel) -> KeyBoundModel:
+        # Same key-bound client as the pooled model
+        return base_model.with_cached_content(handle['name'], handle['model'])
+
+
+class _LocalContextModel:
+    """Stands in for a model bound to cached content by sending the content inline"""
+
+    def __init__(self, content: str, base_model: KeyBoundModel):
+        self.content = content
+        self.base_model = base_model
+
+    def generate_content(self, prompt: str, **kwargs):
+        return self.base_model.generate_content(self.content + prompt, **kwargs)
+
+
+class LocalContextBackend:
+    """In-process fake of the provider cache, for tests and for trying the chat flow offline
+
+    Questions still carry the documents to the model, so nothing is saved.
+    """
+
+    def __init__(self):
+        self._contents = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def create(self, api_key: str, model_name: str, content: str, ttl_seconds: int) -> Dict[str, Any]:
+        with self._lock:
+            self._counter += 1
+            name = f"cachedContents/local-{self._counter}"
+            self._contents[name] = content
+        return {'name': name, 'model': f"models/{model_name}", 'tokens': None}
+
+    def extend(self, api_key: str, name: str, ttl_seconds: int):
+        if name not in self._contents:
+            raise ContextCacheUnavailable(f"CachedContent not found: {name}")
+
+    def delete(self, api_key: str, name: str):
+        with self._lock:
+            self._contents.pop(name, None)
+
+    def model(self, handle: Dict[str, Any], base_model: KeyBoundModel) -> _LocalContextModel:
+        content = self._contents.get(handle['name'])
+        if content is None:
+            raise ContextCacheUnavailable(f"CachedContent not found: {handle['name']}")
+        return _LocalContextModel(content, base_model)
+
+
+class ContextCacheManager:
+    """Handles of cached document contexts, with TTL refresh and LRU eviction
+
+    A handle belongs to one document set, API key and model. `handle`
+    returns a live one, creating it on first use and pushing its expiry
+    out by `ttl_seconds` once less than `refresh_margin_seconds` remain.
+    Handles past `max_entries` are deleted from the provider, oldest use first.
+    A slot whose creation failed is not retried for `failure_backoff_seconds`,
+    so an unsupported key or model does not slow every question down.
+    Provider calls run outside the lock: a slot being created is reserved,
+    and other requests for it wait for that upload instead of repeating it.
+    """
+
+    def __init__(self, backend=None, ttl_seconds: int = None, refresh_margin_seconds: int = None,
+                 max_entries: int = None):
+        settings = Config.CONTEXT_CACHE
+        self.backend = backend or (LocalContextBackend() if settings['backend'] == 'local' else GeminiContextBackend())
+        self.ttl_seconds = ttl_seconds or settings['ttl_seconds']
+        self.refresh_margin_seconds = refresh_margin_seconds or settings['refresh_margin_seconds']
+        self.max_entries = max_entries or settings['max_entries']
+        self.failure_backoff_seconds = settings['failure_backoff_seconds']
+        self._handles = OrderedDict()   # (doc_set, key_id, model) -> handle
+        self._pending = {}              # slot -> Event set once its creation finishes
+        self._refreshing = set()        # slots whose TTL is being extended
+        self._failed = {}               # slot -> time before which creation is not retried
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.refreshed = 0
+        self.evicted = 0
+
+    def _live(self, slot: tuple, now: float) -> Optional[Dict[str, Any]]:
+        handle = self._handles.get(slot)
+        if handle is not None and handle['expires_at'] <= now:
+            del self._handles[slot]
+            handle = None
+        return handle
+
+    def preferred_key(self, doc_set: str, model_name: str, api_keys: List[str]) -> Optional[str]:
+        """One of `api_keys` that already holds this document set, so it is not uploaded again"""
+        now = time.time()
+        with self._lock:
+            for api_key in api_keys:
+                slot = (doc_set, api_key_id(api_key), model_name)
+                if slot in self._pending or self._live(slot, now) is not None:
+                    return api_key
+        return None
+
+    def handle(self, doc_set: str, content: str, api_key: str, model_name: str) -> Dict[str, Any]:
+        """Live handle for this content; raises ContextCacheUnavailable if it cannot be cached"""
+        slot = (doc_set, api_key_id(api_key), model_name)
+
+        while True:
+            now = time.time()
+            with self._lock:
+                handle = self._live(slot, now)
+                pending = self._pending.get(slot)
+                if handle is not None:
+                    self._handles.move_to_end(slot)
+                    if handle['expires_at'] - now >= self.refresh_margin_seconds or slot in self._refreshing:
+                        # Still live while another request extends it
+                        self.reused += 1
+                        return handle
+                    self._refreshing.add(slot)
+                elif pending is None:
+                    if self._failed.get(slot, 0) > now:
+                        raise ContextCacheUnavailable("Caching these documents failed recently")
+                    self._pending[slot] = threading.Event()
+
+            if handle is not None:
+                if self._extend(slot, handle, api_key):
+                    return handle
+                # Gone on the provider side; create it again
+                continue
+            if pending is not None:
+                pending.wait()
+                continue
+            return self._create(slot, content, api_key, model_name)
+
+    def _extend(self, slot: tuple, handle: Dict[str, Any], api_key: str) -> bool:
+        try:
+            self.backend.extend(api_key, handle['name'], self.ttl_seconds)
+        except Exception:
+            with self._lock:
+                self._refreshing.discard(slot)
+                if self._handles.get(slot) is handle:
+                    del self._handles[slot]
+            return False
+
+        with self._lock:
+            self._refreshing.discard(slot)
+            handle['expires_at'] = time.time() + self.ttl_seconds
+            self.refreshed += 1
+            self.reused += 1
+        return True
+
+    def _create(self, slot: tuple, content: str, api_key: str, model_name: str) -> Dict[str, Any]:
+        evicted = []
+        try:
+            try:
+                created = self.backend.create(api_key, model_name, content, self.ttl_seconds)
+            except Exception as e:
+                with self._lock:
+                    self._failed[slot] = time.time() + self.failure_backoff_seconds
+                raise ContextCacheUnavailable(f"Could not cache the documents: {e}") from e
+
+            now = time.time()
+            handle = dict(created, slot=slot, api_key=api_key, model_name=model_name, created_at=now,
+                          expires_at=now + self.ttl_seconds)
+            with self._lock:
+                self._failed.pop(slot, None)
+                self._handles[slot] = handle
+                self.created += 1
+                while len(self._handles) > self.max_entries:
+                    evicted.append(self._handles.popitem(last=False)[1])
+        finally:
+            with self._lock:
+                self._pending.pop(slot).set()
+
+        for oldest in evicted:
+            self._delete(oldest)
+        return handle
+
+    def _delete(self, handle: Dict[str, Any]):
+        with self._lock:
+            self.evicted += 1
+        try:
+            self.backend.delete(handle['api_key'], handle['name'])
+        except Exception:
+            # It expires on its own
+            pass
+
+    def invalidate(self, handle: Dict[str, Any]):
+        """Forget a handle (and delete it upstream) after it failed"""
+        with self._lock:
+            if self._handles.get(handle['slot']) is not handle:
+                return
+            del self._handles[handle['slot']]
+        self._delete(handle)
+
+    def model(self, handle: Dict[str, Any], base_model: KeyBoundModel):
+        """Model bound to a handle's cached content"""
+        return self.backend.model(handle, base_model)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._handles),
+                'created': self.created,
+                'reused': self.reused,
+                'refreshed': self.refreshed,
+                'evicted': self.evicted
+            }
+
+
+_shared_manager = None
+_shared_lock = threading.Lock()
+
+
+def get_context_cache() -> Optional[ContextCacheManager]:
+    """Process-wide context cache, or None when context caching is off"""
+    global _shared_manager
+
+    if Config.CONTEXT_CACHE['backend'] not in ('gemini', 'local'):
+        return None
+
+    with _shared_lock:
+        if _shared_manager is None:
+            _shared_manager = ContextCacheManager()
+        return _shared_manager
@@ -0,0 +1,161 @@
+"""
+Budgeted context assembly for SmartDoc AI Agent
+Packs the highest-value, non-redundant chunks into each request's budget instead of truncating
+"""
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from chunking import iter_chunks, iter_pages_from_text
+from retrieval import BM25Index, format_context
+from token_budget import ContextBudgeter
+
+_SECTION_SEPARATOR = "\n\n---\n\n"
+_WORD = re.compile(r'\w+')
+
+
+def context_budget(model_name: str = None, reserved_chars: int = 0, instructions: str = "", history: str = "") -> int:
+    """Characters of document context one request may carry
+
+    The token budgeter's document allowance next to `instructions` and
+    chat `history` (the free-tier request size, capped by the model's
+    context window), in characters.
+    """
+    document_chars = ContextBudgeter(model_name).plan(instructions, history)['document_chars']
+    return max(0, document_chars - reserved_chars)
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def spread_scores(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Score chunks of one document for query-less packing
+
+    Chunks are ranked in bisection order (first, middle, quarters, ...) so
+    that any budget gets even coverage of the document.
+    """
+    count = len(chunks)
+    order = []
+    seen = set()
+    step = count
+    while step >= 1 and len(order) < count:
+        for position in range(0, count, step):
+            if position not in seen:
+                seen.add(position)
+                order.append(position)
+        step //= 2
+
+    scored = [None] * count
+    for rank, position in enumerate(order):
+        scored[position] = dict(chunks[position], score=1.0 / (1 + rank))
+    return scored
+
+
+def pack_context(chunks: List[Dict[str, Any]], budget: int = None, redundancy_threshold: float = None,
+                 render: Callable[[List[Dict[str, Any]]], str] = format_context) -> Dict[str, Any]:
+    """Greedily pack scored chunks into a character budget
+
+    Chunks are taken best score first. Near-duplicates of an already
+    included chunk are skipped, and a chunk that does not fit is skipped in
+    favour of smaller lower-scored ones. Included chunks are rendered in
+    document order.
+
+    Returns a dict with the rendered 'text', the 'included' chunk ids and
+    their 'sources' labels, the ids skipped as 'redundant' or 'over_budget',
+    plus 'used_chars' and 'budget_chars'.
+    """
+    budget = context_budget() if budget is None else budget
+    if redundancy_threshold is None:
+        redundancy_threshold = Config.CONTEXT_PACKING['redundancy_threshold']
+
+    included = []
+    included_shingles = []
+    redundant = []
+    over_budget = []
+    used = 0
+
+    for chunk in sorted(chunks, key=lambda c: -c.get('score', 0.0)):
+        cost = len(render([chunk])) + (len(_SECTION_SEPARATOR) if included else 0)
+        if used + cost > budget:
+            over_budget.append(chunk['chunk_id'])
+            continue
+
+        shingles = _shingles(chunk['text'])
+        if any(_similarity(shingles, other) >= redundancy_threshold for other in included_shingles):
+            redundant.append(chunk['chunk_id'])
+            continue
+
+        included.append(chunk)
+        included_shingles.append(shingles)
+        used += cost
+
+    document_order = {}
+    for chunk in chunks:
+        document_order.setdefault(chunk['doc_id'], len(document_order))
+    included.sort(key=lambda c: (document_order[c['doc_id']], c['index']))
+
+    text = render(included)
+    return {
+        'text': text,
+        'included': [chunk['chunk_id'] for chunk in included],
+        'sources': [_source_label(chunk) for chunk in included],
+        'redundant': redundant,
+        'over_budget': over_budget,
+        'used_chars': len(text),
+        'budget_chars': budget
+    }
+
+
+def _source_label(chunk: Dict[str, Any]) -> str:
+    pages = str(chunk['page_start'])
+    if chunk['page_end'] != chunk['page_start']:
+        pages += f"-{chunk['page_end']}"
+    return f"{chunk.get('doc_name', chunk['doc_id'])} p.{pages}"
+
+
+def pack_documents(documents: List[Tuple[str, str, str]], question: Optional[str] = None,
+                   budget: int = None) -> Dict[str, Any]:
+    """Build context for one or more (doc_id, name, text) documents
+
+    Documents that fit the budget whole are sent whole. Otherwise every
+    document is chunked and the chunks are scored by BM25 against the
+    question, or spread evenly across each document when there is none.
+    """
+    budget = context_budget() if budget is None else budget
+
+    chunks = []
+    for doc_id, name, text in documents:
+        doc_chunks = [dict(chunk, doc_name=name) for chunk in iter_chunks(iter_pages_from_text(text), doc_id)]
+        chunks.extend(spread_scores(doc_chunks))
+
+    whole = _SECTION_SEPARATOR.join(f"[DOCUMENT: {name}]\n{text.strip()}" for _, name, text in documents)
+    if len(whole) <= budget:
+        return {
+            'text': whole,
+            'included': [chunk['chunk_id'] for chunk in chunks],
+            'sources': [name for _, name, _ in documents],
+            'redundant': [],
+            'over_budget': [],
+            'used_chars': len(whole),
+            'budget_chars': budget
+        }
+
+    if question:
+        lexical = BM25Index()
+        for chunk in chunks:
+            lexical.add(chunk['text'])
+        bm25 = lexical.scores(question)
+        # Lexical match first; positional spread breaks ties
+        chunks = [dict(chunk, score=float(bm25[i]) + chunk['score'] * 1e-3) for i, chunk in enumerate(chunks)]
+
+    return pack_context(chunks, budget=budget)
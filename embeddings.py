@@ -0,0 +1,177 @@
+"""
+Embedding backends for SmartDoc AI Agent
+All backends share one interface so retrieval can run against Gemini or fully offline
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+from config import Config
+from key_pool import ApiKeyPool, NoUsableApiKey
+from resilience import ResilientExecutor
+from scheduler import PRIORITY_INTERACTIVE, PRIORITY_NORMAL
+from utils import clean_text
+
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so inner product equals cosine similarity"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class BaseEmbedder:
+    """Embedder interface: float32, L2-normalized rows of size `dimension`"""
+
+    name = 'base'
+    dimension = 0
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_documents([text])[0]
+
+
+class GeminiEmbedder(BaseEmbedder):
+    """Gemini embedding API, called through the API key pool
+
+    Each batch goes out as one batchEmbedContents request on the selected
+    key's own client, with the same rate limiting, quarantine, failover and
+    retries as generation requests.
+    """
+
+    name = 'gemini'
+
+    def __init__(self, api_keys: List[str], model: str = None, batch_size: int = None):
+        if not api_keys:
+            raise NoUsableApiKey("The Gemini embedder needs at least one API key")
+        self.model = model or Config.RETRIEVAL_CONFIG['gemini_embedding_model']
+        self.batch_size = batch_size or Config.RETRIEVAL_CONFIG['embedding_batch_size']
+        self.dimension = Config.RETRIEVAL_CONFIG['gemini_embedding_dimension']
+        self.key_pool = ApiKeyPool(api_keys, self.model)
+        self.executor = ResilientExecutor(self.model, self.key_pool)
+
+    def _embed(self, texts: List[str], task_type: str, priority: str) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+
+            def call(timeout: float, api_key: str, batch=batch) -> List[List[float]]:
+                return self.key_pool.model(api_key).embed_contents(batch, task_type, request_options={'timeout': timeout})
+
+            rows.extend(self.executor.run(call, priority=priority))
+
+        if not rows:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return normalize_rows(np.array(rows, dtype=np.float32))
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self._embed(texts, "retrieval_document", PRIORITY_NORMAL)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._embed([text], "retrieval_query", PRIORITY_INTERACTIVE)[0]
+
+
+class HashingEmbedder(BaseEmbedder):
+    """Offline embedder: signed feature hashing of character n-grams
+
+    Feature hashing is a sparse random projection, so no vocabulary or
+    network access is needed and vectors are identical in every process.
+    A whole batch is vectorized at once with NumPy: n-gram hashes are
+    computed over the concatenated batch and counted with one bincount.
+    Counts are log-scaled (sublinear TF) and L2-normalized. Vectors are
+    cached by chunk hash, so re-indexing the same text is free.
+    """
+
+    name = 'local'
+
+    def __init__(self, dimension: int = None, ngram_range: tuple = None, cache_size: int = None):
+        self.dimension = dimension or Config.RETRIEVAL_CONFIG['local_embedding_dimension']
+        self.ngram_range = ngram_range or Config.RETRIEVAL_CONFIG['local_ngram_range']
+        self.cache_size = cache_size or Config.RETRIEVAL_CONFIG['embedding_cache_size']
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        # Same cleanup as extracted PDF text, so queries and chunks hash alike
+        return clean_text(text).lower()
+
+    def _vectorize(self, texts: List[str]) -> np.ndarray:
+        count = len(texts)
+        encoded = [f" {text} ".encode('utf-8') for text in texts]
+        lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+
+        # One buffer for the whole batch; NUL separators stop n-grams spanning texts
+        data = np.frombuffer(b"\x00".join(encoded), dtype=np.uint8).astype(np.uint64)
+        owner = np.repeat(np.arange(count, dtype=np.int64), lengths + 1)[:len(data)]
+
+        counts = np.zeros(count * self.dimension, dtype=np.float64)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            windows = len(data) - n + 1
+            if windows <= 0:
+                continue
+
+            hashes = np.full(windows, _FNV_OFFSET, dtype=np.uint64)
+            valid = np.ones(windows, dtype=bool)
+            for offset in range(n):
+                byte = data[offset:offset + windows]
+                hashes = (hashes ^ byte) * _FNV_PRIME
+                valid &= byte != 0
+
+            buckets = ((hashes >> np.uint64(32)) % np.uint64(self.dimension)).astype(np.int64)
+            signs = 1.0 - 2.0 * ((hashes >> np.uint64(17)) & np.uint64(1)).astype(np.float64)
+            slots = owner[:windows] * self.dimension + buckets
+            counts += np.bincount(slots[valid], weights=signs[valid], minlength=count * self.dimension)
+
+        vectors = counts.reshape(count, self.dimension)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        return normalize_rows(vectors)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        normalized = [self._normalize(text) for text in texts]
+        keys = [hashlib.sha1(text.encode('utf-8')).hexdigest() for text in normalized]
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+
+        with self._lock:
+            missing = []
+            for row, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(row)
+                else:
+                    self._cache.move_to_end(key)
+                    vectors[row] = cached
+
+        if missing:
+            computed = self._vectorize([normalized[row] for row in missing])
+            with self._lock:
+                for row, vector in zip(missing, computed):
+                    vectors[row] = vector
+                    self._cache[keys[row]] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return vectors
+
+
+def create_embedder(backend: str = None, api_keys: List[str] = None) -> BaseEmbedder:
+    """Build the embedder named in Config.RETRIEVAL_CONFIG['embedder']
+
+    `api_keys` are used by the Gemini backend only.
+    """
+    backend = backend or Config.RETRIEVAL_CONFIG['embedder']
+    if backend == 'gemini':
+        return GeminiEmbedder(api_keys)
+    if backend == 'local':
+        return HashingEmbedder()
+    raise ValueError(f"Unknown embedding backend: {backend}")
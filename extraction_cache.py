@@ -0,0 +1,150 @@
+"""
+Persistent extraction cache for SmartDoc AI Agent
+Content-addressed by the full SHA-256 of the PDF plus the extraction settings
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from config import Config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    cache_key   TEXT PRIMARY KEY,
+    text        TEXT NOT NULL,
+    metadata    TEXT NOT NULL,
+    size_bytes  INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_extractions_last_access ON extractions (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def make_cache_key(sha256_hex: str, settings: Dict[str, Any]) -> str:
+    """Build the lookup key from the document hash and extraction settings"""
+    settings_blob = json.dumps(settings, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{sha256_hex}|{settings_blob}".encode('utf-8')).hexdigest()
+
+
+class ExtractionCache:
+    """SQLite-backed cache of extracted text with size-bounded LRU eviction"""
+
+    def __init__(self, path: str = None, max_bytes: int = None):
+        self.path = path or Config.EXTRACTION_CACHE['path']
+        self.max_bytes = max_bytes or Config.EXTRACTION_CACHE['max_bytes']
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _bump(self, conn: sqlite3.Connection, counter: str):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (counter,)
+        )
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Return (text, metadata) for a key, or None on a miss"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT text, metadata FROM extractions WHERE cache_key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._bump(conn, 'misses')
+                return None
+
+            conn.execute(
+                "UPDATE extractions SET last_access = ? WHERE cache_key = ?", (time.time(), key)
+            )
+            self._bump(conn, 'hits')
+
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, text: str, metadata: Dict[str, Any]):
+        """Store an extraction result and evict least recently used entries if over budget"""
+        metadata_blob = json.dumps(metadata, default=str)
+        size_bytes = len(text.encode('utf-8')) + len(metadata_blob)
+        if size_bytes > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions "
+                "(cache_key, text, metadata, size_bytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, text, metadata_blob, size_bytes, now, now)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size_bytes in conn.execute(
+            "SELECT cache_key, size_bytes FROM extractions ORDER BY last_access ASC"
+        ).fetchall():
+            conn.execute("DELETE FROM extractions WHERE cache_key = ?", (key,))
+            self._bump(conn, 'evictions')
+            total -= size_bytes
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        """Remove all entries and reset counters"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM extractions")
+            conn.execute("DELETE FROM counters")
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size, shared by every process using the file"""
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM extractions"
+            ).fetchone()
+
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'evictions': counters.get('evictions', 0),
+            'entries': entries,
+            'size_bytes': total,
+            'max_bytes': self.max_bytes
+        }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Process-wide cache instance"""
+    global _shared_cache
+
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ExtractionCache()
+        return _shared_cache
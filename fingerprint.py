@@ -0,0 +1,134 @@
+"""
+Document fingerprint service for SmartDoc AI Agent
+Hashes each upload once and shares the result with validation, extraction, caching and the UI
+"""
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict
+
+from config import Config
+
+_HASH_CHUNK = 1024 * 1024
+
+
+class FingerprintService:
+    """Memoized SHA-256 fingerprints keyed on upload identity and size
+
+    Streamlit reruns the whole script on every interaction, so without
+    memoization the same upload is hashed again on each rerun.
+    """
+
+    def __init__(self, sample_threshold: int = None, sample_block: int = None, max_entries: int = None):
+        self.sample_threshold = sample_threshold or Config.FINGERPRINT_CONFIG['sample_threshold_bytes']
+        self.sample_block = sample_block or Config.FINGERPRINT_CONFIG['sample_block_bytes']
+        self.max_entries = max_entries or Config.FINGERPRINT_CONFIG['max_entries']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hashes_computed = 0
+        self.memo_hits = 0
+
+    def _identity(self, uploaded_file):
+        file_id = getattr(uploaded_file, 'file_id', None)
+        if file_id:
+            return ('file_id', file_id, uploaded_file.name, uploaded_file.size), None
+
+        # No stable upload id: key on the object itself and keep a weakref to detect id reuse
+        try:
+            ref = weakref.ref(uploaded_file)
+        except TypeError:
+            ref = None
+        return ('object', id(uploaded_file), getattr(uploaded_file, 'name', ''), uploaded_file.size), ref
+
+    def _entry(self, uploaded_file) -> Dict[str, Any]:
+        key, ref = self._identity(uploaded_file)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['ref'] is not None and entry['ref']() is not uploaded_file:
+                entry = None
+            if entry is None:
+                entry = {'ref': ref, 'size': uploaded_file.size}
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+
+        return entry
+
+    def sha256(self, uploaded_file) -> str:
+        """Full SHA-256 of the upload, computed at most once per upload"""
+        entry = self._entry(uploaded_file)
+        if 'sha256' in entry:
+            self.memo_hits += 1
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        if hasattr(uploaded_file, 'getbuffer'):
+            with uploaded_file.getbuffer() as view:
+                digest.update(view)
+        else:
+            uploaded_file.seek(0)
+            for chunk in iter(lambda: uploaded_file.read(_HASH_CHUNK), b''):
+                digest.update(chunk)
+            uploaded_file.seek(0)
+
+        entry['sha256'] = digest.hexdigest()
+        self.hashes_computed += 1
+        return entry['sha256']
+
+    def sample_hash(self, uploaded_file) -> str:
+        """Cheap identity hash over the size and head/middle/tail blocks
+
+        Good enough to tell uploads apart in the UI; never used as a cache key.
+        """
+        entry = self._entry(uploaded_file)
+        if 'sample' in entry:
+            self.memo_hits += 1
+            return entry['sample']
+
+        size = uploaded_file.size
+        block = self.sample_block
+        digest = hashlib.sha256(str(size).encode('ascii'))
+        for offset in sorted({0, max(0, size // 2 - block // 2), max(0, size - block)}):
+            uploaded_file.seek(offset)
+            digest.update(uploaded_file.read(block))
+        uploaded_file.seek(0)
+
+        entry['sample'] = 'sample:' + digest.hexdigest()
+        self.hashes_computed += 1
+        return entry['sample']
+
+    def fingerprint(self, uploaded_file) -> str:
+        """Display fingerprint: the full hash, or a sample hash for very large files"""
+        entry = self._entry(uploaded_file)
+        if 'sha256' in entry or uploaded_file.size <= self.sample_threshold:
+            return self.sha256(uploaded_file)
+        return self.sample_hash(uploaded_file)
+
+    def short(self, uploaded_file, length: int = 8) -> str:
+        """Short fingerprint for display"""
+        return self.fingerprint(uploaded_file).replace('sample:', '~')[:length]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'hashes_computed': self.hashes_computed,
+            'memo_hits': self.memo_hits
+        }
+
+
+_shared_service = None
+_shared_lock = threading.Lock()
+
+
+def get_fingerprint_service() -> FingerprintService:
+    """Process-wide fingerprint service"""
+    global _shared_service
+
+    with _shared_lock:
+        if _shared_service is None:
+            _shared_service = FingerprintService()
+        return _shared_service
@@ -0,0 +1,147 @@
+"""
+Upload ingestion for SmartDoc AI Agent
+Exposes an upload's bytes to PyPDF2 without temp-file round trips, hashing them in the same pass
+"""
+import io
+import os
+import sys
+import mmap
+import hashlib
+import tempfile
+from typing import Optional, Union
+
+from config import Config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_READ_CHUNK = 1024 * 1024
+
+
+def peak_rss_kb() -> Optional[int]:
+    """Lifetime peak resident set size of this process in KB (None where unsupported)
+
+    This is a high-water mark: it only moves when a new process-wide peak is set,
+    so it cannot measure the cost of one upload. Use `current_rss_kb` for that.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KB on Linux/BSD
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def current_rss_kb() -> Optional[int]:
+    """Current resident set size of this process in KB (None where unsupported)"""
+    try:
+        with open('/proc/self/statm', 'rb') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class UploadBuffer:
+    """Read-only view of an uploaded file
+
+    Small uploads are exposed through the upload's own buffer (no copy).
+    Uploads above `spool_threshold` are streamed once into a spool file and
+    memory-mapped, so they never live in the heap in full. Either way the
+    SHA-256 is computed while the bytes are being made available, unless the
+    caller already has it from the fingerprint service.
+    """
+
+    def __init__(self, uploaded_file, spool_threshold: int = None, sha256: str = None):
+        self.name = getattr(uploaded_file, 'name', '')
+        self.sha256 = sha256
+        self.spool_threshold = spool_threshold or Config.INGEST_SPOOL_THRESHOLD_BYTES
+        self.path = None
+        self._upload = uploaded_file
+        self._view = None
+        self._spool = None
+        self._mmap = None
+
+        size = getattr(uploaded_file, 'size', None)
+        if size is not None and size > self.spool_threshold:
+            self._spool_to_disk(uploaded_file)
+        else:
+            self._load_in_memory(uploaded_file)
+
+    def _load_in_memory(self, uploaded_file):
+        if hasattr(uploaded_file, 'getbuffer'):
+            # BytesIO-backed uploads (Streamlit's UploadedFile) share their buffer
+            self._view = uploaded_file.getbuffer()
+        else:
+            uploaded_file.seek(0)
+            self._view = memoryview(uploaded_file.read())
+            self._upload = None
+
+        self.size = self._view.nbytes
+        if self.sha256 is None:
+            self.sha256 = hashlib.sha256(self._view).hexdigest()
+
+    def _spool_to_disk(self, uploaded_file):
+        digest = hashlib.sha256()
+        fd, self.path = tempfile.mkstemp(suffix=".pdf", prefix="smartdoc_")
+        self._spool = os.fdopen(fd, 'w+b')
+
+        uploaded_file.seek(0)
+        while True:
+            chunk = uploaded_file.read(_READ_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            self._spool.write(chunk)
+        self._spool.flush()
+
+        self.size = self._spool.tell()
+        if self.sha256 is None:
+            self.sha256 = digest.hexdigest()
+        if self.size:
+            self._mmap = mmap.mmap(self._spool.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def spooled(self) -> bool:
+        return self.path is not None
+
+    def reader_stream(self):
+        """Seekable binary stream for PdfReader over the same bytes"""
+        if self._mmap is not None:
+            self._mmap.seek(0)
+            return self._mmap
+        if self._upload is not None:
+            self._upload.seek(0)
+            return self._upload
+        return io.BytesIO(self._view)
+
+    def worker_source(self) -> Union[bytes, str]:
+        """Picklable handle for extraction workers: the spool path, or the raw bytes"""
+        if self.path is not None:
+            return self.path
+        return self._view.tobytes()
+
+    def close(self):
+        """Release the buffer export and remove any spool file"""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
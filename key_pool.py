@@ -0,0 +1,150 @@
+"""
+API key pool for SmartDoc AI Agent
+Routes each request to the key with the most quota headroom and quarantines
+keys that fail authentication or run out of quota
+"""
+import re
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+
+from config import Config
+from quota_ledger import api_key_id
+from rate_limiter import DailyQuotaExceeded, RateLimiter, get_rate_limiter, is_throttle_error
+from model_clients import HEALTH_INVALID, KeyBoundModel, ModelClientPool, get_client_pool, is_auth_error
+
+
+class NoUsableApiKey(Exception):
+    """Every key in the pool is invalid or quarantined"""
+
+
+def parse_api_keys(value: Optional[str]) -> List[str]:
+    """Keys from a comma / whitespace separated string, duplicates removed"""
+    keys = []
+    for key in re.split(r'[\s,]+', value or ""):
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def mask_key(api_key: str) -> str:
+    return f"…{api_key[-4:]}" if len(api_key) > 4 else "…"
+
+
+def _next_utc_midnight() -> float:
+    tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=timezone.utc).timestamp()
+
+
+# Quarantines are process-wide: a key drained by one session is avoided by all
+_quarantine = {}    # key_id -> (until, reason)
+_quarantine_lock = threading.Lock()
+
+
+class ApiKeyPool:
+    """Several API keys for one model, each with its own rate bucket and quota
+
+    `select` picks the usable key whose next slot frees up soonest (most
+    requests left today breaks ties). `report` feeds call outcomes back:
+    auth errors quarantine a key for `auth_quarantine_seconds`, per-minute
+    throttling for `rate_quarantine_seconds` (unless no other key is
+    usable), and an exhausted daily quota until the quota resets.
+    """
+
+    def __init__(self, api_keys: List[str], model_name: str, rate_limiter: RateLimiter = None,
+                 client_pool: ModelClientPool = None):
+        self.api_keys = list(api_keys)
+        self.model_name = model_name
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.client_pool = client_pool or get_client_pool()
+        self.auth_quarantine_seconds = Config.API_KEY_POOL['auth_quarantine_seconds']
+        self.rate_quarantine_seconds = Config.API_KEY_POOL['rate_quarantine_seconds']
+
+    def __len__(self) -> int:
+        return len(self.api_keys)
+
+    def model(self, api_key: str) -> KeyBoundModel:
+        return self.client_pool.get_model(api_key, self.model_name)
+
+    def quarantined(self, api_key: str) -> Optional[Dict[str, Any]]:
+        with _quarantine_lock:
+            entry = _quarantine.get(api_key_id(api_key))
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del _quarantine[api_key_id(api_key)]
+                return None
+            return {'until': entry[0], 'reason': entry[1]}
+
+    def quarantine(self, api_key: str, seconds: float = None, reason: str = "", until: float = None):
+        with _quarantine_lock:
+            _quarantine[api_key_id(api_key)] = (until or time.time() + seconds, reason)
+
+    def usable_keys(self) -> List[str]:
+        return [key for key in self.api_keys
+                if not self.quarantined(key) and self.client_pool.health(key)['state'] != HEALTH_INVALID]
+
+    def has_usable_key(self) -> bool:
+        return bool(self.usable_keys())
+
+    def _ranked(self, exclude: tuple = ()) -> List[tuple]:
+        candidates = []
+        for key in self.usable_keys():
+            if key in exclude:
+                continue
+            headroom = self.rate_limiter.headroom(self.model_name, key)
+            if headroom['remaining_today'] > 0:
+                candidates.append((headroom['wait'], -headroom['remaining_today'], self.api_keys.index(key), key))
+
+        if not candidates:
+            raise NoUsableApiKey(
+                f"No usable API key: all {len(self.api_keys)} keys are invalid, quarantined or out of daily quota"
+            )
+        return sorted(candidates)
+
+    def select(self, exclude: tuple = ()) -> str:
+        """Key with the most headroom right now
+
+        Raises NoUsableApiKey when every key is invalid, quarantined or out of quota.
+        """
+        return self._ranked(exclude)[0][-1]
+
+    def next_slot_wait(self) -> float:
+        """Seconds until any usable key has a free slot"""
+        return self._ranked()[0][0]
+
+    def report(self, api_key: str, error: Exception = None) -> bool:
+        """Record a call outcome; True when the failure was specific to this key"""
+        self.client_pool.record(api_key, error)
+        if error is None:
+            return False
+
+        if is_auth_error(error):
+            self.quarantine(api_key, self.auth_quarantine_seconds, "authentication failed")
+        elif isinstance(error, DailyQuotaExceeded) or (is_throttle_error(error) and "PerDay" in str(error)):
+            self.quarantine(api_key, reason="daily quota exhausted", until=_next_utc_midnight())
+        elif is_throttle_error(error):
+            if not any(key != api_key for key in self.usable_keys()):
+                # Never sideline the last usable key: its AIMD rate and the executor's backoff absorb the 429
+                return False
+            self.quarantine(api_key, self.rate_quarantine_seconds, "rate limited")
+        else:
+            return False
+        return True
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Per-key health, quarantine and quota usage for display"""
+        rows = []
+        for key in self.api_keys:
+            quarantine = self.quarantined(key)
+            usage = self.rate_limiter.stats(self.model_name, key)
+            rows.append({
+                'key': mask_key(key),
+                'state': self.client_pool.health(key)['state'],
+                'quarantined': quarantine['reason'] if quarantine else None,
+                'requests_today': usage['requests_today'],
+                'daily_limit': usage['daily_limit']
+            })
+        return rows
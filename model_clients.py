@@ -0,0 +1,213 @@
+"""
+Shared Gemini clients for SmartDoc AI Agent
+One set of API clients per API key, reused by every session in the process,
+with lazily or cheaply validated keys and per-key health state
+"""
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+import google.generativeai as genai
+import google.ai.generativelanguage as glm
+from google.generativeai.types import GenerateContentResponse
+
+from config import Config
+from quota_ledger import api_key_id
+from resilience import error_status
+
+HEALTH_UNVERIFIED = 'unverified'
+HEALTH_HEALTHY = 'healthy'
+HEALTH_INVALID = 'invalid'
+HEALTH_DEGRADED = 'degraded'
+
+
+def is_invalid_key_error(error: Exception) -> bool:
+    """True when the API names the key itself as invalid (reason API_KEY_INVALID)"""
+    message = str(error)
+    return "API_KEY_INVALID" in message or "API key not valid" in message
+
+
+def is_auth_error(error: Exception) -> bool:
+    """True when the API key was rejected, invalid or only unauthorized for now"""
+    return error_status(error) in ('UNAUTHENTICATED', 'PERMISSION_DENIED') or is_invalid_key_error(error)
+
+
+class KeyBoundModel:
+    """A Gemini model whose requests go through one API key's client
+
+    Offers the parts of genai.GenerativeModel the app uses (generate_content,
+    streamed or not, and count_tokens), built on the public
+    generativelanguage client and response types. `cached_content` names
+    provider-cached documents the prompts are answered against.
+    """
+
+    def __init__(self, model_name: str, client: glm.GenerativeServiceClient, cached_content: str = None):
+        self.model_name = model_name if model_name.startswith('models/') else f"models/{model_name}"
+        self.client = client
+        self.cached_content = cached_content
+
+    def with_cached_content(self, name: str, model_name: str) -> 'KeyBoundModel':
+        """Same key's client, answering against cached content created for `model_name`"""
+        return KeyBoundModel(model_name, self.client, cached_content=name)
+
+    @staticmethod
+    def _contents(prompt: str):
+        return [glm.Content(role='user', parts=[glm.Part(text=prompt)])]
+
+    def generate_content(self, prompt: str, stream: bool = False,
+                         request_options: Optional[Dict[str, Any]] = None) -> GenerateContentResponse:
+        request = glm.GenerateContentRequest(model=self.model_name, contents=self._contents(prompt))
+        if self.cached_content:
+            request.cached_content = self.cached_content
+        if stream:
+            return GenerateContentResponse.from_iterator(
+                self.client.stream_generate_content(request, **(request_options or {}))
+            )
+        return GenerateContentResponse.from_response(self.client.generate_content(request, **(request_options or {})))
+
+    def count_tokens(self, prompt: str, request_options: Optional[Dict[str, Any]] = None) -> glm.CountTokensResponse:
+        request = glm.CountTokensRequest(model=self.model_name, contents=self._contents(prompt))
+        return self.client.count_tokens(request, **(request_options or {}))
+
+    def embed_contents(self, texts: List[str], task_type: str,
+                       request_options: Optional[Dict[str, Any]] = None) -> List[List[float]]:
+        """One embedding per text, in a single batchEmbedContents request"""
+        request = glm.BatchEmbedContentsRequest(model=self.model_name, requests=[
+            glm.EmbedContentRequest(model=self.model_name, content=glm.Content(parts=[glm.Part(text=text)]),
+                                    task_type=task_type.upper())
+            for text in texts
+        ])
+        response = self.client.batch_embed_contents(request, **(request_options or {}))
+        return [list(embedding.values) for embedding in response.embeddings]
+
+
+class _KeyClients:
+    """Clients, models and health of one API key"""
+
+    def __init__(self, api_key: str):
+        options = {'api_key': api_key}
+        self.generative_client = glm.GenerativeServiceClient(client_options=options)
+        self.model_client = glm.ModelServiceClient(client_options=options)
+        self.models = {}
+        self.state = HEALTH_UNVERIFIED
+        self.checked_at = None
+        self.last_error = None
+        self.last_success = None
+        self.lock = threading.Lock()
+
+
+class ModelClientPool:
+    """Process-wide key-bound models keyed by API key
+
+    Building a client makes no request. Keys are validated either lazily
+    (by the outcome of the first real request) or with a models.get
+    metadata call, which uses no generation quota; the result is shared by
+    every session using the key until `validation_ttl_seconds` passes.
+    Only an explicit invalid-key error marks a key invalid, and even then it
+    is checked again after `invalid_recheck_seconds`.
+    """
+
+    def __init__(self, validation: str = None, validation_ttl_seconds: int = None,
+                 invalid_recheck_seconds: int = None):
+        settings = Config.MODEL_CLIENT_POOL
+        self.validation = validation or settings['validation']
+        self.validation_ttl_seconds = validation_ttl_seconds or settings['validation_ttl_seconds']
+        self.invalid_recheck_seconds = invalid_recheck_seconds or settings['invalid_recheck_seconds']
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, api_key: str) -> _KeyClients:
+        key_id = api_key_id(api_key)
+        with self._lock:
+            entry = self._keys.get(key_id)
+            if entry is None:
+                entry = self._keys[key_id] = _KeyClients(api_key)
+            return entry
+
+    def get_model(self, api_key: str, model_name: str) -> KeyBoundModel:
+        """Configured model for a key, created once and shared across sessions"""
+        entry = self._entry(api_key)
+        with entry.lock:
+            model = entry.models.get(model_name)
+            if model is None:
+                # This key's client rather than the process-global default
+                model = entry.models[model_name] = KeyBoundModel(model_name, entry.generative_client)
+            return model
+
+    def _recheck_invalid(self, entry: _KeyClients):
+        """Give an invalid key another chance once `invalid_recheck_seconds` have passed"""
+        if entry.state == HEALTH_INVALID and time.time() - entry.checked_at >= self.invalid_recheck_seconds:
+            entry.state = HEALTH_UNVERIFIED
+            entry.checked_at = None
+
+    def validate(self, api_key: str, model_name: str, force: bool = False) -> Dict[str, Any]:
+        """Check a key if needed; returns its health
+
+        In 'lazy' mode nothing is sent and an unchecked key stays
+        'unverified' until its first real request.
+        """
+        entry = self._entry(api_key)
+        with entry.lock:
+            self._recheck_invalid(entry)
+            fresh = entry.checked_at is not None and time.time() - entry.checked_at < self.validation_ttl_seconds
+            if self.validation == 'lazy' or (fresh and not force):
+                return self._health(entry)
+
+            try:
+                genai.get_model(f"models/{model_name}", client=entry.model_client,
+                                request_options={'timeout': 10})
+                entry.state = HEALTH_HEALTHY
+                entry.last_error = None
+            except Exception as e:
+                entry.state = HEALTH_INVALID if is_invalid_key_error(e) else HEALTH_DEGRADED
+                entry.last_error = str(e)
+            entry.checked_at = time.time()
+            return self._health(entry)
+
+    def record(self, api_key: str, error: Exception = None):
+        """Update a key's health from the outcome of a real request"""
+        entry = self._entry(api_key)
+        with entry.lock:
+            if error is None:
+                entry.state = HEALTH_HEALTHY
+                entry.last_success = entry.checked_at = time.time()
+                entry.last_error = None
+            elif is_invalid_key_error(error):
+                entry.state = HEALTH_INVALID
+                entry.checked_at = time.time()
+                entry.last_error = str(error)
+            elif is_auth_error(error):
+                # A bare 401/403 can be transient; the key pool quarantines it meanwhile
+                entry.state = HEALTH_DEGRADED
+                entry.last_error = str(error)
+
+    def health(self, api_key: str) -> Dict[str, Any]:
+        entry = self._entry(api_key)
+        with entry.lock:
+            self._recheck_invalid(entry)
+            return self._health(entry)
+
+    @staticmethod
+    def _health(entry: _KeyClients) -> Dict[str, Any]:
+        return {
+            'state': entry.state,
+            'checked_at': entry.checked_at,
+            'last_success': entry.last_success,
+            'last_error': entry.last_error,
+            'models': sorted(entry.models)
+        }
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def get_client_pool() -> ModelClientPool:
+    """Process-wide client pool"""
+    global _shared_pool
+
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = ModelClientPool()
+        return _shared_pool
+
@@ -0,0 +1,269 @@
+"""
+PDF extraction engine for SmartDoc AI Agent
+Splits a PDF into page ranges and extracts them across a process pool
+"""
+import io
+import time
+import mmap
+import atexit
+import threading
+import multiprocessing
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple, Union
+import PyPDF2
+
+from config import Config
+from ingestion import UploadBuffer
+
+# (page_number, text, error) - page_number is zero-based
+PageResult = Tuple[int, str, Optional[str]]
+
+# Raw PDF bytes, or the path of a spooled PDF on disk
+PdfSource = Union[bytes, str]
+
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+@contextmanager
+def _open_reader(source: PdfSource) -> Iterator[PyPDF2.PdfReader]:
+    """Open a PdfReader over raw bytes or a memory-mapped file path"""
+    if isinstance(source, str):
+        with open(source, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield PyPDF2.PdfReader(mapped)
+    else:
+        yield PyPDF2.PdfReader(io.BytesIO(source))
+
+
+def _extract_from_reader(reader: PyPDF2.PdfReader, start: int, end: int) -> List[PageResult]:
+    results = []
+
+    for page_num in range(start, end):
+        try:
+            page_text = reader.pages[page_num].extract_text() or ""
+            results.append((page_num, page_text, None))
+        except Exception as e:
+            results.append((page_num, "", str(e)))
+
+    return results
+
+
+def _extract_page_range(source: PdfSource, start: int, end: int) -> List[PageResult]:
+    """Extract pages [start, end) from a PDF source (runs inside a worker)"""
+    with _open_reader(source) as reader:
+        return _extract_from_reader(reader, start, end)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared process pool, recreating it if the size changed"""
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Forking the threaded server can copy held locks into children; forkserver starts them clean
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(_START_METHOD))
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    """Drop the shared pool (after a crash or at interpreter exit)"""
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _pool_workers = 0
+
+
+atexit.register(_reset_pool)
+
+
+def split_page_ranges(start: int, end: int, parts: int) -> List[Tuple[int, int]]:
+    """Split [start, end) into at most `parts` contiguous, near-equal ranges"""
+    total = max(0, end - start)
+    parts = max(1, min(parts, total))
+    if total == 0:
+        return []
+
+    size, remainder = divmod(total, parts)
+    ranges = []
+    cursor = start
+    for i in range(parts):
+        step = size + (1 if i < remainder else 0)
+        ranges.append((cursor, cursor + step))
+        cursor += step
+
+    return ranges
+
+
+def assemble_text(pages: List[PageResult], header: str = "\n\n=== PAGE {} ===\n") -> Tuple[str, int]:
+    """Join extracted pages in order with page headers, returning (text, pages_with_content)"""
+    parts = []
+    pages_with_content = 0
+
+    for page_num, page_text, _ in sorted(pages, key=lambda p: p[0]):
+        if page_text.strip():
+            parts.append(header.format(page_num + 1))
+            parts.append(page_text.strip())
+            pages_with_content += 1
+
+    return "".join(parts), pages_with_content
+
+
+class PdfExtractionEngine:
+    """Per-page PDF text extraction, parallelised across processes for long documents"""
+
+    def __init__(self, workers: int = None, min_pages_per_worker: int = None, timeout_seconds: float = None):
+        self.workers = max(1, workers or Config.EXTRACTION_WORKERS)
+        self.min_pages_per_worker = max(1, min_pages_per_worker or Config.EXTRACTION_MIN_PAGES_PER_WORKER)
+        self.timeout_seconds = timeout_seconds or Config.EXTRACTION_TIMEOUT_SECONDS
+
+    def plan(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """Decide the page ranges to hand to workers"""
+        total = max(0, end - start)
+        parts = min(self.workers, total // self.min_pages_per_worker)
+        return split_page_ranges(start, end, max(1, parts))
+
+    def extract_pages(self, source, start: int, end: int,
+                      reader: PyPDF2.PdfReader = None) -> List[PageResult]:
+        """Extract pages [start, end) and return them ordered by page number
+
+        `source` is raw bytes, a spool file path, or an ingestion.UploadBuffer.
+        An already-open `reader` over the same source is reused in serial mode.
+        Output is identical to serial extraction regardless of worker count.
+        If the workers do not finish within `timeout_seconds`, the pool is
+        dropped and the pages are extracted serially instead.
+        """
+        ranges = self.plan(start, end)
+        if len(ranges) <= 1:
+            if reader is not None:
+                return _extract_from_reader(reader, start, end)
+            if hasattr(source, 'reader_stream'):
+                # Serial path reads the upload's own buffer - no copy, no IPC
+                return _extract_from_reader(PyPDF2.PdfReader(source.reader_stream()), start, end)
+            return _extract_page_range(source, start, end)
+
+        portable = source.worker_source() if hasattr(source, 'worker_source') else source
+        try:
+            pool = _get_pool(self.workers)
+            futures = [pool.submit(_extract_page_range, portable, s, e) for s, e in ranges]
+            deadline = time.monotonic() + self.timeout_seconds
+            results = []
+            for future in futures:
+                results.extend(future.result(timeout=max(0.0, deadline - time.monotonic())))
+        except (BrokenProcessPool, OSError, FutureTimeout):
+            # A dead or hung worker, or a platform without process support - fall back to serial
+            _reset_pool()
+            return _extract_page_range(portable, start, end)
+
+        results.sort(key=lambda p: p[0])
+        return results
+
+
+class LazyPageProvider:
+    """On-demand page access for one document
+
+    Pages are extracted only when a range that contains them is requested,
+    and every extracted page is memoized, so documents of any length cost
+    only the pages somebody actually reads.
+    """
+
+    def __init__(self, source, engine: PdfExtractionEngine = None):
+        self._source = source
+        self.engine = engine or PdfExtractionEngine()
+        stream = source.reader_stream() if hasattr(source, 'reader_stream') else io.BytesIO(source)
+        self.reader = PyPDF2.PdfReader(stream)
+        self.total_pages = len(self.reader.pages)
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def clamp(self, start: int, end: int) -> Tuple[int, int]:
+        """Clamp a zero-based [start, end) window to the document"""
+        start = max(0, min(start, self.total_pages))
+        end = max(start, min(end, self.total_pages))
+        return start, end
+
+    def pages(self, start: int, end: int) -> List[PageResult]:
+        """Return pages [start, end), extracting only those not seen before"""
+        start, end = self.clamp(start, end)
+
+        with self._lock:
+            missing = [n for n in range(start, end) if n not in self._pages]
+            for run_start, run_end in _contiguous_runs(missing):
+                for page in self.engine.extract_pages(self._source, run_start, run_end, reader=self.reader):
+                    self._pages[page[0]] = page
+
+            return [self._pages[n] for n in range(start, end)]
+
+    def page(self, page_num: int) -> PageResult:
+        """Return a single zero-based page"""
+        return self.pages(page_num, page_num + 1)[0]
+
+    @property
+    def extracted_pages(self) -> List[int]:
+        return sorted(self._pages)
+
+    def close(self):
+        if hasattr(self._source, 'close'):
+            self._source.close()
+
+
+def _contiguous_runs(page_numbers: List[int]) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into [start, end) runs"""
+    runs = []
+    for page_num in page_numbers:
+        if runs and runs[-1][1] == page_num:
+            runs[-1][1] = page_num + 1
+        else:
+            runs.append([page_num, page_num + 1])
+    return [tuple(run) for run in runs]
+
+
+_providers = OrderedDict()
+_providers_lock = threading.Lock()
+
+
+def get_page_provider(sha256: str) -> Optional[LazyPageProvider]:
+    """Provider previously registered for a document fingerprint"""
+    with _providers_lock:
+        provider = _providers.get(sha256)
+        if provider is not None:
+            _providers.move_to_end(sha256)
+        return provider
+
+
+def register_page_provider(sha256: str, provider: LazyPageProvider) -> LazyPageProvider:
+    """Keep a provider for later windows, evicting the least recently used ones"""
+    with _providers_lock:
+        existing = _providers.get(sha256)
+        if existing is not None and existing is not provider:
+            provider.close()
+            return existing
+
+        _providers[sha256] = provider
+        while len(_providers) > Config.PAGE_WINDOW['max_open_documents']:
+            _, evicted = _providers.popitem(last=False)
+            evicted.close()
+        return provider
+
+
+def open_page_provider(uploaded_file, sha256: str, engine: PdfExtractionEngine = None) -> LazyPageProvider:
+    """Return the provider for an upload, opening it over the upload's buffer if new
+
+    The buffer stays open for on-demand page access until the provider is evicted.
+    """
+    provider = get_page_provider(sha256)
+    if provider is None:
+        upload = UploadBuffer(uploaded_file, sha256=sha256)
+        provider = register_page_provider(sha256, LazyPageProvider(upload, engine))
+    return provider
@@ -0,0 +1,213 @@
+"""
+Prompt templates for SmartDoc AI Agent
+One compiled template per analysis mode. Every prompt starts with the same
+document prefix, so the document part of the request is byte-identical
+whichever mode is asked for and prefix caches can reuse it.
+"""
+import threading
+from textwrap import dedent
+from typing import Dict
+
+from config import Config
+from token_budget import get_token_estimator
+
+DOCUMENT_HEADER = "**Document Content:**\n"
+PREFIX_END = "\n\n---\n\n"
+HISTORY_HEADER = "**Conversation so far:**\n"
+
+# Instructions follow the document, so they refer to it as "the document above"
+ANALYSIS_TEMPLATES = {
+    "summary": """
+        Create a comprehensive summary of the document above:
+
+        **Requirements:**
+        - Executive summary (2-3 sentences)
+        - Main topics covered
+        - Key findings or conclusions
+        - Important details or statistics
+        - Overall assessment
+
+        **Format:** Use clear headers and bullet points for readability.
+    """,
+
+    "comprehensive": """
+        Perform a thorough analysis of the document above:
+
+        **Analysis Framework:**
+        1. **Document Overview** - Purpose, scope, and context
+        2. **Key Themes & Topics** - Main subjects discussed
+        3. **Critical Findings** - Important discoveries or insights
+        4. **Data & Evidence** - Statistics, facts, and supporting information
+        5. **Arguments & Positions** - Main claims and reasoning
+        6. **Implications** - What this means and why it matters
+        7. **Recommendations** - Suggested actions or next steps
+        8. **Assessment** - Overall evaluation and significance
+
+        **Instructions:** Provide detailed analysis under each section with specific examples from the text.
+    """,
+
+    "insights": """
+        Extract and analyze key insights from the document above:
+
+        **Focus Areas:**
+        • **Top 5 Most Important Findings** - What are the critical discoveries?
+        • **Trends & Patterns** - What patterns emerge from the data/content?
+        • **Implications & Impact** - What are the broader consequences?
+        • **Opportunities & Challenges** - What possibilities and obstacles are identified?
+        • **Strategic Recommendations** - What actions should be taken?
+
+        **Format:** Use clear categories with bullet points and explanations.
+    """,
+
+    "technical": """
+        Provide a technical analysis of the document above:
+
+        **Technical Framework:**
+        - **Methodology** - Approaches, techniques, or processes used
+        - **Technical Details** - Specifications, parameters, or technical aspects
+        - **Data Analysis** - Statistical information and data interpretation
+        - **Technical Conclusions** - Engineering, scientific, or technical findings
+        - **Implementation Notes** - Practical application considerations
+    """,
+
+    "custom": """
+        Based on the document above, answer this specific question with detailed analysis:
+
+        **Question:** {custom_query}
+
+        **Requirements:**
+        - Provide a direct answer to the question
+        - Include supporting evidence from the document
+        - Explain the context and background
+        - Discuss implications or significance
+        - Note any limitations or caveats
+
+        **Instructions:** Base your answer entirely on the document content and be specific about sources.
+    """
+}
+
+# Shorter prompts of the basic app (app.py)
+BASIC_TEMPLATES = {
+    "summary": """
+        Provide a concise summary of the document above in 200 words or less.
+
+        Include:
+        - Main topic/purpose
+        - Key findings or points
+        - Important conclusions
+    """,
+
+    "comprehensive": """
+        Analyze the document above thoroughly and provide:
+
+        1. **Executive Summary** (2-3 sentences)
+        2. **Key Topics & Themes**
+        3. **Important Facts & Figures**
+        4. **Main Arguments/Conclusions**
+        5. **Recommendations** (if applicable)
+    """,
+
+    "insights": """
+        Extract the key insights from the document above:
+
+        • What are the 5 most important findings?
+        • What trends or patterns are identified?
+        • What are the implications?
+        • What recommendations are made?
+    """,
+
+    "custom": """
+        Based on the document above, answer the following question:
+
+        **Question:** {custom_query}
+
+        **Instructions:** Provide a detailed answer with supporting evidence from the document.
+    """
+}
+
+
+class PromptTemplate:
+    """Instructions of one analysis mode, dedented once when the registry is built"""
+
+    def __init__(self, mode: str, template: str):
+        self.mode = mode
+        self.instructions = dedent(template).strip() + "\n"
+        self.takes_query = "{custom_query}" in self.instructions
+
+    def render_instructions(self, custom_query: str = "") -> str:
+        if self.takes_query:
+            return self.instructions.replace("{custom_query}", custom_query)
+        return self.instructions
+
+
+class PromptRegistry:
+    """Analysis prompts keyed by the modes in Config.ANALYSIS_MODES
+
+    `render` builds only the requested prompt: the shared document prefix,
+    any chat history, then that mode's instructions. A custom-question mode without a
+    question, or an unknown mode, falls back to `default_mode`. With
+    `complete`, every configured mode must have a template.
+    """
+
+    def __init__(self, templates: Dict[str, str], default_mode: str, complete: bool = False):
+        unknown = sorted(set(templates) - set(Config.ANALYSIS_MODES))
+        if unknown:
+            raise ValueError(f"Prompt templates for unknown analysis modes: {', '.join(unknown)}")
+        missing = sorted(set(Config.ANALYSIS_MODES) - set(templates))
+        if complete and missing:
+            raise ValueError(f"No prompt template for analysis modes: {', '.join(missing)}")
+        if default_mode not in templates:
+            raise ValueError(f"No prompt template for the default mode '{default_mode}'")
+
+        self.templates = {mode: PromptTemplate(mode, template) for mode, template in templates.items()}
+        self.default_mode = default_mode
+
+    def resolve(self, mode: str, custom_query: str = "") -> PromptTemplate:
+        template = self.templates.get(mode)
+        if template is None or (template.takes_query and not custom_query):
+            return self.templates[self.default_mode]
+        return template
+
+    @staticmethod
+    def document_prefix(text: str) -> str:
+        """Leading part of every prompt for this text, identical across modes"""
+        return f"{DOCUMENT_HEADER}{text.strip()}{PREFIX_END}"
+
+    @staticmethod
+    def history_block(history: str) -> str:
+        """Earlier chat turns, placed after the document prefix so the prefix stays cacheable"""
+        return f"{HISTORY_HEADER}{history.strip()}{PREFIX_END}" if history.strip() else ""
+
+    def render(self, mode: str, text: str, custom_query: str = "", history: str = "") -> str:
+        return (self.document_prefix(text) + self.history_block(history)
+                + self.resolve(mode, custom_query).render_instructions(custom_query))
+
+    def estimate_tokens(self, mode: str, text: str, custom_query: str = "") -> Dict[str, int]:
+        """Estimated prompt tokens: the shared document 'prefix', the mode's 'instructions' and the 'total'"""
+        prefix, instructions = get_token_estimator().estimate_many([
+            self.document_prefix(text), self.resolve(mode, custom_query).render_instructions(custom_query)
+        ])
+        return {'prefix': prefix, 'instructions': instructions, 'total': prefix + instructions}
+
+    def template_tokens(self) -> Dict[str, int]:
+        """Estimated fixed instruction tokens of each mode"""
+        # Fixed part only; a custom question adds its own tokens
+        counts = get_token_estimator().estimate_many(
+            template.render_instructions("") for template in self.templates.values()
+        )
+        return dict(zip(self.templates, counts))
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_prompt_registry(basic: bool = False) -> PromptRegistry:
+    """Process-wide registry: the enhanced app's templates, or the basic app's with `basic`"""
+    with _registries_lock:
+        if basic not in _registries:
+            if basic:
+                _registries[basic] = PromptRegistry(BASIC_TEMPLATES, default_mode='summary')
+            else:
+                _registries[basic] = PromptRegistry(ANALYSIS_TEMPLATES, default_mode='comprehensive', complete=True)
+        return _registries[basic]
@@ -0,0 +1,130 @@
+"""
+Cross-process quota ledger for SmartDoc AI Agent
+Request buckets per API key and model in a shared SQLite (WAL) file, so every
+server process behind a load balancer draws from the same RPM/RPD budget
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from config import Config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key_id     TEXT NOT NULL,
+    model      TEXT NOT NULL,
+    rpm        REAL NOT NULL,
+    tokens     REAL NOT NULL,
+    updated    REAL NOT NULL,
+    day        TEXT,
+    day_count  INTEGER NOT NULL,
+    throttled  INTEGER NOT NULL,
+    PRIMARY KEY (key_id, model)
+);
+"""
+
+_FIELDS = ('rpm', 'tokens', 'updated', 'day', 'day_count', 'throttled')
+
+
+def api_key_id(api_key: Optional[str]) -> str:
+    """Stable identifier for an API key; the key itself is never stored"""
+    if not api_key:
+        return 'default'
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+class QuotaLedger:
+    """Bucket state shared by all processes using the same ledger file
+
+    `transact` runs a read-modify-write of one bucket inside a
+    `BEGIN IMMEDIATE` transaction, so reservations from concurrent processes
+    are serialized by SQLite's write lock and can never double-spend.
+    `read` is a plain snapshot read that never takes the write lock.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or Config.QUOTA_LEDGER['path']
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def transact(self, key_id: str, model: str, initial: Callable[[], Dict[str, Any]],
+                 update: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Apply `update` to a bucket's state dict atomically and return its result
+
+        `initial()` supplies the state of a bucket seen for the first time.
+        Changes made to the dict by `update` are written back even when it
+        raises, so a rejected request still records the refill.
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    f"SELECT {', '.join(_FIELDS)} FROM buckets WHERE key_id = ? AND model = ?",
+                    (key_id, model)
+                ).fetchone()
+                state = dict(zip(_FIELDS, row)) if row is not None else initial()
+
+                try:
+                    return update(state)
+                finally:
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO buckets (key_id, model, {', '.join(_FIELDS)}) "
+                        f"VALUES (?, ?, {', '.join('?' * len(_FIELDS))})",
+                        (key_id, model, *(state[field] for field in _FIELDS))
+                    )
+                    conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+    def read(self, key_id: str, model: str) -> Optional[Dict[str, Any]]:
+        """A bucket's stored state, or None if it has never been used (plain read, no write lock)"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(_FIELDS)} FROM buckets WHERE key_id = ? AND model = ?", (key_id, model)
+            ).fetchone()
+        finally:
+            conn.close()
+        return dict(zip(_FIELDS, row)) if row is not None else None
+
+    def usage(self) -> Dict[str, Dict[str, Any]]:
+        """Current state of every bucket, keyed by 'key_id/model'"""
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT key_id, model, {', '.join(_FIELDS)} FROM buckets").fetchall()
+        return {f"{row[0]}/{row[1]}": dict(zip(_FIELDS, row[2:])) for row in rows}
+
+
+_shared_ledger = None
+_shared_lock = threading.Lock()
+
+
+def get_quota_ledger() -> Optional[QuotaLedger]:
+    """Process-wide ledger, or None when Config.QUOTA_LEDGER is disabled"""
+    global _shared_ledger
+
+    if not Config.QUOTA_LEDGER['enabled']:
+        return None
+
+    with _shared_lock:
+        if _shared_ledger is None:
+            _shared_ledger = QuotaLedger()
+        return _shared_ledger
@@ -0,0 +1,231 @@
+"""
+Request rate limiting for SmartDoc AI Agent
+One token bucket per API key and model, with adaptive (AIMD) rates. Buckets
+live in the shared quota ledger when it is enabled, so every server process
+draws from the same budget; otherwise they are process-local.
+"""
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict
+
+from config import Config, FREE_TIER_OPTIMIZATIONS
+from quota_ledger import QuotaLedger, api_key_id, get_quota_ledger
+
+
+class DailyQuotaExceeded(Exception):
+    """The model's requests-per-day quota is used up"""
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """True for quota / rate errors (HTTP 429, RESOURCE_EXHAUSTED)"""
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "quota" in message.lower()
+
+
+def model_limits(model_name: str) -> Dict[str, float]:
+    """Configured RPM and RPD for a model, less the free-tier safety buffer"""
+    limits = Config.get_rate_limits(model_name)
+    buffer = FREE_TIER_OPTIMIZATIONS['rate_limit_buffer']
+    return {
+        'rpm': limits['requests_per_minute'] / buffer,
+        'rpd': int(limits['requests_per_day'] / buffer)
+    }
+
+
+class RateLimiter:
+    """Thread-safe token-bucket limiter enforcing per-model RPM and RPD
+
+    `reserve` takes a token immediately and returns how long the caller must
+    wait before using it; the bucket may go negative, so concurrent callers
+    queue up in order instead of polling. `acquire` (blocking) and
+    `acquire_async` (awaitable) wait out the reservation.
+
+    Rates adapt: each throttling error halves the model's RPM, each success
+    adds back `additive_increase_rpm` up to the configured limit.
+    """
+
+    def __init__(self, burst: int = None, additive_increase_rpm: float = None,
+                 multiplicative_decrease: float = None, min_rpm: float = None, ledger: QuotaLedger = None):
+        settings = Config.RATE_LIMITER
+        self.burst = burst or settings['burst']
+        self.additive_increase_rpm = additive_increase_rpm or settings['additive_increase_rpm']
+        self.multiplicative_decrease = multiplicative_decrease or settings['multiplicative_decrease']
+        self.min_rpm = min_rpm or settings['min_rpm']
+        self.ledger = ledger
+        self._buckets = {}      # (key_id, model) -> state, when there is no ledger
+        self._lock = threading.Lock()
+
+    def _initial_state(self, model_name: str) -> Dict[str, Any]:
+        return {
+            'rpm': model_limits(model_name)['rpm'],
+            'tokens': float(self.burst),
+            'updated': time.time(),
+            'day': None,
+            'day_count': 0,
+            'throttled': 0
+        }
+
+    def _with_bucket(self, model_name: str, api_key: str, update: Callable[[Dict[str, Any]], Any]) -> Any:
+        model_name = model_name or Config.GEMINI_MODEL
+        key_id = api_key_id(api_key)
+
+        if self.ledger is not None:
+            return self.ledger.transact(key_id, model_name, lambda: self._initial_state(model_name), update)
+
+        with self._lock:
+            state = self._buckets.get((key_id, model_name))
+            if state is None:
+                state = self._buckets[(key_id, model_name)] = self._initial_state(model_name)
+            return update(state)
+
+    def _peek_bucket(self, model_name: str, api_key: str) -> Dict[str, Any]:
+        """Copy of a bucket's state for display and routing; never writes or takes the ledger lock"""
+        key_id = api_key_id(api_key)
+
+        if self.ledger is not None:
+            state = self.ledger.read(key_id, model_name)
+        else:
+            with self._lock:
+                state = self._buckets.get((key_id, model_name))
+                state = dict(state) if state is not None else None
+        return state if state is not None else self._initial_state(model_name)
+
+    def _refill(self, state: Dict[str, Any], now: float):
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(float(self.burst), state['tokens'] + elapsed * state['rpm'] / 60.0)
+        state['updated'] = now
+
+    def reserve(self, model_name: str = None, api_key: str = None) -> float:
+        """Claim the next request slot; returns seconds to wait before sending
+
+        Raises DailyQuotaExceeded when the day's requests are used up.
+        """
+        model_name = model_name or Config.GEMINI_MODEL
+        daily_limit = model_limits(model_name)['rpd']
+
+        def take(state):
+            today = datetime.now(timezone.utc).date().isoformat()
+            if state['day'] != today:
+                state['day'], state['day_count'] = today, 0
+            if state['day_count'] >= daily_limit:
+                raise DailyQuotaExceeded(f"Daily quota reached for {model_name} ({daily_limit} requests)")
+
+            self._refill(state, time.time())
+            state['tokens'] -= 1.0
+            state['day_count'] += 1
+            if state['tokens'] >= 0:
+                return 0.0
+            return -state['tokens'] * 60.0 / state['rpm']
+
+        return self._with_bucket(model_name, api_key, take)
+
+    def try_reserve(self, model_name: str = None, api_key: str = None) -> bool:
+        """Take a slot only if one is free right now (for optional, extra requests)"""
+        model_name = model_name or Config.GEMINI_MODEL
+        daily_limit = model_limits(model_name)['rpd']
+
+        def take_if_free(state):
+            self._refill(state, time.time())
+            today = datetime.now(timezone.utc).date().isoformat()
+            used_today = state['day_count'] if state['day'] == today else 0
+            if state['tokens'] < 1.0 or used_today >= daily_limit:
+                return False
+            state['day'], state['day_count'] = today, used_today + 1
+            state['tokens'] -= 1.0
+            return True
+
+        return self._with_bucket(model_name, api_key, take_if_free)
+
+    def release(self, model_name: str = None, api_key: str = None):
+        """Give back a slot taken by `reserve` for a request that was never sent"""
+        def refund(state):
+            today = datetime.now(timezone.utc).date().isoformat()
+            state['tokens'] = min(float(self.burst), state['tokens'] + 1.0)
+            if state['day'] == today and state['day_count'] > 0:
+                state['day_count'] -= 1
+
+        self._with_bucket(model_name, api_key, refund)
+
+    def headroom(self, model_name: str = None, api_key: str = None) -> Dict[str, float]:
+        """Seconds until the next free slot and requests left today, without taking a slot"""
+        model_name = model_name or Config.GEMINI_MODEL
+        daily_limit = model_limits(model_name)['rpd']
+
+        state = self._peek_bucket(model_name, api_key)
+        today = datetime.now(timezone.utc).date().isoformat()
+        elapsed = max(0.0, time.time() - state['updated'])
+        tokens = min(float(self.burst), state['tokens'] + elapsed * state['rpm'] / 60.0)
+        return {
+            'wait': max(0.0, (1.0 - tokens) * 60.0 / state['rpm']),
+            'remaining_today': daily_limit - (state['day_count'] if state['day'] == today else 0)
+        }
+
+    def acquire(self, model_name: str = None, api_key: str = None) -> float:
+        """Block until a request may be sent; returns the time waited"""
+        wait = self.reserve(model_name, api_key)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, model_name: str = None, api_key: str = None) -> float:
+        """Await a request slot without blocking the event loop"""
+        wait = self.reserve(model_name, api_key)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def report_success(self, model_name: str = None, api_key: str = None):
+        """Additive increase back towards the configured RPM"""
+        max_rpm = model_limits(model_name or Config.GEMINI_MODEL)['rpm']
+
+        def increase(state):
+            state['rpm'] = min(max_rpm, state['rpm'] + self.additive_increase_rpm)
+
+        self._with_bucket(model_name, api_key, increase)
+
+    def report_throttled(self, model_name: str = None, api_key: str = None):
+        """Multiplicative decrease after a 429 / RESOURCE_EXHAUSTED response"""
+        def decrease(state):
+            self._refill(state, time.time())
+            state['rpm'] = max(self.min_rpm, state['rpm'] * self.multiplicative_decrease)
+            state['throttled'] += 1
+            # Drop any burst so the next request waits for the slower rate
+            state['tokens'] = min(state['tokens'], 0.0)
+
+        self._with_bucket(model_name, api_key, decrease)
+
+    def report(self, model_name: str, error: Exception = None, api_key: str = None):
+        """Feed a call outcome back into the rate (None means success)"""
+        if error is None:
+            self.report_success(model_name, api_key)
+        elif is_throttle_error(error):
+            self.report_throttled(model_name, api_key)
+
+    def stats(self, model_name: str = None, api_key: str = None) -> Dict[str, float]:
+        model_name = model_name or Config.GEMINI_MODEL
+        limits = model_limits(model_name)
+        state = self._peek_bucket(model_name, api_key)
+        today = datetime.now(timezone.utc).date().isoformat()
+        return {
+            'rpm': state['rpm'],
+            'max_rpm': limits['rpm'],
+            'requests_today': state['day_count'] if state['day'] == today else 0,
+            'daily_limit': limits['rpd'],
+            'throttled': state['throttled']
+        }
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide rate limiter (backed by the shared quota ledger when enabled)"""
+    global _shared_limiter
+
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter(ledger=get_quota_ledger())
+        return _shared_limiter
@@ -0,0 +1,324 @@
+"""
+Resilient model calls for SmartDoc AI Agent
+Retries with jittered backoff, per-request deadlines, a circuit breaker per
+model and optional hedging of slow interactive requests
+"""
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from config import Config
+from quota_ledger import api_key_id
+from rate_limiter import DailyQuotaExceeded, RateLimiter, get_rate_limiter
+from scheduler import PRIORITY_NORMAL, get_scheduler
+
+T = TypeVar('T')
+
+# HTTP statuses of google.api_core errors, by the status names ERROR_RETRY_CONFIG uses
+_HTTP_STATUS_NAMES = {429: 'RESOURCE_EXHAUSTED', 503: 'UNAVAILABLE', 504: 'DEADLINE_EXCEEDED'}
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before a response was received"""
+
+
+class CircuitOpenError(Exception):
+    """Calls to the model are paused because the backend keeps failing"""
+
+    def __init__(self, model_name: str, retry_in: float):
+        super().__init__(f"Circuit open for {model_name}; retry in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+def error_status(error: Exception) -> str:
+    """Status name of an API error (e.g. 'UNAVAILABLE'), or '' if unknown"""
+    grpc_code = getattr(error, 'grpc_status_code', None)
+    if grpc_code is not None:
+        return grpc_code.name
+    return _HTTP_STATUS_NAMES.get(getattr(error, 'code', None), '')
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient errors listed in Config.ERROR_RETRY_CONFIG['retry_on_errors']"""
+    retry_on = Config.ERROR_RETRY_CONFIG['retry_on_errors']
+    status = error_status(error)
+    message = str(error)
+    return status in retry_on or any(name in message for name in retry_on)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker
+
+    After `failure_threshold` transient failures in a row the circuit opens
+    and calls fail fast for `reset_seconds`. Then one trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, model_name: str, failure_threshold: int = None, reset_seconds: float = None):
+        self.model_name = model_name
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_BREAKER['failure_threshold']
+        self.reset_seconds = reset_seconds or Config.CIRCUIT_BREAKER['reset_seconds']
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(self.model_name, retry_in)
+
+    def cancel_trial(self):
+        """A let-through call never reached the backend"""
+        with self._lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for picking a hedging delay"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_registry_lock = threading.Lock()
+_hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="smartdoc-hedge")
+
+
+def get_circuit_breaker(model_name: str) -> CircuitBreaker:
+    """Process-wide breaker for a model"""
+    with _registry_lock:
+        if model_name not in _breakers:
+            _breakers[model_name] = CircuitBreaker(model_name)
+        return _breakers[model_name]
+
+
+def get_latency_tracker(model_name: str) -> LatencyTracker:
+    """Process-wide latency history for a model"""
+    with _registry_lock:
+        if model_name not in _latencies:
+            _latencies[model_name] = LatencyTracker()
+        return _latencies[model_name]
+
+
+class ResilientExecutor:
+    """Run model calls with rate limiting, retries, a deadline and a circuit breaker
+
+    `call(timeout, api_key)` makes one attempt with the given key and must
+    give up after `timeout` seconds (pass it on as the API request
+    timeout). Each attempt is routed to the key pool's key with the most
+    headroom and takes a slot from the shared rate limiter, retries and
+    hedges included. A failure specific to one key (auth, quota) fails
+    over to another key straight away. With the priority queue enabled,
+    attempts claim their slot through the shared scheduler, so higher
+    priority requests go first.
+    """
+
+    def __init__(self, model_name: str, key_pool, rate_limiter: RateLimiter = None):
+        settings = Config.ERROR_RETRY_CONFIG
+        self.model_name = model_name
+        self.key_pool = key_pool
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.breaker = get_circuit_breaker(model_name)
+        self.latencies = get_latency_tracker(model_name)
+        self.scheduler = get_scheduler()
+        # Requests for the same model and keys queue together
+        self.lane = (model_name, tuple(api_key_id(key) for key in key_pool.api_keys))
+        self.max_retries = settings['max_retries']
+        self.retry_delay = settings['retry_delay']
+        self.max_delay = settings['max_delay']
+        self.exponential_backoff = settings['exponential_backoff']
+        self.deadline_seconds = settings['deadline_seconds']
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter delay before retry number `attempt` (1-based)"""
+        ceiling = self.retry_delay * (2 ** (attempt - 1) if self.exponential_backoff else 1)
+        return random.uniform(0, min(self.max_delay, ceiling))
+
+    def _reserve(self, deadline: float) -> Tuple[str, float]:
+        """Pick a key and claim a slot on it; returns (api_key, seconds to wait)"""
+        for _ in range(len(self.key_pool)):
+            api_key = self.key_pool.select()
+            try:
+                slot_wait = self.rate_limiter.reserve(self.model_name, api_key)
+            except DailyQuotaExceeded as e:
+                # This key is done for the day; try the next one
+                self.key_pool.report(api_key, e)
+                continue
+            if time.monotonic() + slot_wait >= deadline:
+                # The request will not be sent, so its slot and daily count go back
+                self.rate_limiter.release(self.model_name, api_key)
+                raise DeadlineExceeded(f"Request deadline reached while waiting {slot_wait:.0f}s for quota")
+            return api_key, slot_wait
+        raise DailyQuotaExceeded(f"Daily quota reached for {self.model_name} on every API key")
+
+    def _claim_slot(self, deadline: float, priority: str) -> Tuple[str, float]:
+        if self.scheduler is None:
+            return self._reserve(deadline)
+
+        claimed = self.scheduler.run_in_turn(
+            priority, self.key_pool.next_slot_wait, lambda: self._reserve(deadline),
+            timeout=max(0.0, deadline - time.monotonic()), lane=self.lane
+        )
+        if claimed is None:
+            raise DeadlineExceeded("Request deadline reached while queued for quota")
+        return claimed
+
+    def run(self, call: Callable[[float, str], T], deadline_seconds: float = None, hedge: bool = False,
+            wait: Callable[[float], None] = time.sleep, priority: str = PRIORITY_NORMAL) -> T:
+        """Call with retries until success, a permanent error or the deadline
+
+        `wait(seconds)` performs rate-limit waits, so a UI can show them.
+        `priority` is the scheduler class (interactive, normal or background).
+        """
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        attempt = 0
+        failovers = 0
+
+        while True:
+            self.breaker.before_call()
+
+            try:
+                api_key, slot_wait = self._claim_slot(deadline, priority)
+            except Exception:
+                self.breaker.cancel_trial()
+                raise
+            if slot_wait > 0:
+                wait(slot_wait)
+
+            started = time.monotonic()
+            try:
+                if hedge:
+                    # The backup copy may have answered, on its own key
+                    result, api_key = self._hedged_call(call, api_key, deadline)
+                else:
+                    result = call(max(0.1, deadline - started), api_key)
+            except Exception as e:
+                self.rate_limiter.report(self.model_name, e, api_key=api_key)
+                if self.key_pool.report(api_key, e) and failovers < len(self.key_pool) \
+                        and self.key_pool.has_usable_key():
+                    # The key, not the backend, failed: switch keys without backing off
+                    failovers += 1
+                    self.breaker.cancel_trial()
+                    continue
+                if not is_retryable(e):
+                    # The backend answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+
+                attempt += 1
+                delay = self.backoff_delay(attempt)
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+                continue
+
+            self.rate_limiter.report(self.model_name, api_key=api_key)
+            self.key_pool.report(api_key)
+            self.breaker.record_success()
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+    def _hedged_call(self, call: Callable[[float, str], T], api_key: str, deadline: float) -> Tuple[T, str]:
+        """Send a second copy of a slow request and keep whichever answers first
+
+        The backup is only sent after the configured latency percentile has
+        passed and only if some key has a rate-limiter slot free immediately
+        (another key is preferred). Returns the result and the key that
+        served it. A copy that fails is reported against its own key; if both
+        fail, the primary's error is raised for the caller to report.
+        """
+        settings = Config.REQUEST_HEDGING
+        hedge_after = self.latencies.percentile(settings['percentile'], settings['min_samples'])
+
+        primary = _hedge_pool.submit(call, max(0.1, deadline - time.monotonic()), api_key)
+        if hedge_after is None:
+            return primary.result(), api_key
+
+        done, _ = wait_futures([primary], timeout=hedge_after)
+        if done or (self.scheduler is not None and self.scheduler.waiting(self.lane)):
+            # Never take quota from queued requests for a backup
+            return primary.result(), api_key
+
+        backup_key = self._free_key(prefer_not=api_key)
+        if backup_key is None:
+            return primary.result(), api_key
+
+        backup = _hedge_pool.submit(call, max(0.1, deadline - time.monotonic()), backup_key)
+        keys = {primary: api_key, backup: backup_key}
+        pending = {primary, backup}
+        failed = []
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in failed:
+                        self._report_failure(keys[loser], loser.exception())
+                    for loser in pending:
+                        # The slower copy is still running; its error, if any, belongs to its own key
+                        loser.add_done_callback(
+                            lambda f, key=keys[loser]: f.exception() and self._report_failure(key, f.exception())
+                        )
+                    return future.result(), keys[future]
+                failed.append(future)
+
+        self._report_failure(backup_key, backup.exception())
+        raise primary.exception()
+
+    def _report_failure(self, api_key: str, error: Exception):
+        """Record a failed copy of a hedged request against the key that sent it"""
+        self.rate_limiter.report(self.model_name, error, api_key=api_key)
+        self.key_pool.report(api_key, error)
+
+    def _free_key(self, prefer_not: str) -> Optional[str]:
+        keys = self.key_pool.usable_keys()
+        for key in sorted(keys, key=lambda k: k == prefer_not):
+            if self.rate_limiter.try_reserve(self.model_name, key):
+                return key
+        return None
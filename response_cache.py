@@ -0,0 +1,161 @@
+"""
+LLM response cache for SmartDoc AI Agent
+In-memory LRU in front of a persistent SQLite tier, shared by every session in the process
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import Config, FREE_TIER_OPTIMIZATIONS, get_environment_config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    cache_key   TEXT PRIMARY KEY,
+    model       TEXT NOT NULL,
+    mode        TEXT NOT NULL,
+    response    TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    expires_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+"""
+
+
+def make_response_key(model_name: str, mode: str, prompt: str) -> str:
+    """Cache key from model name, analysis mode and a hash of the rendered prompt"""
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    return hashlib.sha256(f"{model_name}|{mode}|{prompt_hash}".encode('utf-8')).hexdigest()
+
+
+def caching_enabled() -> bool:
+    """Response caching is on when both the environment and free-tier settings allow it"""
+    return bool(get_environment_config().get('cache_responses') and FREE_TIER_OPTIMIZATIONS.get('enable_caching'))
+
+
+class ResponseCache:
+    """Two-tier (memory + disk) response cache with TTL and LRU eviction"""
+
+    def __init__(self, path: str = None, ttl_seconds: int = None,
+                 memory_entries: int = None, disk_entries: int = None):
+        settings = Config.RESPONSE_CACHE
+        self.path = path or settings['path']
+        self.ttl_seconds = ttl_seconds or settings['ttl_seconds']
+        self.memory_entries = memory_entries or settings['memory_entries']
+        self.disk_entries = disk_entries or settings['disk_entries']
+        self._memory = OrderedDict()   # key -> (response, expires_at)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _remember(self, key: str, response: str, expires_at: float):
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response for a key, or None if missing or expired"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT response, expires_at FROM responses WHERE cache_key = ?", (key,)
+                ).fetchone()
+
+                if row is None or row[1] <= now:
+                    if row is not None:
+                        conn.execute("DELETE FROM responses WHERE cache_key = ?", (key,))
+                    self.misses += 1
+                    return None
+
+                conn.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (now, key))
+
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model_name: str = "", mode: str = "", ttl_seconds: int = None):
+        """Store a response in both tiers"""
+        now = time.time()
+        expires_at = now + (ttl_seconds or self.ttl_seconds)
+
+        with self._lock:
+            self._remember(key, response, expires_at)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(cache_key, model, mode, response, created_at, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, model_name, mode, response, now, expires_at, now)
+                )
+                self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.disk_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE cache_key IN "
+                "(SELECT cache_key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            disk_entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'memory_entries': len(self._memory),
+            'disk_entries': disk_entries
+        }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide response cache"""
+    global _shared_cache
+
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
@@ -0,0 +1,253 @@
+"""
+Multi-document retrieval for SmartDoc AI Agent
+Hybrid search: chunks of every processed document live in a FAISS vector index
+and a BM25 inverted index, fused with reciprocal rank fusion
+"""
+import re
+import math
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from chunking import iter_chunks, iter_pages_from_text
+from embeddings import BaseEmbedder
+
+try:
+    import faiss
+except ImportError:  # faiss-cpu is optional; fall back to exact NumPy search
+    faiss = None
+
+
+class VectorIndex:
+    """Inner-product index over normalized vectors (FAISS when available)"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._faiss = faiss.IndexFlatIP(dimension) if faiss is not None else None
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self._faiss.ntotal if self._faiss is not None else len(self._matrix)
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self._faiss is not None:
+            self._faiss.add(vectors)
+        else:
+            self._matrix = np.vstack([self._matrix, vectors])
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, positions) of the k nearest rows, best first"""
+        k = min(k, len(self))
+        if k <= 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        query = np.ascontiguousarray(query.reshape(1, -1), dtype=np.float32)
+        if self._faiss is not None:
+            scores, positions = self._faiss.search(query, k)
+            return scores[0], positions[0]
+
+        scores = self._matrix @ query[0]
+        positions = np.argpartition(-scores, k - 1)[:k]
+        positions = positions[np.argsort(-scores[positions], kind='stable')]
+        return scores[positions], positions
+
+
+# Keeps clause numbers ("4.2.1") and part codes ("AX-77") together as single terms
+_TERM = re.compile(r'[a-z0-9]+(?:[.\-/_][a-z0-9]+)*')
+_TERM_PART = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound terms are also indexed by their parts"""
+    terms = []
+    for match in _TERM.finditer(text.lower()):
+        term = match.group(0)
+        terms.append(term)
+        parts = _TERM_PART.findall(term)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """Incremental in-memory BM25 over chunk positions
+
+    Postings are compact typed arrays (chunk position, term frequency)
+    appended in position order, and are scored with NumPy views over them.
+    """
+
+    def __init__(self, k1: float = None, b: float = None):
+        self.k1 = k1 or Config.RETRIEVAL_CONFIG['bm25_k1']
+        self.b = Config.RETRIEVAL_CONFIG['bm25_b'] if b is None else b
+        self._postings = {}                 # term -> (array('I') positions, array('I') frequencies)
+        self._lengths = array('I')          # terms per chunk
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, text: str) -> int:
+        """Index one chunk; returns its position"""
+        position = len(self._lengths)
+        frequencies = {}
+        terms = tokenize(text)
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array('I'), array('I'))
+            postings[0].append(position)
+            postings[1].append(frequency)
+
+        self._lengths.append(len(terms))
+        self._total_length += len(terms)
+        return position
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for the query"""
+        count = len(self._lengths)
+        scores = np.zeros(count, dtype=np.float32)
+        if count == 0:
+            return scores
+
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / count))
+
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            positions = np.frombuffer(postings[0], dtype=np.uint32)
+            frequencies = np.frombuffer(postings[1], dtype=np.uint32).astype(np.float32)
+            df = len(positions)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            scores[positions] += idf * frequencies * (self.k1 + 1) / (frequencies + norm[positions])
+
+        return scores
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, positions) of the k best matching chunks, best first"""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return scores[matched], matched
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = None) -> List[Tuple[int, float]]:
+    """Fuse ranked lists of positions: score = sum over lists of 1 / (k + rank)"""
+    k = k or Config.RETRIEVAL_CONFIG['rrf_k']
+    fused = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            fused[position] = fused.get(position, 0.0) + 1.0 / (k + rank)
+
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))
+
+
+class DocumentRetriever:
+    """Chunk, embed and index processed documents; answer top-k queries across all of them"""
+
+    def __init__(self, embedder: BaseEmbedder, top_k: int = None):
+        self.embedder = embedder
+        self.top_k = top_k or Config.RETRIEVAL_CONFIG['top_k']
+        self.index = VectorIndex(embedder.dimension)
+        self.lexical = BM25Index()
+        self.chunks = []        # aligned with index positions
+        self.documents = {}     # doc_id -> {'name', 'chunk_count'}
+        self._lock = threading.Lock()
+
+    def has_document(self, doc_id: str) -> bool:
+        return doc_id in self.documents
+
+    def index_document(self, doc_id: str, name: str, text: str) -> int:
+        """Chunk, embed and BM25-index one document's text (page headers preserved)
+
+        Returns the number of chunks added. Every batch is embedded before
+        anything is added, so a failed embedding call leaves the indexes
+        untouched and the document can simply be indexed again.
+        """
+        with self._lock:
+            if doc_id in self.documents:
+                return self.documents[doc_id]['chunk_count']
+
+            chunks = []
+            for chunk in iter_chunks(iter_pages_from_text(text), doc_id):
+                chunk['doc_name'] = name
+                chunks.append(chunk)
+
+            batch_size = Config.RETRIEVAL_CONFIG['embedding_batch_size']
+            vectors = [
+                self.embedder.embed_documents([chunk['text'] for chunk in chunks[start:start + batch_size]])
+                for start in range(0, len(chunks), batch_size)
+            ]
+
+            if chunks:
+                self.index.add(np.concatenate(vectors))
+                for chunk in chunks:
+                    self.lexical.add(chunk['text'])
+                self.chunks.extend(chunks)
+            self.documents[doc_id] = {'name': name, 'chunk_count': len(chunks)}
+            return len(chunks)
+
+    def search(self, question: str, k: int = None, doc_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Top-k chunks for a question by hybrid vector + BM25 ranking
+
+        Each result is a chunk dict with added 'score' (fused), 'vector_score'
+        and 'bm25_score' (None when the chunk was not in that ranking).
+        """
+        if not self.chunks:
+            return []
+
+        k = k or self.top_k
+        pool = min(len(self.chunks), max(k, Config.RETRIEVAL_CONFIG['candidate_pool']))
+        if doc_ids is not None:
+            # Over-fetch when filtering to a subset of documents
+            pool = min(len(self.chunks), pool * 4)
+
+        vector_scores, vector_positions = self.index.search(self.embedder.embed_query(question), pool)
+        bm25_scores, bm25_positions = self.lexical.search(question, pool)
+
+        def ranking(positions):
+            return [int(p) for p in positions
+                    if p >= 0 and (doc_ids is None or self.chunks[p]['doc_id'] in doc_ids)]
+
+        vector_by_position = dict(zip(vector_positions.tolist(), vector_scores.tolist()))
+        bm25_by_position = dict(zip(bm25_positions.tolist(), bm25_scores.tolist()))
+
+        results = []
+        for position, score in reciprocal_rank_fusion([ranking(vector_positions), ranking(bm25_positions)])[:k]:
+            results.append(dict(
+                self.chunks[position],
+                score=score,
+                vector_score=vector_by_position.get(position),
+                bm25_score=bm25_by_position.get(position)
+            ))
+
+        return results
+
+    def clear(self):
+        with self._lock:
+            self.index = VectorIndex(self.embedder.dimension)
+            self.lexical = BM25Index()
+            self.chunks = []
+            self.documents = {}
+
+
+def format_context(chunks: List[Dict[str, Any]]) -> str:
+    """Render retrieved chunks as prompt context with document and page provenance"""
+    sections = []
+    for chunk in chunks:
+        pages = str(chunk['page_start'])
+        if chunk['page_end'] != chunk['page_start']:
+            pages += f"-{chunk['page_end']}"
+        sections.append(f"[DOCUMENT: {chunk.get('doc_name', chunk['doc_id'])} | PAGE {pages}]\n{chunk['text']}")
+
+    return "\n\n---\n\n".join(sections)
@@ -0,0 +1,123 @@
+"""
+Priority scheduling of model calls for SmartDoc AI Agent
+User-facing requests go ahead of batch work; waiting requests age so none starve
+"""
+import time
+import itertools
+import threading
+from typing import Callable, Hashable, Optional, TypeVar
+
+from config import Config, FREE_TIER_OPTIMIZATIONS
+
+T = TypeVar('T')
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_NORMAL = 'normal'
+PRIORITY_BACKGROUND = 'background'
+
+_LEVELS = {PRIORITY_INTERACTIVE: 0, PRIORITY_NORMAL: 1, PRIORITY_BACKGROUND: 2}
+
+
+class PriorityScheduler:
+    """Hands out request slots in priority order
+
+    Waiting requests queue per lane, one lane per model and set of API
+    keys, so a throttled key or model only holds up its own requests. Only
+    the head of a lane may claim a slot, and it does so only once quota is
+    actually free, so a batch cannot book the limiter far ahead of a chat
+    question that arrives later. A request's effective level improves by
+    one class for every `aging_seconds` it has waited, so background work
+    still progresses under constant chat load.
+    """
+
+    def __init__(self, aging_seconds: float = None, poll_seconds: float = None):
+        settings = Config.SCHEDULER
+        self.aging_seconds = aging_seconds or settings['aging_seconds']
+        self.poll_seconds = poll_seconds or settings['poll_seconds']
+        self._lanes = {}        # lane -> {ticket: (level, enqueued_at)}
+        self._busy = set()      # lanes whose head is checking or claiming quota
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+
+    def _head(self, lane: Hashable, now: float) -> Optional[int]:
+        queue = self._lanes.get(lane)
+        if not queue:
+            return None
+        return min(queue, key=lambda ticket: (queue[ticket][0] - (now - queue[ticket][1]) / self.aging_seconds, ticket))
+
+    def _take_turn(self, lane: Hashable, ticket: int) -> bool:
+        with self._cond:
+            if lane in self._busy or self._head(lane, time.monotonic()) != ticket:
+                return False
+            self._busy.add(lane)
+            return True
+
+    def _end_turn(self, lane: Hashable):
+        with self._cond:
+            self._busy.discard(lane)
+            self._cond.notify_all()
+
+    def waiting(self, lane: Hashable = None) -> int:
+        """Requests queued in one lane, or in all of them"""
+        with self._cond:
+            if lane is not None:
+                return len(self._lanes.get(lane, ()))
+            return sum(len(queue) for queue in self._lanes.values())
+
+    def run_in_turn(self, priority: str, capacity_wait: Callable[[], float], claim: Callable[[], T],
+                    timeout: float = None, lane: Hashable = None) -> Optional[T]:
+        """Wait until this request heads its lane and quota is free, then run `claim`
+
+        `capacity_wait()` returns seconds until the lane's quota frees up;
+        `claim()` takes the slot. Both run outside the queue lock (they may
+        touch the quota ledger), one lane head at a time. Returns claim's
+        result, or None if `timeout` seconds pass first.
+        """
+        ticket = next(self._tickets)
+        started = time.monotonic()
+
+        with self._cond:
+            self._lanes.setdefault(lane, {})[ticket] = (_LEVELS[priority], started)
+        try:
+            while True:
+                pause = self.poll_seconds
+                if self._take_turn(lane, ticket):
+                    try:
+                        pause = capacity_wait()
+                        if pause <= 0:
+                            return claim()
+                    finally:
+                        self._end_turn(lane)
+
+                if timeout is not None:
+                    remaining = started + timeout - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    pause = min(pause, remaining)
+                with self._cond:
+                    # Others re-check on notify; aging can change the head, so everyone polls too
+                    self._cond.wait(timeout=min(pause, self.poll_seconds))
+        finally:
+            with self._cond:
+                queue = self._lanes[lane]
+                del queue[ticket]
+                if not queue:
+                    del self._lanes[lane]
+                self._cond.notify_all()
+
+
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[PriorityScheduler]:
+    """Process-wide scheduler, or None when the priority queue is disabled"""
+    global _shared_scheduler
+
+    if not FREE_TIER_OPTIMIZATIONS.get('priority_queue'):
+        return None
+
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = PriorityScheduler()
+        return _shared_scheduler
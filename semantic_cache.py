@@ -0,0 +1,118 @@
+"""
+Semantic cache for chat questions in SmartDoc AI Agent
+Reuses answers to near-identical questions asked against the same document set
+"""
+import re
+import time
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import Config
+from embeddings import BaseEmbedder
+
+_WORD = re.compile(r'[a-z0-9]+(?:[.\-/][a-z0-9]+)*')
+_STOPWORDS = frozenset("""
+a an and are as at be by can could did do does for from give has have i in is it its
+me of on or please say show tell that the their there these this those to was were
+will with would you your about main key
+""".split())
+# "When did it start?" and "Why did it start?" differ only in these, so they must match exactly
+_QUESTION_WORDS = frozenset("how what when where which who whom whose why".split())
+
+
+def normalize_question(question: str) -> str:
+    """Lowercased content words only, so phrasing differences don't matter"""
+    words = [w for w in _WORD.findall(question.lower()) if w not in _STOPWORDS]
+    return " ".join(words) or question.lower().strip()
+
+
+def _exact_terms(question: str) -> frozenset:
+    """Terms that must match exactly: question words, and anything containing a digit (clauses, codes, years)"""
+    return frozenset(w for w in _WORD.findall(question.lower())
+                     if w in _QUESTION_WORDS or any(c.isdigit() for c in w))
+
+
+def document_set_key(doc_ids: List[str]) -> str:
+    """Identity of a set of documents, independent of order"""
+    return hashlib.sha256("\n".join(sorted(doc_ids)).encode('utf-8')).hexdigest()
+
+
+class SemanticCache:
+    """Question-embedding cache bound to one document set
+
+    A lookup returns a stored answer when a previous question is at least
+    `threshold` cosine-similar and mentions the same numbers and codes.
+    Binding to a different document set drops every entry.
+    """
+
+    def __init__(self, embedder: BaseEmbedder, threshold: float = None, max_entries: int = None):
+        self.embedder = embedder
+        self.threshold = threshold or Config.SEMANTIC_CACHE['threshold']
+        self.max_entries = max_entries or Config.SEMANTIC_CACHE['max_entries']
+        self.doc_set_key = None
+        self._vectors = np.zeros((0, embedder.dimension), dtype=np.float32)
+        self._entries = []      # aligned with _vectors rows
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def bind(self, doc_set_key: str):
+        """Attach the cache to a document set, invalidating it if the set changed"""
+        with self._lock:
+            if doc_set_key != self.doc_set_key:
+                if self._entries:
+                    self.invalidations += 1
+                self.doc_set_key = doc_set_key
+                self._vectors = np.zeros((0, self.embedder.dimension), dtype=np.float32)
+                self._entries = []
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """Stored entry for a similar enough question, with its 'similarity', or None"""
+        vector = self.embedder.embed_query(normalize_question(question))
+        exact = _exact_terms(question)
+
+        with self._lock:
+            if self._entries:
+                similarities = self._vectors @ vector
+                for row in np.argsort(-similarities):
+                    if similarities[row] < self.threshold:
+                        break
+                    entry = self._entries[row]
+                    if entry['exact_terms'] == exact:
+                        entry['last_used'] = time.time()
+                        entry['hits'] += 1
+                        self.hits += 1
+                        return dict(entry, similarity=float(similarities[row]))
+
+            self.misses += 1
+            return None
+
+    def store(self, question: str, answer: str, **extra):
+        """Remember an answer (extra fields such as sources are returned on a hit)"""
+        vector = self.embedder.embed_query(normalize_question(question))
+        entry = dict(extra, question=question, answer=answer, exact_terms=_exact_terms(question),
+                     last_used=time.time(), hits=0)
+
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Replace the least recently used entry
+                row = min(range(len(self._entries)), key=lambda i: self._entries[i]['last_used'])
+                self._vectors[row] = vector
+                self._entries[row] = entry
+            else:
+                self._vectors = np.vstack([self._vectors, vector.reshape(1, -1)])
+                self._entries.append(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations
+        }
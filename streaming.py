@@ -0,0 +1,47 @@
+"""
+Streaming model responses for SmartDoc AI Agent
+Renders text as it is generated while assembling the full response
+"""
+from typing import Callable
+
+from config import Config
+
+
+class StreamInterrupted(Exception):
+    """The response stream failed after text was already shown"""
+
+    def __init__(self, partial_text: str, error: Exception):
+        super().__init__(f"Response stream interrupted after {len(partial_text)} characters: {type(error).__name__}")
+        self.partial_text = partial_text
+        self.error = error
+
+
+def streaming_enabled() -> bool:
+    return Config.STREAM_RESPONSES
+
+
+def stream_text(model, prompt: str, on_partial: Callable[[str], None], timeout: float = None) -> str:
+    """Call generate_content(stream=True), reporting the text so far after every chunk
+
+    Returns the assembled text. Errors before the first chunk propagate
+    unchanged (so they can be retried); errors after it become
+    StreamInterrupted, because a retry would repeat text already shown.
+    """
+    request_options = {'timeout': timeout} if timeout else None
+    parts = []
+    try:
+        for chunk in model.generate_content(prompt, stream=True, request_options=request_options):
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk without text parts (e.g. only finish / safety metadata)
+                continue
+            if text:
+                parts.append(text)
+                on_partial("".join(parts))
+    except Exception as e:
+        if parts:
+            raise StreamInterrupted("".join(parts), e) from e
+        raise
+
+    return "".join(parts)
@@ -0,0 +1,213 @@
+"""
+Map-reduce summarization for SmartDoc AI Agent
+Summarizes documents that do not fit one request section by section, then
+merges the partial summaries until they do
+"""
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from batch_engine import BatchAnalysisEngine
+from chunking import iter_chunks, iter_pages_from_text
+from context_packer import context_budget
+from response_cache import ResponseCache, caching_enabled, make_response_key
+
+_SEPARATOR = "\n\n---\n\n"
+
+
+def _section_label(name: str, page_start: Optional[int] = None, page_end: Optional[int] = None) -> str:
+    if page_start is None:
+        return name
+    pages = f"p.{page_start}" if page_end == page_start else f"pp.{page_start}-{page_end}"
+    return f"{name} {pages}"
+
+
+def split_sections(documents: List[Tuple[str, str, str]], budget: int) -> List[Dict[str, Any]]:
+    """Cut (doc_id, name, text) documents into sections of at most `budget` characters
+
+    A document that fits is one section. Longer ones are split on chunk
+    (sentence / page) boundaries without overlap, so no text is sent twice.
+    """
+    sections = []
+    for doc_id, name, text in documents:
+        text = text.strip()
+        if not text:
+            continue
+        if len(text) <= budget:
+            sections.append({'label': _section_label(name), 'text': text})
+            continue
+
+        current = []
+        size = 0
+
+        def flush():
+            sections.append({
+                'label': _section_label(name, current[0]['page_start'], current[-1]['page_end']),
+                'text': "\n\n".join(chunk['text'] for chunk in current)
+            })
+
+        for chunk in iter_chunks(iter_pages_from_text(text), doc_id, chunk_overlap=0):
+            if current and size + 2 + len(chunk['text']) > budget:
+                flush()
+                current, size = [], 0
+            current.append(chunk)
+            size += len(chunk['text']) + (2 if size else 0)
+        if current:
+            flush()
+
+    return sections
+
+
+def map_prompt(label: str, text: str, words: int) -> str:
+    return f"""
+Summarize this section of a longer document set in at most {words} words.
+
+**Keep:**
+- Main topics and arguments
+- Key findings, conclusions and recommendations
+- Specific figures, dates and names
+
+**Section:** {label}
+
+**Content:**
+{text}
+
+**Format:** Concise bullet points, no introduction.
+"""
+
+
+def reduce_prompt(summaries: str, words: int) -> str:
+    return f"""
+Merge these partial summaries of consecutive sections into one summary of at most {words} words.
+
+**Requirements:**
+- Combine overlapping points and keep the order of the material
+- Keep specific figures, dates and names
+- Say which document (and pages) each point comes from
+
+**Partial Summaries:**
+{summaries}
+
+**Format:** Concise bullet points, no introduction.
+"""
+
+
+class MapReduceSummarizer:
+    """Reduce any number of documents to summary notes that fit one request
+
+    Map: every section is summarized independently, concurrently, through
+    the batch engine (so every call still takes its own rate-limit slot).
+    Reduce: consecutive partial summaries are grouped up to `fan_in` per
+    request and merged, level by level, until all of them fit `budget`.
+    Every intermediate summary goes through the response cache, so a repeat
+    run (or a retry after one failed call) only pays for what is missing.
+
+    `generate(prompt) -> str` is a blocking model call that may run in
+    worker threads.
+    """
+
+    def __init__(self, generate: Callable[[str], str], model_name: str, budget: int = None,
+                 max_concurrency: int = None, cache: ResponseCache = None):
+        settings = Config.MAP_REDUCE_SUMMARY
+        self.generate = generate
+        self.model_name = model_name
+        self.budget = budget or context_budget(model_name)
+        self.max_concurrency = max_concurrency
+        self.cache = cache if caching_enabled() else None
+        self.section_words = settings['section_summary_words']
+        self.fan_in = max(2, settings['fan_in'])
+        self.max_levels = settings['max_levels']
+        self.calls = 0
+        self.cache_hits = 0
+
+    async def run_prompts(self, mode: str, prompts: List[str],
+                          on_progress: Callable[[str, int, int], None] = None) -> List[str]:
+        """Results for prompts in order; raises the first error once all calls finish"""
+        results = [None] * len(prompts)
+        jobs = []
+        for index, prompt in enumerate(prompts):
+            cache_key = make_response_key(self.model_name, mode, prompt)
+            cached = self.cache.get(cache_key) if self.cache is not None else None
+            if cached is not None:
+                results[index] = cached
+                self.cache_hits += 1
+            else:
+                jobs.append({'index': index, 'prompt': prompt, 'cache_key': cache_key})
+
+        done = len(prompts) - len(jobs)
+        if on_progress is not None:
+            on_progress(mode, done, len(prompts))
+
+        first_error = None
+        engine = BatchAnalysisEngine(self.generate, max_concurrency=self.max_concurrency)
+        async for job in engine.run(jobs):
+            self.calls += 1
+            done += 1
+            if job['error'] is not None:
+                first_error = first_error or job['error']
+            else:
+                results[job['index']] = job['result']
+                if self.cache is not None:
+                    self.cache.put(job['cache_key'], job['result'], self.model_name, mode)
+            if on_progress is not None:
+                on_progress(mode, done, len(prompts))
+
+        if first_error is not None:
+            # Completed sections are cached, so a retry resumes from here
+            raise first_error
+        return results
+
+    def groups(self, notes: List[str]) -> List[List[str]]:
+        """Consecutive notes in groups of at most `fan_in` that fit the budget"""
+        groups, current, size = [], [], 0
+        for note in notes:
+            cost = len(note) + (len(_SEPARATOR) if current else 0)
+            if current and (len(current) >= self.fan_in or size + cost > self.budget):
+                groups.append(current)
+                current, size = [], 0
+                cost = len(note)
+            current.append(note)
+            size += cost
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _reduce_async(self, documents: List[Tuple[str, str, str]],
+                            on_progress: Callable[[str, int, int], None] = None) -> Dict[str, Any]:
+        sections = split_sections(documents, self.budget)
+        whole = _SEPARATOR.join(f"[DOCUMENT: {section['label']}]\n{section['text']}" for section in sections)
+        if len(whole) <= self.budget:
+            return {'text': whole, 'sections': len(sections), 'levels': 0}
+
+        summaries = await self.run_prompts(
+            'summary-map',
+            [map_prompt(section['label'], section['text'], self.section_words) for section in sections],
+            on_progress
+        )
+        notes = [f"[SUMMARY: {section['label']}]\n{summary.strip()}" for section, summary in zip(sections, summaries)]
+
+        levels = 1
+        while len(_SEPARATOR.join(notes)) > self.budget and levels <= self.max_levels:
+            groups = self.groups(notes)
+            merged = await self.run_prompts(
+                'summary-reduce',
+                [reduce_prompt(_SEPARATOR.join(group), self.section_words * 2) for group in groups],
+                on_progress
+            )
+            notes = [f"[SUMMARY: part {index + 1} of {len(merged)}]\n{text.strip()}" for index, text in enumerate(merged)]
+            levels += 1
+
+        text = _SEPARATOR.join(notes)
+        return {'text': text[:self.budget], 'sections': len(sections), 'levels': levels}
+
+    def reduce(self, documents: List[Tuple[str, str, str]],
+               on_progress: Callable[[str, int, int], None] = None) -> Dict[str, Any]:
+        """Text covering every document within the budget
+
+        Documents that fit together are returned whole without any model
+        call. `on_progress(stage, done, total)` reports each finished call.
+        Returns a dict with 'text', the number of 'sections' mapped, the
+        merge 'levels' used, plus 'calls' made and 'cache_hits'.
+        """
+        result = asyncio.run(self._reduce_async(documents, on_progress))
+        return dict(result, calls=self.calls, cache_hits=self.cache_hits)
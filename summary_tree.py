@@ -0,0 +1,186 @@
+"""
+Hierarchical document summaries for SmartDoc AI Agent
+Builds a chunk -> section -> document summary tree once per document
+fingerprint and keeps it in SQLite, so later analyses can send summaries
+instead of the full text
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from config import Config
+from summarization import MapReduceSummarizer, map_prompt, reduce_prompt, split_sections
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summary_trees (
+    tree_key    TEXT PRIMARY KEY,
+    doc_id      TEXT NOT NULL,
+    tree        TEXT NOT NULL,
+    size_bytes  INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summary_trees_last_access ON summary_trees (last_access);
+"""
+
+_SEPARATOR = "\n\n---\n\n"
+
+
+def make_tree_key(doc_id: str, model_name: str) -> str:
+    """Tree key from the document id (fingerprint and page window), model and tree settings"""
+    settings = Config.SUMMARY_TREE
+    settings_blob = json.dumps(
+        {'leaf_chars': settings['leaf_chars'], 'fan_in': settings['fan_in'], 'words': settings['summary_words']},
+        sort_keys=True
+    )
+    return hashlib.sha256(f"{doc_id}|{model_name}|{settings_blob}".encode('utf-8')).hexdigest()
+
+
+def _span_label(first: str, last: str) -> str:
+    return first if first == last else f"{first} to {last}"
+
+
+def render_nodes(nodes: List[Dict[str, str]]) -> str:
+    return _SEPARATOR.join(f"[SUMMARY: {node['label']}]\n{node['text']}" for node in nodes)
+
+
+class SummaryTreeBuilder:
+    """Summarize one document bottom-up into a tree of summaries
+
+    Leaves summarize consecutive sections of about `leaf_chars` of text;
+    each higher level merges up to `fan_in` summaries of the level below,
+    until a single document summary remains. Calls run concurrently through
+    a MapReduceSummarizer and its response cache.
+    """
+
+    def __init__(self, summarizer: MapReduceSummarizer):
+        settings = Config.SUMMARY_TREE
+        self.summarizer = summarizer
+        self.leaf_chars = settings['leaf_chars']
+        self.fan_in = max(2, settings['fan_in'])
+        self.words = settings['summary_words']
+
+    async def _build_async(self, doc_id: str, name: str, text: str,
+                           on_progress: Callable[[str, int, int], None] = None) -> Dict[str, Any]:
+        sections = split_sections([(doc_id, name, text)], self.leaf_chars)
+        summaries = await self.summarizer.run_prompts(
+            'tree-leaf',
+            [map_prompt(section['label'], section['text'], self.words) for section in sections],
+            on_progress
+        )
+        level = [{'label': section['label'], 'first': section['label'], 'last': section['label'], 'text': summary.strip()}
+                 for section, summary in zip(sections, summaries)]
+        levels = [level]
+
+        while len(level) > 1:
+            groups = [level[i:i + self.fan_in] for i in range(0, len(level), self.fan_in)]
+            merged = await self.summarizer.run_prompts(
+                'tree-merge',
+                [reduce_prompt(render_nodes(group), self.words * 2) for group in groups],
+                on_progress
+            )
+            level = [{'label': _span_label(group[0]['first'], group[-1]['last']), 'first': group[0]['first'],
+                      'last': group[-1]['last'], 'text': summary.strip()}
+                     for group, summary in zip(groups, merged)]
+            levels.append(level)
+
+        return {'doc_id': doc_id, 'name': name, 'source_chars': len(text), 'levels': levels}
+
+    def build(self, doc_id: str, name: str, text: str,
+              on_progress: Callable[[str, int, int], None] = None) -> Dict[str, Any]:
+        """Tree dict with doc_id, name, source_chars and 'levels' (leaves first, document summary last)"""
+        return asyncio.run(self._build_async(doc_id, name, text, on_progress))
+
+
+def tree_context(tree: Dict[str, Any], budget: int) -> Optional[str]:
+    """Most detailed level of a tree that fits `budget` characters
+
+    Falls back to the single document summary, which is short by
+    construction. Returns None for an empty tree.
+    """
+    if not tree or not tree.get('levels'):
+        return None
+    for level in tree['levels']:
+        text = render_nodes(level)
+        if len(text) <= budget:
+            return text
+    return render_nodes(tree['levels'][-1])
+
+
+class SummaryTreeStore:
+    """SQLite-backed store of summary trees with size-bounded LRU eviction"""
+
+    def __init__(self, path: str = None, max_bytes: int = None):
+        self.path = path or Config.SUMMARY_TREE['path']
+        self.max_bytes = max_bytes or Config.SUMMARY_TREE['max_bytes']
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT tree FROM summary_trees WHERE tree_key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE summary_trees SET last_access = ? WHERE tree_key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, tree: Dict[str, Any]):
+        blob = json.dumps(tree)
+        size_bytes = len(blob.encode('utf-8'))
+        now = time.time()
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summary_trees "
+                "(tree_key, doc_id, tree, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tree['doc_id'], blob, size_bytes, now, now)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM summary_trees").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size_bytes in conn.execute(
+            "SELECT tree_key, size_bytes FROM summary_trees ORDER BY last_access ASC"
+        ).fetchall():
+            conn.execute("DELETE FROM summary_trees WHERE tree_key = ?", (key,))
+            total -= size_bytes
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM summary_trees")
+
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+
+def get_summary_tree_store() -> SummaryTreeStore:
+    """Process-wide summary tree store"""
+    global _shared_store
+
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = SummaryTreeStore()
+        return _shared_store
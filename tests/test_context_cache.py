@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+from context_cache import ContextCacheManager, ContextCacheUnavailable, LocalContextBackend, min_cache_tokens
+
+
+class EchoModel:
+    """Base model that answers with the prompt it was sent"""
+
+    def generate_content(self, prompt, **kwargs):
+        return prompt
+
+
+class FailingBackend(LocalContextBackend):
+    def __init__(self):
+        super().__init__()
+        self.attempts = 0
+
+    def create(self, api_key, model_name, content, ttl_seconds):
+        self.attempts += 1
+        raise RuntimeError("caching not supported for this key")
+
+
+class SlowBackend(LocalContextBackend):
+    """Backend whose uploads block until released and record whether the manager lock was held"""
+
+    def __init__(self):
+        super().__init__()
+        self.manager = None
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.locked_during_call = []
+
+    def create(self, api_key, model_name, content, ttl_seconds):
+        self.locked_during_call.append(self.manager._lock.locked())
+        self.started.set()
+        self.release.wait(5)
+        return super().create(api_key, model_name, content, ttl_seconds)
+
+
+@pytest.fixture
+def manager():
+    return ContextCacheManager(backend=LocalContextBackend(), ttl_seconds=60, refresh_margin_seconds=10,
+                               max_entries=2)
+
+
+def test_handle_is_created_once_and_reused(manager):
+    first = manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash")
+    second = manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash")
+
+    assert second is first
+    assert first['model_name'] == "gemini-1.5-flash"
+    assert manager.stats()['created'] == 1 and manager.stats()['reused'] == 1
+
+
+def test_handles_are_per_key_and_model(manager):
+    first = manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash")
+    assert manager.handle("docs", "DOCUMENTS", "other-key", "gemini-1.5-flash") is not first
+    assert manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-pro") is not first
+
+
+def test_model_answers_against_cached_content(manager):
+    handle = manager.handle("docs", "DOCUMENTS|", "key", "gemini-1.5-flash")
+    assert manager.model(handle, EchoModel()).generate_content("question") == "DOCUMENTS|question"
+
+
+def test_handle_near_expiry_is_refreshed(manager):
+    handle = manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash")
+    handle['expires_at'] = time.time() + 5
+
+    assert manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash") is handle
+    assert handle['expires_at'] > time.time() + 50
+    assert manager.stats()['refreshed'] == 1
+
+
+def test_least_recently_used_handle_is_deleted_upstream(manager):
+    oldest = manager.handle("a", "A", "key", "gemini-1.5-flash")
+    manager.handle("b", "B", "key", "gemini-1.5-flash")
+    manager.handle("c", "C", "key", "gemini-1.5-flash")
+
+    assert manager.stats()['entries'] == 2 and manager.stats()['evicted'] == 1
+    with pytest.raises(ContextCacheUnavailable):
+        manager.model(oldest, EchoModel())
+
+
+def test_invalidated_handle_is_recreated(manager):
+    handle = manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash")
+    manager.invalidate(handle)
+    manager.invalidate(handle)
+
+    assert manager.stats()['evicted'] == 1
+    assert manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash") is not handle
+
+
+def test_failed_creation_is_not_retried_during_backoff():
+    backend = FailingBackend()
+    manager = ContextCacheManager(backend=backend)
+
+    for _ in range(3):
+        with pytest.raises(ContextCacheUnavailable):
+            manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash")
+    assert backend.attempts == 1
+
+
+def test_concurrent_requests_share_one_upload_made_outside_the_lock():
+    backend = SlowBackend()
+    manager = backend.manager = ContextCacheManager(backend=backend, ttl_seconds=60)
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(
+        manager.handle("docs", "DOCUMENTS", "key", "gemini-1.5-flash"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+
+    assert backend.started.wait(5)
+    # The manager stays usable while the upload is in flight
+    assert manager.stats()['entries'] == 0
+    backend.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert backend.locked_during_call == [False]
+    assert len(handles) == 3 and all(handle is handles[0] for handle in handles)
+    assert manager.stats()['created'] == 1
+
+
+def test_key_already_holding_the_set_is_preferred(manager):
+    assert manager.preferred_key("docs", "gemini-1.5-flash", ["key-a", "key-b"]) is None
+    manager.handle("docs", "DOCUMENTS", "key-b", "gemini-1.5-flash")
+
+    assert manager.preferred_key("docs", "gemini-1.5-flash", ["key-a", "key-b"]) == "key-b"
+    assert manager.preferred_key("docs", "gemini-1.5-pro", ["key-a", "key-b"]) is None
+    assert manager.preferred_key("docs", "gemini-1.5-flash", ["key-a"]) is None
+
+
+def test_minimum_cache_size_follows_the_cached_model_version():
+    assert min_cache_tokens("gemini-1.5-flash") == 32768
+    assert min_cache_tokens("gemini-1.5-pro-002") == 32768
@@ -0,0 +1,59 @@
+import io
+from concurrent.futures import Future
+
+import pytest
+
+import pdf_extraction
+from ingestion import UploadBuffer
+from pdf_extraction import PdfExtractionEngine, assemble_text, split_page_ranges
+
+
+def test_split_page_ranges_covers_window_in_order():
+    ranges = split_page_ranges(3, 20, 4)
+    assert ranges[0][0] == 3 and ranges[-1][1] == 20
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert max(e - s for s, e in ranges) - min(e - s for s, e in ranges) <= 1
+
+
+def test_split_page_ranges_empty_window():
+    assert split_page_ranges(5, 5, 4) == []
+
+
+@pytest.mark.parametrize("start, end", [(0, 40), (5, 33)])
+def test_parallel_extraction_matches_serial(pdf_bytes, start, end):
+    serial = PdfExtractionEngine(workers=1).extract_pages(pdf_bytes, start, end)
+    parallel_engine = PdfExtractionEngine(workers=4, min_pages_per_worker=2)
+    assert len(parallel_engine.plan(start, end)) > 1
+
+    parallel = parallel_engine.extract_pages(pdf_bytes, start, end)
+
+    assert parallel == serial
+    assert assemble_text(parallel) == assemble_text(serial)
+
+
+def test_upload_buffer_source_matches_bytes(pdf_bytes, pdf_pages):
+    upload = UploadBuffer(io.BytesIO(pdf_bytes))
+    try:
+        pages = PdfExtractionEngine(workers=4, min_pages_per_worker=2).extract_pages(upload, 0, len(pdf_pages))
+    finally:
+        upload.close()
+
+    assert [page_num for page_num, _, _ in pages] == list(range(len(pdf_pages)))
+    assert all(error is None for _, _, error in pages)
+    assert [text.strip() for _, text, _ in pages] == pdf_pages
+
+
+class HungPool:
+    """Process pool whose workers never finish"""
+
+    def submit(self, fn, *args):
+        return Future()
+
+
+def test_hung_workers_fall_back_to_serial(monkeypatch, pdf_bytes, pdf_pages):
+    monkeypatch.setattr(pdf_extraction, '_get_pool', lambda workers: HungPool())
+    engine = PdfExtractionEngine(workers=4, min_pages_per_worker=2, timeout_seconds=0.2)
+
+    pages = engine.extract_pages(pdf_bytes, 0, len(pdf_pages))
+
+    assert pages == PdfExtractionEngine(workers=1).extract_pages(pdf_bytes, 0, len(pdf_pages))
@@ -0,0 +1,96 @@
+import sqlite3
+import multiprocessing
+
+from quota_ledger import QuotaLedger, api_key_id
+from rate_limiter import DailyQuotaExceeded, RateLimiter, model_limits
+
+PROCESSES = 4
+MODEL = 'gemini-1.5-pro'
+
+
+def _increment(path, times):
+    ledger = QuotaLedger(path)
+
+    def bump(state):
+        state['day_count'] += 1
+
+    for _ in range(times):
+        ledger.transact('key', MODEL, lambda: {'rpm': 1.0, 'tokens': 0.0, 'updated': 0.0, 'day': None,
+                                               'day_count': 0, 'throttled': 0}, bump)
+
+
+def _reserve_until_exhausted(path, results):
+    limiter = RateLimiter(ledger=QuotaLedger(path))
+    granted = 0
+    try:
+        while True:
+            limiter.reserve(MODEL, 'shared-key')
+            granted += 1
+    except DailyQuotaExceeded:
+        results.put(granted)
+
+
+def _run(target, *args):
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=target, args=args) for _ in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+
+def test_concurrent_processes_do_not_lose_updates(tmp_path):
+    path = str(tmp_path / "quota.sqlite3")
+    QuotaLedger(path)
+
+    _run(_increment, path, 50)
+
+    assert QuotaLedger(path).usage()[f"key/{MODEL}"]['day_count'] == PROCESSES * 50
+
+
+def test_processes_share_one_daily_quota(tmp_path):
+    path = str(tmp_path / "quota.sqlite3")
+    QuotaLedger(path)
+    results = multiprocessing.get_context('spawn').Queue()
+
+    _run(_reserve_until_exhausted, path, results)
+
+    granted = [results.get(timeout=10) for _ in range(PROCESSES)]
+    daily_limit = model_limits(MODEL)['rpd']
+    assert sum(granted) == daily_limit
+    assert QuotaLedger(path).usage()[f"{api_key_id('shared-key')}/{MODEL}"]['day_count'] == daily_limit
+
+
+def test_failed_update_still_records_changes(tmp_path):
+    ledger = QuotaLedger(str(tmp_path / "quota.sqlite3"))
+    initial = {'rpm': 10.0, 'tokens': 1.0, 'updated': 0.0, 'day': None, 'day_count': 0, 'throttled': 0}
+
+    def refill_then_reject(state):
+        state['tokens'] = 5.0
+        raise DailyQuotaExceeded("limit")
+
+    try:
+        ledger.transact('key', MODEL, lambda: dict(initial), refill_then_reject)
+    except DailyQuotaExceeded:
+        pass
+
+    assert ledger.usage()[f"key/{MODEL}"]['tokens'] == 5.0
+
+
+def test_headroom_and_stats_read_without_the_write_lock(tmp_path):
+    path = str(tmp_path / "quota.sqlite3")
+    limiter = RateLimiter(ledger=QuotaLedger(path))
+    limiter.reserve(MODEL, 'shared-key')
+    assert limiter.headroom(MODEL, 'unused-key')['remaining_today'] == model_limits(MODEL)['rpd']
+    assert f"{api_key_id('unused-key')}/{MODEL}" not in QuotaLedger(path).usage()
+
+    # Another process is mid-reservation; reads must not queue behind it
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        assert limiter.headroom(MODEL, 'shared-key')['remaining_today'] == model_limits(MODEL)['rpd'] - 1
+        assert limiter.stats(MODEL, 'shared-key')['requests_today'] == 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
@@ -0,0 +1,68 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, model_limits
+
+MODEL = 'gemini-1.5-flash'
+
+
+class ApiError(Exception):
+    pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def limiter():
+    return RateLimiter(burst=1, additive_increase_rpm=0.5, multiplicative_decrease=0.5, min_rpm=1.0)
+
+
+def test_429_halves_the_rate_and_drops_the_burst(clock, limiter):
+    max_rpm = model_limits(MODEL)['rpm']
+    assert limiter.reserve(MODEL, 'key') == 0.0
+
+    clock.now += 60
+    limiter.report(MODEL, ApiError("429 Resource has been exhausted"), api_key='key')
+
+    assert limiter.stats(MODEL, 'key')['rpm'] == max_rpm / 2
+    assert limiter.stats(MODEL, 'key')['throttled'] == 1
+    # The refilled token is gone, so the next request waits a full slot at the slower rate
+    assert limiter.reserve(MODEL, 'key') == pytest.approx(60.0 / (max_rpm / 2))
+
+
+def test_rate_never_drops_below_the_floor(clock, limiter):
+    for _ in range(20):
+        limiter.report_throttled(MODEL, 'key')
+    assert limiter.stats(MODEL, 'key')['rpm'] == 1.0
+
+
+def test_successes_recover_the_rate_additively_up_to_the_limit(clock, limiter):
+    max_rpm = model_limits(MODEL)['rpm']
+    limiter.report_throttled(MODEL, 'key')
+
+    limiter.report(MODEL, api_key='key')
+    assert limiter.stats(MODEL, 'key')['rpm'] == max_rpm / 2 + 0.5
+
+    for _ in range(100):
+        limiter.report(MODEL, api_key='key')
+    assert limiter.stats(MODEL, 'key')['rpm'] == max_rpm
+
+
+def test_rates_adapt_per_key(clock, limiter):
+    limiter.report_throttled(MODEL, 'key-a')
+    assert limiter.stats(MODEL, 'key-b')['rpm'] == model_limits(MODEL)['rpm']
+    assert limiter.headroom(MODEL, 'key-b')['wait'] == 0.0
+    assert limiter.headroom(MODEL, 'key-a')['wait'] > 0.0
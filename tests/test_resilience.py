@@ -0,0 +1,229 @@
+import pytest
+
+import key_pool
+import resilience
+from key_pool import ApiKeyPool
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientExecutor
+
+MODEL = "gemini-1.5-flash"
+
+
+class ApiError(Exception):
+    """Stand-in for a google.api_core error with an HTTP status"""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def unavailable():
+    return ApiError("503 The service is currently unavailable.", 503)
+
+
+def throttled():
+    return ApiError("429 Resource has been exhausted (e.g. check quota).", 429)
+
+
+def invalid_key():
+    return ApiError("400 API key not valid. Please pass a valid API key.", 400)
+
+
+class FakeClock:
+    """monotonic/time/sleep that only move when something sleeps"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeLimiter:
+    """Rate limiter with a fixed wait per key that records what it was asked"""
+
+    def __init__(self, waits=None):
+        self.waits = waits or {}
+        self.reserved = []
+        self.released = []
+        self.reports = []
+
+    def reserve(self, model_name, api_key):
+        self.reserved.append(api_key)
+        return self.waits.get(api_key, 0.0)
+
+    def try_reserve(self, model_name, api_key):
+        return False
+
+    def release(self, model_name, api_key):
+        self.released.append(api_key)
+
+    def headroom(self, model_name, api_key):
+        return {'wait': self.waits.get(api_key, 0.0), 'remaining_today': 100}
+
+    def report(self, model_name, error=None, api_key=None):
+        self.reports.append((api_key, error))
+
+
+class FakeClientPool:
+    def record(self, api_key, error=None):
+        pass
+
+    def health(self, api_key):
+        return {'state': 'healthy'}
+
+
+class FakeCall:
+    """Model call that raises the queued errors in turn, then answers"""
+
+    def __init__(self, *errors, fail_keys=()):
+        self.errors = list(errors)
+        self.fail_keys = fail_keys
+        self.keys = []
+
+    def __call__(self, timeout, api_key):
+        self.keys.append(api_key)
+        if api_key in self.fail_keys:
+            raise invalid_key()
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"answer via {api_key}"
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    monkeypatch.setattr(key_pool, '_quarantine', {})
+    return clock
+
+
+@pytest.fixture
+def limiter():
+    return FakeLimiter()
+
+
+def make_executor(limiter, keys=("key-a",), **breaker):
+    pool = ApiKeyPool(list(keys), MODEL, rate_limiter=limiter, client_pool=FakeClientPool())
+    executor = ResilientExecutor(MODEL, pool, rate_limiter=limiter)
+    executor.scheduler = None
+    executor.breaker = CircuitBreaker(MODEL, failure_threshold=breaker.get('threshold', 5), reset_seconds=30)
+    return executor
+
+
+def test_transient_errors_are_retried_with_backoff(clock, limiter):
+    executor = make_executor(limiter)
+    call = FakeCall(unavailable(), unavailable())
+
+    assert executor.run(call, wait=clock.sleep) == "answer via key-a"
+    assert len(call.keys) == 3
+    assert len(limiter.reserved) == 3   # every retry takes its own slot
+    assert len(clock.sleeps) == 2
+    assert executor.breaker.state == 'closed'
+
+
+def test_retries_stop_after_max_retries(clock, limiter):
+    executor = make_executor(limiter)
+    call = FakeCall(*[unavailable() for _ in range(10)])
+
+    with pytest.raises(ApiError):
+        executor.run(call, wait=clock.sleep)
+    assert len(call.keys) == executor.max_retries + 1
+
+
+def test_bad_request_is_not_retried(clock, limiter):
+    executor = make_executor(limiter)
+    call = FakeCall(ApiError("400 Request contains an invalid argument.", 400))
+
+    with pytest.raises(ApiError):
+        executor.run(call, wait=clock.sleep)
+    assert len(call.keys) == 1
+    assert clock.sleeps == []
+
+
+def test_slot_past_the_deadline_is_refunded(clock):
+    limiter = FakeLimiter(waits={"key-a": 500.0})
+    executor = make_executor(limiter)
+    call = FakeCall()
+
+    with pytest.raises(DeadlineExceeded):
+        executor.run(call, deadline_seconds=60, wait=clock.sleep)
+    assert call.keys == []
+    assert limiter.released == ["key-a"]
+
+
+def test_circuit_opens_and_half_open_trial_closes_it(clock, limiter):
+    executor = make_executor(limiter, threshold=2)
+    executor.max_retries = 0
+    for _ in range(2):
+        with pytest.raises(ApiError):
+            executor.run(FakeCall(unavailable()), wait=clock.sleep)
+    assert executor.breaker.state == 'open'
+
+    call = FakeCall()
+    with pytest.raises(CircuitOpenError):
+        executor.run(call, wait=clock.sleep)
+    assert call.keys == []
+
+    clock.now += 30
+    assert executor.breaker.state == 'half-open'
+    assert executor.run(call, wait=clock.sleep) == "answer via key-a"
+    assert executor.breaker.state == 'closed'
+
+
+def test_failed_half_open_trial_reopens_the_circuit(clock, limiter):
+    executor = make_executor(limiter, threshold=1)
+    executor.max_retries = 0
+    with pytest.raises(ApiError):
+        executor.run(FakeCall(unavailable()), wait=clock.sleep)
+
+    clock.now += 30
+    with pytest.raises(ApiError):
+        executor.run(FakeCall(unavailable()), wait=clock.sleep)
+    assert executor.breaker.state == 'open'
+
+
+def test_rejected_key_fails_over_without_backoff(clock, limiter):
+    executor = make_executor(limiter, keys=("key-a", "key-b"))
+    call = FakeCall(fail_keys=("key-a",))
+
+    assert executor.run(call, wait=clock.sleep) == "answer via key-b"
+    assert call.keys == ["key-a", "key-b"]
+    assert clock.sleeps == []
+    assert executor.key_pool.quarantined("key-a")
+    assert executor.breaker.failures == 0
+
+
+def test_every_key_rejected_raises_the_auth_error(clock, limiter):
+    executor = make_executor(limiter, keys=("key-a", "key-b"))
+    call = FakeCall(fail_keys=("key-a", "key-b"))
+
+    with pytest.raises(ApiError, match="API key not valid"):
+        executor.run(call, wait=clock.sleep)
+    assert call.keys == ["key-a", "key-b"]
+
+
+def test_single_key_429_is_retried_after_backoff(clock, limiter):
+    executor = make_executor(limiter)
+    call = FakeCall(throttled())
+
+    assert executor.run(call, wait=clock.sleep) == "answer via key-a"
+    assert call.keys == ["key-a", "key-a"]
+    assert len(clock.sleeps) == 1
+    assert not executor.key_pool.quarantined("key-a")
+
+
+def test_429_fails_over_while_another_key_is_usable(clock, limiter):
+    executor = make_executor(limiter, keys=("key-a", "key-b"))
+    call = FakeCall(throttled())
+
+    assert executor.run(call, wait=clock.sleep) == "answer via key-b"
+    assert clock.sleeps == []
+    assert executor.key_pool.quarantined("key-a")['reason'] == "rate limited"
@@ -0,0 +1,123 @@
+import google.ai.generativelanguage as glm
+import pytest
+
+from config import Config
+from embeddings import GeminiEmbedder, HashingEmbedder
+from key_pool import ApiKeyPool
+from model_clients import KeyBoundModel
+from rate_limiter import RateLimiter
+from resilience import ResilientExecutor
+from retrieval import DocumentRetriever, reciprocal_rank_fusion, tokenize
+
+REPORT = (
+    "\n\n=== PAGE 1 ===\nThe turbine maintenance schedule requires inspection every 400 hours. "
+    "Clause 4.2.1 covers blade replacement.\n\n=== PAGE 2 ===\n"
+    "Quarterly revenue grew because of the new service contracts signed in Europe."
+)
+MANUAL = "\n\n=== PAGE 1 ===\nPart AX-77 is the coolant pump. Replace the seal kit when pressure drops."
+
+
+class FailingEmbedder(HashingEmbedder):
+    """Offline embedder whose second batch call fails"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls == 2:
+            raise RuntimeError("embedding service unavailable")
+        return super().embed_documents(texts)
+
+
+class FakeEmbeddingClient:
+    """generativelanguage client that embeds each text as (length, 1, 0, ...)"""
+
+    def __init__(self):
+        self.requests = []
+
+    def batch_embed_contents(self, request, timeout=None):
+        self.requests.append(request)
+        return glm.BatchEmbedContentsResponse(embeddings=[
+            glm.ContentEmbedding(values=[float(len(r.content.parts[0].text)), 1.0] + [0.0] * 766)
+            for r in request.requests
+        ])
+
+
+class FakeClientPool:
+    def __init__(self):
+        self.clients = {}
+
+    def get_model(self, api_key, model_name):
+        return KeyBoundModel(model_name, self.clients.setdefault(api_key, FakeEmbeddingClient()))
+
+    def record(self, api_key, error=None):
+        pass
+
+    def health(self, api_key):
+        return {'state': 'healthy'}
+
+
+def test_tokenize_keeps_compound_terms():
+    assert tokenize("See clause 4.2.1 and AX-77") == ["see", "clause", "4.2.1", "4", "2", "1", "and", "ax-77", "ax", "77"]
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [2, 3, 1]], k=60)
+    assert fused[0][0] == 2
+
+
+def test_offline_search_across_documents():
+    retriever = DocumentRetriever(HashingEmbedder())
+    assert retriever.index_document("report", "report.pdf", REPORT) > 0
+    assert retriever.index_document("manual", "manual.pdf", MANUAL) > 0
+
+    results = retriever.search("which part is the coolant pump", k=2)
+    assert results[0]['doc_id'] == "manual"
+    assert results[0]['doc_name'] == "manual.pdf"
+
+    results = retriever.search("clause 4.2.1", k=1, doc_ids=["report"])
+    assert results[0]['page_start'] == 1
+    assert results[0]['bm25_score'] > 0
+
+
+def test_indexing_twice_adds_nothing():
+    retriever = DocumentRetriever(HashingEmbedder())
+    count = retriever.index_document("report", "report.pdf", REPORT)
+    assert retriever.index_document("report", "report.pdf", REPORT) == count
+    assert len(retriever.chunks) == len(retriever.index) == len(retriever.lexical) == count
+
+
+def test_failed_embedding_leaves_index_unchanged(monkeypatch):
+    monkeypatch.setitem(Config.RETRIEVAL_CONFIG, 'embedding_batch_size', 1)
+    embedder = FailingEmbedder()
+    retriever = DocumentRetriever(embedder)
+
+    text = "".join(f"\n\n=== PAGE {n} ===\n" + REPORT.split("===\n", 1)[1] * 20 for n in range(1, 6))
+
+    with pytest.raises(RuntimeError):
+        retriever.index_document("report", "report.pdf", text)
+    assert not retriever.has_document("report")
+    assert len(retriever.chunks) == len(retriever.index) == len(retriever.lexical) == 0
+
+    count = retriever.index_document("report", "report.pdf", text)
+    assert count > 1
+    assert len(retriever.chunks) == len(retriever.index) == len(retriever.lexical) == count
+
+
+def test_gemini_embedder_batches_through_the_key_pool():
+    embedder = GeminiEmbedder(["key-a"], batch_size=2)
+    limiter = RateLimiter()
+    clients = FakeClientPool()
+    embedder.key_pool = ApiKeyPool(["key-a"], embedder.model, rate_limiter=limiter, client_pool=clients)
+    embedder.executor = ResilientExecutor(embedder.model, embedder.key_pool, rate_limiter=limiter)
+    embedder.executor.scheduler = None
+
+    vectors = embedder.embed_documents(["one", "three", "seven"])
+
+    requests = clients.clients["key-a"].requests
+    assert [len(r.requests) for r in requests] == [2, 1]
+    assert requests[0].requests[0].task_type == glm.TaskType.RETRIEVAL_DOCUMENT
+    assert vectors.shape == (3, embedder.dimension)
+    assert limiter.stats(embedder.model, "key-a")['requests_today'] == 2
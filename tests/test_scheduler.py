@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PriorityScheduler
+
+
+class Capacity:
+    """Quota that stays exhausted until `open` is called"""
+
+    def __init__(self):
+        self.free = threading.Event()
+        self.claimed = []
+
+    def wait(self):
+        return 0.0 if self.free.is_set() else 0.05
+
+    def claim(self, name):
+        self.claimed.append(name)
+        return name
+
+
+def start(scheduler, capacity, priority, lane='lane', name=None, timeout=5.0):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(scheduler.run_in_turn(
+        priority, capacity.wait, lambda: capacity.claim(name or priority), timeout=timeout, lane=lane
+    )))
+    thread.start()
+    return thread, results
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def scheduler():
+    return PriorityScheduler(aging_seconds=1000, poll_seconds=0.01)
+
+
+def test_interactive_request_overtakes_queued_background_work(scheduler):
+    capacity = Capacity()
+    background, _ = start(scheduler, capacity, PRIORITY_BACKGROUND)
+    wait_for(lambda: scheduler.waiting('lane') == 1)
+    interactive, _ = start(scheduler, capacity, PRIORITY_INTERACTIVE)
+    wait_for(lambda: scheduler.waiting('lane') == 2)
+
+    capacity.free.set()
+    background.join(5)
+    interactive.join(5)
+
+    assert capacity.claimed == [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND]
+
+
+def test_waiting_requests_age_past_newer_higher_priority_ones():
+    scheduler = PriorityScheduler(aging_seconds=0.05, poll_seconds=0.01)
+    capacity = Capacity()
+    background, _ = start(scheduler, capacity, PRIORITY_BACKGROUND)
+    wait_for(lambda: scheduler.waiting('lane') == 1)
+    time.sleep(0.3)
+    interactive, _ = start(scheduler, capacity, PRIORITY_INTERACTIVE)
+    wait_for(lambda: scheduler.waiting('lane') == 2)
+
+    capacity.free.set()
+    background.join(5)
+    interactive.join(5)
+
+    assert capacity.claimed == [PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE]
+
+
+def test_throttled_lane_does_not_hold_up_other_lanes(scheduler):
+    throttled = Capacity()
+    blocked, blocked_result = start(scheduler, throttled, PRIORITY_INTERACTIVE, lane='pro')
+    wait_for(lambda: scheduler.waiting('pro') == 1)
+
+    other = Capacity()
+    other.free.set()
+    assert scheduler.run_in_turn(PRIORITY_BACKGROUND, other.wait, lambda: other.claim('flash'),
+                                 timeout=1.0, lane='flash') == 'flash'
+    assert scheduler.waiting('pro') == 1
+
+    throttled.free.set()
+    blocked.join(5)
+    assert blocked_result == [PRIORITY_INTERACTIVE]
+
+
+def test_request_gives_up_when_quota_never_frees(scheduler):
+    capacity = Capacity()
+    assert scheduler.run_in_turn(PRIORITY_INTERACTIVE, capacity.wait, lambda: capacity.claim('x'),
+                                 timeout=0.1, lane='lane') is None
+    assert capacity.claimed == []
+    assert scheduler.waiting() == 0
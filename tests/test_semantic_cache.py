@@ -0,0 +1,43 @@
+import pytest
+
+from embeddings import HashingEmbedder
+from semantic_cache import SemanticCache, document_set_key, normalize_question
+
+
+@pytest.fixture
+def cache():
+    cache = SemanticCache(HashingEmbedder())
+    cache.bind(document_set_key(["report"]))
+    cache.store("When did the project start?", "March 2021")
+    cache.store("Who is the author?", "Dana Smith")
+    return cache
+
+
+def test_rephrased_question_hits(cache):
+    entry = cache.lookup("when did the project start")
+    assert entry is not None and entry['answer'] == "March 2021"
+
+
+@pytest.mark.parametrize("question", [
+    "Why did the project start?",
+    "Where did the project start?",
+    "How did the project start?",
+    "Where is the author from?",
+])
+def test_different_question_word_misses(cache, question):
+    assert cache.lookup(question) is None
+
+
+def test_normalized_question_keeps_question_words():
+    assert normalize_question("When did the project start?") != normalize_question("Why did the project start?")
+
+
+def test_different_numbers_miss(cache):
+    cache.store("What does clause 4.2 require?", "Annual inspections")
+    assert cache.lookup("What does clause 4.3 require?") is None
+
+
+def test_binding_another_document_set_drops_entries(cache):
+    cache.bind(document_set_key(["manual"]))
+    assert cache.lookup("When did the project start?") is None
+    assert cache.stats()['invalidations'] == 1
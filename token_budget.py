@@ -0,0 +1,176 @@
+"""
+Token estimation and request budgeting for SmartDoc AI Agent
+A fast local token estimator, calibrated against the model's own tokenizer,
+and a budgeter that splits each request's tokens between instructions,
+history and document text before anything is sent
+"""
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config import Config
+from chunking import CHARS_PER_TOKEN
+
+_CJK = '぀-ヿ㐀-鿿가-힯'   # kana, CJK ideographs, hangul
+
+_WORD = re.compile(rf'[^\W\d_{_CJK}]+')
+_DIGIT = re.compile(r'\d')
+_SYMBOL = re.compile(r'[^\w\s]')
+_CJK_CHAR = re.compile(rf'[{_CJK}]')
+
+# Default tokens per feature: words, extra pieces of long words, digits, symbols, CJK characters
+_DEFAULT_WEIGHTS = np.array([1.2, 1.0, 0.5, 1.0, 1.0])
+
+
+def _features(text: str) -> List[int]:
+    words = _WORD.findall(text)
+    return [
+        len(words),
+        # A long word splits into about one more piece per four letters past the eighth
+        sum((len(word) - 5) // 4 for word in words if len(word) > 8),
+        len(_DIGIT.findall(text)),
+        len(_SYMBOL.findall(text)),
+        len(_CJK_CHAR.findall(text))
+    ]
+
+
+class TokenEstimator:
+    """Local token counts from word, digit, punctuation and CJK counts
+
+    Works without the network and costs a few regex passes per text.
+    `estimate_many` scores a batch of texts with one matrix product.
+    `calibrate` scales the estimates to match the model's tokenizer on
+    sample texts, and learns the characters per token used to turn token
+    budgets back into character budgets.
+    """
+
+    def __init__(self):
+        self.weights = _DEFAULT_WEIGHTS.copy()
+        self.chars_per_token = float(CHARS_PER_TOKEN)
+        self.calibrated = False
+        self._lock = threading.Lock()
+
+    def estimate_many(self, texts: Iterable[str]) -> List[int]:
+        texts = list(texts)
+        if not texts:
+            return []
+        matrix = np.array([_features(text) for text in texts], dtype=float)
+        return [max(1, int(round(tokens))) for tokens in matrix @ self.weights]
+
+    def estimate(self, text: str) -> int:
+        return self.estimate_many([text])[0] if text else 0
+
+    def chars_for(self, tokens: int) -> int:
+        """Characters of typical text that make up `tokens` tokens"""
+        return max(0, int(tokens * self.chars_per_token))
+
+    def calibrate(self, texts: List[str], true_counts: List[int]) -> float:
+        """Scale estimates to the model's counts for the same texts; returns the scale applied"""
+        texts = [text for text in texts if text]
+        estimated = sum(self.estimate_many(texts))
+        actual = sum(true_counts)
+        if not texts or estimated <= 0 or actual <= 0:
+            return 1.0
+
+        scale = min(2.0, max(0.5, actual / estimated))
+        with self._lock:
+            self.weights = self.weights * scale
+            self.chars_per_token = sum(len(text) for text in texts) / actual
+            self.calibrated = True
+        return scale
+
+
+def calibrate_with_model(estimator: TokenEstimator, count_tokens: Callable[[str], int], texts: List[str]) -> bool:
+    """Calibrate once from sample texts using the model's count_tokens; False if it failed"""
+    samples = [text for text in texts if text.strip()][:Config.TOKEN_BUDGET['calibration_samples']]
+    if estimator.calibrated or not samples:
+        return estimator.calibrated
+    try:
+        true_counts = [count_tokens(text) for text in samples]
+    except Exception:
+        # Estimates stay on the defaults; requests still work
+        return False
+    estimator.calibrate(samples, true_counts)
+    return True
+
+
+class ContextBudgeter:
+    """Split a request's token budget between instructions, history and documents
+
+    The input limit is the model's context window less the tokens reserved
+    for the answer, capped by `max_input_tokens` (the free-tier request
+    size). History gets at most `history_share` of it; the document gets
+    the rest.
+    """
+
+    def __init__(self, model_name: str = None, estimator: TokenEstimator = None):
+        settings = Config.TOKEN_BUDGET
+        self.model_name = model_name or Config.GEMINI_MODEL
+        self.estimator = estimator or get_token_estimator()
+        self.output_tokens = settings['output_tokens']
+        self.max_input_tokens = settings['max_input_tokens']
+        self.history_share = settings['history_share']
+
+    def input_limit(self, model_name: str = None, max_input_tokens: int = None) -> int:
+        window = Config.get_model_config(model_name or self.model_name)['context_window']
+        return max(0, min(window - self.output_tokens, max_input_tokens or self.max_input_tokens))
+
+    def plan(self, instructions: str = "", history: str = "", max_input_tokens: int = None,
+             instruction_tokens: int = None) -> Dict[str, Any]:
+        """Token (and character) allowance of each part of one request
+
+        `instruction_tokens` reserves a fixed amount for instructions instead of estimating `instructions`.
+        """
+        limit = self.input_limit(max_input_tokens=max_input_tokens)
+        if instruction_tokens is None:
+            instruction_tokens = self.estimator.estimate(instructions)
+        history_tokens = min(self.estimator.estimate(history), int(limit * self.history_share))
+        document_tokens = max(0, limit - instruction_tokens - history_tokens)
+        return {
+            'input_limit': limit,
+            'output_tokens': self.output_tokens,
+            'instruction_tokens': instruction_tokens,
+            'history_tokens': history_tokens,
+            'document_tokens': document_tokens,
+            'document_chars': self.estimator.chars_for(document_tokens)
+        }
+
+    def fit_history(self, turns: List[str], max_input_tokens: int = None) -> str:
+        """Most recent turns that fit the history share of a request, oldest first"""
+        allowance = int(self.input_limit(max_input_tokens=max_input_tokens) * self.history_share)
+        kept = []
+        for turn, tokens in zip(reversed(turns), reversed(self.estimator.estimate_many(turns))):
+            if tokens > allowance:
+                break
+            allowance -= tokens
+            kept.append(turn)
+        return "\n\n".join(reversed(kept))
+
+    def select_model(self, input_tokens: int) -> Optional[str]:
+        """This budgeter's model if the input fits its window, else the smallest free-tier model that fits"""
+        def fits(name):
+            return input_tokens + self.output_tokens <= Config.get_model_config(name)['context_window']
+
+        if fits(self.model_name):
+            return self.model_name
+        candidates = sorted(
+            (config['context_window'], name) for name, config in Config.AVAILABLE_MODELS.items()
+            if config.get('free_tier') and fits(name)
+        )
+        return candidates[0][1] if candidates else None
+
+
+_shared_estimator = None
+_shared_lock = threading.Lock()
+
+
+def get_token_estimator() -> TokenEstimator:
+    """Process-wide estimator, calibrated by the first documents processed"""
+    global _shared_estimator
+
+    with _shared_lock:
+        if _shared_estimator is None:
+            _shared_estimator = TokenEstimator()
+        return _shared_estimator
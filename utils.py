@@ -6,11 +6,12 @@ import streamlit as st
 import os
 import tempfile
 import hashlib
-import time
 from typing import List, Optional, Tuple, Dict, Any
 import PyPDF2
 from datetime import datetime
 
+from rate_limiter import get_rate_limiter
+
 def validate_pdf_file(uploaded_file) -> Tuple[bool, str]:
     """Validate uploaded PDF file"""
     if not uploaded_file:
@@ -31,8 +32,12 @@ def create_temp_file(uploaded_file, suffix=".pdf") -> str:
     """Create temporary file from uploaded file"""
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-            uploaded_file.seek(0)
-            tmp_file.write(uploaded_file.read())
+            if hasattr(uploaded_file, 'getbuffer'):
+                # Write from the upload's own buffer instead of copying it first
+                tmp_file.write(uploaded_file.getbuffer())
+            else:
+                uploaded_file.seek(0)
+                tmp_file.write(uploaded_file.read())
             return tmp_file.name
     except Exception as e:
         raise Exception(f"Failed to create temp file: {str(e)}")
@@ -138,20 +143,13 @@ class SessionStateManager:
 
 # Rate limiting
 class RateLimiter:
-    """Rate limiter for API calls"""
+    """Rate limiter for API calls (delegates to the process-wide limiter)"""
 
-    def __init__(self, rpm: int = 10):
-        self.rpm = rpm
-        self.interval = 60.0 / rpm
-        self.last_request = 0
+    def __init__(self, model_name: str = None, api_key: str = None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.limiter = get_rate_limiter()
 
     def wait_if_needed(self):
         """Wait if necessary for rate limiting"""
-        current = time.time()
-        elapsed = current - self.last_request
-
-        if elapsed < self.interval:
-            wait_time = self.interval - elapsed
-            time.sleep(wait_time)
-
-        self.last_request = time.time()
+        self.limiter.acquire(self.model_name, self.api_key)